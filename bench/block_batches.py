@@ -0,0 +1,75 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare uploading the missing blocks of a file one block per POST and in
+batches, to a container of small blocks on a local stand-in Pithos server
+that waits before each response, like a high-latency link
+
+Usage: python bench/block_batches.py [MB] [block KB] [ms]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import TemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(mbytes=64, block_kbytes=64, latency=20):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = block_kbytes * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    f = TemporaryFile()
+    f.write(urandom(mbytes * 1024 * 1024))
+    f.flush()
+    print('%s MB, %s KB blocks, %s ms per request' % (
+        mbytes, block_kbytes, latency))
+    print('mode      batch (KB)  requests  seconds')
+    for pipeline in (False, True):
+        for batch in (0, PithosClient.BLOCK_BATCH_SIZE):
+            client.UPLOAD_PIPELINE, client.BLOCK_BATCH_SIZE = pipeline, batch
+            server.blocks.clear()
+            server.objects.clear()
+            server.requests, started = 0, time()
+            f.seek(0)
+            client.upload_object('object', f)
+            print('%-8s  %10s  %8s  %7.3f' % (
+                'pipeline' if pipeline else 'phases', batch / 1024,
+                server.requests, time() - started))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,126 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare ways to read upload blocks: the old readall, which appended each
+read to a string, the current readall, which joins the reads once, and
+readinto a pooled buffer. Sources are a regular file and a source of short
+reads, like a pipe. Then, upload a file to a local stand-in Pithos server.
+
+Usage: python bench/block_buffers.py [MB] [block MB] [short read KB]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import TemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.utils import readall, readinto
+from kamaki.clients.utils.buffers import get_pool
+from standin import StandinPithos
+
+
+def concat_readall(openfile, size, retries=7):
+    """readall as it was, before it joined the reads"""
+    remains = size if size > 0 else 0
+    buf = ''
+    for i in range(retries):
+        tmp_buf = openfile.read(remains)
+        if tmp_buf:
+            buf += tmp_buf
+            remains -= len(tmp_buf)
+            if remains > 0:
+                continue
+        return buf
+    raise IOError('Failed to read %s bytes from file' % size)
+
+
+class ShortReads(object):
+    """Return at most chunk bytes per read"""
+
+    def __init__(self, fileobj, chunk):
+        self.fileobj, self.chunk = fileobj, chunk
+
+    def read(self, size):
+        return self.fileobj.read(min(size, self.chunk))
+
+
+def read_blocks(method, source, blocksize, nblocks, retries):
+    pool = get_pool(blocksize)
+    for i in range(nblocks):
+        if method == 'readinto':
+            buf = pool.get()
+            readinto(source, buf, blocksize, retries)
+            pool.put(buf)
+        else:
+            reader = concat_readall if method == 'concat' else readall
+            reader(source, blocksize, retries)
+
+
+def main(mbytes=64, block_mbytes=4, chunk_kbytes=16):
+    blocksize = block_mbytes * 1024 * 1024
+    nblocks = mbytes // block_mbytes
+    f = TemporaryFile()
+    f.write(urandom(mbytes * 1024 * 1024))
+    f.flush()
+    print('%s MB in %s MB blocks, short reads of %s KB' % (
+        mbytes, block_mbytes, chunk_kbytes))
+    retries = blocksize // (chunk_kbytes * 1024) + 2
+    print('source       method    seconds')
+    for name in ('file', 'short reads'):
+        for method in ('concat', 'readall', 'readinto'):
+            f.seek(0)
+            source = f if name == 'file' else ShortReads(
+                f, chunk_kbytes * 1024)
+            started = time()
+            read_blocks(method, source, blocksize, nblocks, retries)
+            print('%-11s  %-8s  %7.3f' % (name, method, time() - started))
+
+    server = StandinPithos()
+    server.block_size = blocksize
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    print('upload    seconds')
+    for pipeline in (False, True):
+        client.UPLOAD_PIPELINE = pipeline
+        server.blocks.clear()
+        server.objects.clear()
+        f.seek(0)
+        started = time()
+        client.upload_object('object', f)
+        print('%-8s  %7.3f' % (
+            'pipeline' if pipeline else 'phases', time() - started))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
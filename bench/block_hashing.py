@@ -0,0 +1,89 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare the serial block hashing of kamaki 0.13 with the parallel block
+hasher used for uploads, on a temporary file of random and zero blocks
+
+Usage: python bench/block_hashing.py [MB] [workers]
+"""
+
+from hashlib import new as newhashlib
+from multiprocessing import cpu_count
+from os import urandom
+from sys import argv
+from tempfile import NamedTemporaryFile
+from time import time
+
+from kamaki.clients.pithos.hashing import BlockHasher
+from kamaki.clients.utils import readall
+
+BLOCKSIZE = 4 * 1024 * 1024
+
+
+def serial(f, size):
+    offset, hashes = 0, []
+    while offset < size:
+        block = readall(f, min(BLOCKSIZE, size - offset))
+        hashes.append(newhashlib('sha256', block.rstrip('\x00')).hexdigest())
+        offset += len(block)
+    return hashes
+
+
+def main(mbytes=256, workers=None):
+    size = mbytes * 1024 * 1024
+    with NamedTemporaryFile() as f:
+        chunk = urandom(BLOCKSIZE)
+        for i in range(0, size, BLOCKSIZE):
+            f.write(chunk if i % (4 * BLOCKSIZE) else '\x00' * BLOCKSIZE)
+        f.flush()
+        print('%s MB, %s CPUs' % (mbytes, cpu_count()))
+        print('method             seconds    MB/s')
+        f.seek(0)
+        started = time()
+        expected = serial(f, size)
+        took = time() - started
+        print('serial             %7.3f  %6.1f' % (took, mbytes / took))
+        for name, processes in (('threads', False), ('processes', True)):
+            hasher = BlockHasher(BLOCKSIZE, 'sha256', workers, processes)
+            f.seek(0)
+            started = time()
+            hashes = [h for h, o, b in hasher.iter_hashes(f, size)]
+            took = time() - started
+            assert hashes == expected
+            print('%-9s x %-4s   %7.3f  %6.1f' % (
+                name, hasher.workers, took, mbytes / took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:3]])
@@ -0,0 +1,67 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare bytes on the wire and wall time of container listings, with and
+without compressed responses, against a local stand-in Pithos server
+
+Usage: python bench/compressed_listings.py [repetitions] [Mbit/s]
+
+If Mbit/s is set, the server simulates a link of that bandwidth
+"""
+
+from sys import argv
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(repetitions=3, mbits=None):
+    server = StandinPithos(mbits * 1e6 / 8 if mbits else None)
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    print('entries  compressed  bytes on the wire  seconds per listing')
+    for size in (1000, 10000, 100000):
+        server.add_listing('container', size)
+        for compressed in (False, True):
+            client.ACCEPT_COMPRESSION = compressed
+            server.bytes_out, started = 0, time()
+            for i in range(repetitions):
+                assert len(client.container_get().json) == size
+            print('%7s  %10s  %17s  %.3f' % (
+                size, compressed, server.bytes_out / repetitions,
+                (time() - started) / repetitions))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:3]])
@@ -0,0 +1,100 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Download an object to a slow local disk, from a local stand-in Pithos
+server that waits before each response, like a high-latency link. Blocks are
+written on a writer stage while the next ones are downloaded, and at most
+PithosClient.DOWNLOAD_BUFFER bytes are downloaded ahead of the writes, so
+the peak of blocks held in memory does not grow with the number of parallel
+requests.
+
+Usage: python bench/download_buffer.py [MB] [ms] [ms per MB written]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import TemporaryFile, NamedTemporaryFile
+from threading import Lock
+from time import sleep, time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+class SlowDisk(object):
+    """A local file that takes delay seconds per MB written"""
+
+    def __init__(self, server, delay):
+        self.file, self.server = NamedTemporaryFile(), server
+        self.delay = delay
+        self.lock, self.writes, self.peak = Lock(), 0, 0
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def write(self, data):
+        with self.lock:
+            self.peak = max(self.peak, self.server.requests - self.writes)
+        sleep(self.delay * len(data) / 1024.0 / 1024)
+        self.file.write(data)
+        with self.lock:
+            self.writes += 1
+
+
+def main(size=128, latency=20, delay=10):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = bs = 1024 * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MIN_THREADS = client.MAX_THREADS = 32
+    src = TemporaryFile()
+    data = urandom(size * bs)
+    src.write(data)
+    src.seek(0)
+    client.upload_object('obj', src)
+    print('%s MB of 1 MB blocks, %s ms, %s ms per MB written, 32 threads' % (
+        size, latency, delay))
+    print('buffer (MB)  time (s)  MB/s  peak MB in memory')
+    for buffer_size in (4, 16, 64):
+        client.DOWNLOAD_BUFFER = buffer_size * bs
+        disk = SlowDisk(server, delay / 1000.0)
+        server.requests, started = 0, time()
+        client.download_object('obj', disk)
+        took = time() - started
+        disk.file.seek(0)
+        assert disk.file.read() == data
+        print('%11s  %8.3f  %4.0f  %17s' % (
+            buffer_size, took, size / took, disk.peak))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,83 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare uploading and downloading an object of many small blocks on worker
+threads and on the event loop transport, against a local stand-in Pithos
+server that waits before each response, like a high-latency link
+
+Usage: python bench/event_transport.py [blocks] [requests in flight] [ms]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import TemporaryFile
+from threading import active_count
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.utils import eventloop, workers
+from standin import StandinPithos
+
+
+def main(blocks=2000, in_flight=200, latency=50):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = 64 * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MIN_THREADS = client.MAX_THREADS = in_flight
+    src, dst = TemporaryFile(), TemporaryFile()
+    src.write(urandom(blocks * server.block_size))
+    src.flush()
+    print('transport  upload (s)  download (s)  client threads')
+    for transport in (eventloop.get_loop(), None):
+        client.transport = transport
+        threads = active_count()
+        started = time()
+        src.seek(0)
+        client.upload_object('object', src)
+        uploaded = time()
+        dst.seek(0)
+        client.download_object('object', dst)
+        downloaded = time()
+        print('%9s  %10.2f  %12.2f  %14s' % (
+            'eventloop' if transport else 'threads', uploaded - started,
+            downloaded - uploaded, workers.get_pool().workers + (
+                1 if transport else 0)))
+        server.blocks.clear()
+        src.seek(0)
+        dst.seek(0)
+        assert src.read() == dst.read(blocks * server.block_size)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,83 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare re-uploading an unmodified file with and without the block hash
+index, against a local stand-in Pithos server which already has its blocks
+
+Usage: python bench/hash_index.py [MB]
+"""
+
+from os import close, remove, urandom, utime
+from sys import argv
+from tempfile import NamedTemporaryFile, mkstemp
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.pithos.hashindex import HashIndex
+from standin import StandinPithos
+
+
+def main(mbytes=512):
+    server = StandinPithos()
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    fd, filename = mkstemp(suffix='.db')
+    close(fd)
+    print('%s MB, %s blocks' % (mbytes, mbytes * 1024 * 1024 / (
+        server.block_size)))
+    print('upload      index  seconds')
+    try:
+        with NamedTemporaryFile() as f:
+            chunk = urandom(1024 * 1024)
+            for i in range(mbytes):
+                f.write(chunk[i:] + chunk[:i])
+            f.flush()
+            utime(f.name, (time() - 60, time() - 60))
+            for upload, index in (
+                    ('first', False), ('again', False),
+                    ('first', True), ('again', True)):
+                client.hash_index = HashIndex(filename) if index else None
+                if upload == 'first':
+                    server.blocks.clear()
+                    if index:
+                        client.hash_index.clear()
+                f.seek(0)
+                started = time()
+                client.upload_object('object', f)
+                print('%-10s  %5s  %7.3f' % (upload, index, time() - started))
+    finally:
+        remove(filename)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:2]])
@@ -0,0 +1,76 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare bytes on the wire and wall time of repeated container listings,
+with and without the conditional-GET http cache, against a local stand-in
+Pithos server
+
+Usage: python bench/http_cache.py [repetitions] [Mbit/s]
+
+If Mbit/s is set, the server simulates a link of that bandwidth
+"""
+
+from os import close, remove
+from sys import argv
+from tempfile import mkstemp
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.utils.httpcache import HTTPCache
+from standin import StandinPithos
+
+
+def main(repetitions=5, mbits=None):
+    server = StandinPithos(mbits * 1e6 / 8 if mbits else None)
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    fd, filename = mkstemp(suffix='.db')
+    close(fd)
+    print('entries  cached  bytes on the wire  seconds per listing')
+    try:
+        for size in (1000, 10000, 100000):
+            server.add_listing('container', size)
+            for cached in (False, True):
+                client.http_cache = HTTPCache(filename) if cached else None
+                server.bytes_out, started = 0, time()
+                for i in range(repetitions):
+                    assert len(client.container_get().json) == size
+                print('%7s  %6s  %17s  %.3f' % (
+                    size, cached, server.bytes_out / repetitions,
+                    (time() - started) / repetitions))
+    finally:
+        remove(filename)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:3]])
@@ -0,0 +1,88 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Download an object of small blocks from a local stand-in Pithos server
+that waits before each response, like a high-latency link: a block per GET,
+or as many blocks per GET as planned from the observed latency (up to
+PithosClient.GET_BATCH_SIZE bytes). Resumed downloads fetch every other
+block, with multipart/byteranges replies.
+
+Usage: python bench/multirange_download.py [MB] [KB per block] [ms] [threads]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import NamedTemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(size=32, block_size=64, latency=20, threads=5):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = bs = block_size * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MAX_THREADS = threads
+    data = urandom(size * 1024 * 1024)
+    src = NamedTemporaryFile()
+    src.write(data)
+    src.seek(0)
+    client.upload_object('obj', src)
+    print('%s MB of %s KB blocks, %s ms, %s threads' % (
+        size, block_size, latency, threads))
+    print('download  GET batch (KB)  time (s)  requests  MB/s')
+    batch_sizes = (0, client.GET_BATCH_SIZE)
+    for mode in ('file', 'resume', 'string'):
+        for batch_size in batch_sizes:
+            client.GET_BATCH_SIZE = batch_size
+            local = NamedTemporaryFile()
+            if mode == 'resume':
+                for i in range(0, len(data), 2 * bs):
+                    local.write(data[i:i + bs] + '\x01' * bs)
+                local.flush()
+            server.requests, started = 0, time()
+            if mode == 'string':
+                assert client.download_to_string('obj') == data
+            else:
+                client.download_object('obj', local, resume=True)
+                local.seek(0)
+                assert local.read() == data
+            took = time() - started
+            print('%-8s  %14s  %8.3f  %8s  %4.0f' % (
+                mode, batch_size // 1024, took, server.requests,
+                size / took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:5]])
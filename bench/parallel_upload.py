@@ -0,0 +1,92 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Upload a tree of many small files and a few large ones, one file at a
+time and with PithosClient.upload_objects, to a local stand-in Pithos
+server that waits before each response, like a high-latency link. The
+remote directories are created one by one and with create_directories.
+
+Usage: python bench/parallel_upload.py [small files] [large files] [ms]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import TemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(nsmall=500, nlarge=2, latency=20):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = 1024 * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MAX_THREADS = 16
+    files = []
+    for i in range(nsmall + nlarge):
+        f = TemporaryFile()
+        f.write(urandom(16 * 1024 if i < nsmall else 32 * 1024 * 1024))
+        f.flush()
+        files.append((f, 'dir%s/file%s' % (i % 50, i)))
+    dirs = ['dir%s' % i for i in range(50)]
+    print('%s files of 16 KB, %s of 32 MB, %s directories, %s ms' % (
+        nsmall, nlarge, len(dirs), latency))
+    print('mode      directories (s)  files (s)  requests')
+    for parallel in (False, True):
+        server.blocks.clear()
+        server.objects.clear()
+        server.requests, started = 0, time()
+        if parallel:
+            client.create_directories(dirs)
+        else:
+            for d in dirs:
+                client.create_directory(d)
+        created = time()
+        if parallel:
+            for f, obj in files:
+                f.seek(0)
+            for f, obj, r in client.upload_objects(
+                    (f, obj, dict()) for f, obj in files):
+                assert not isinstance(r, Exception), r
+        else:
+            for f, obj in files:
+                f.seek(0)
+                client.upload_object(obj, f)
+        print('%-8s  %15.3f  %9.3f  %8s' % (
+            'parallel' if parallel else 'serial', created - started,
+            time() - created, server.requests))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,109 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Measure the per-request time of Client.request with HTTP logging disabled,
+enabled and enabled with data, against a local HTTP server
+
+Usage: python bench/request_logging.py [requests] [body size in bytes]
+"""
+
+import logging
+from os import devnull, urandom
+from sys import argv
+from threading import Thread
+from time import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from kamaki.clients import Client
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    #  Buffer responses, small writes stall on delayed ACKs
+    wbufsize = -1
+    body = ''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '%s' % len(self.body))
+        for i in range(10):
+            self.send_header('X-Object-Meta-Key%s' % i, 'value %s' % i)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def per_request(client, requests, body):
+    started = time()
+    for i in range(requests):
+        client.get('/object')
+        client.put('/object', data=body, success=201)
+    return (time() - started) / (2 * requests)
+
+
+def main(requests=100, size=1024 * 1024):
+    Handler.body = urandom(size)
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    client = Client('http://127.0.0.1:%s' % server.server_port, 't0k3n')
+    per_request(client, 2, Handler.body)
+
+    handler = logging.StreamHandler(open(devnull, 'w'))
+    loggers = [logging.getLogger('kamaki.clients.%s' % name) for name in (
+        'send', 'recv')]
+    results = [('disabled', per_request(client, requests, Handler.body))]
+    for logger in loggers:
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    results.append(('enabled', per_request(client, requests, Handler.body)))
+    Client.LOG_DATA = True
+    results.append((
+        'enabled with data', per_request(client, requests, Handler.body)))
+    print('%s GET and PUT requests of %s bytes' % (requests, size))
+    for name, seconds in results:
+        print('logging %s: %.3f ms per request' % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:3]])
@@ -0,0 +1,85 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Resume the download of an object, with most of its blocks in the local
+file (and some of them modified), from a local stand-in Pithos server that
+waits before each response, like a high-latency link. The local blocks are
+hashed by a pool of PithosClient.HASH_WORKERS hashers, while the blocks past
+the end of the local file are downloaded.
+
+Usage: python bench/resume_verify.py [MB] [% downloaded before] [ms]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import NamedTemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(size=512, percent=75, latency=20):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = bs = 4 * 1024 * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MAX_THREADS = 8
+    data = urandom(size * 1024 * 1024)
+    src = NamedTemporaryFile()
+    src.write(data)
+    src.seek(0)
+    client.upload_object('obj', src)
+    local_size = len(data) * percent // 100 // bs * bs
+    print('%s MB, %s MB downloaded before, %s ms' % (
+        size, local_size // 1024 // 1024, latency))
+    print('hashers   time (s)  requests  MB skipped')
+    for workers in (1, 0):
+        local = NamedTemporaryFile()
+        local.write(data[:local_size])
+        for offset in range(0, local_size, 16 * bs):
+            local.seek(offset)
+            local.write('modified')
+        local.flush()
+        client.HASH_WORKERS, client.resumed_bytes = workers, 0
+        server.requests, started = 0, time()
+        client.download_object('obj', local, resume=True)
+        took = time() - started
+        local.seek(0)
+        assert local.read() == data
+        print('%-8s  %8.3f  %8s  %10s' % (
+            workers or 'per CPU', took, server.requests,
+            client.resumed_bytes // 1024 // 1024))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
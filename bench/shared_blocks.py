@@ -0,0 +1,85 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Upload a directory of files which share most of their blocks (e.g.,
+layers of VM images), file by file as "kamaki file upload -r" does, with
+and without a set of blocks shared by all the uploads of the run, to a
+local stand-in Pithos server
+
+Usage: python bench/shared_blocks.py [files] [blocks per file] [block KB]
+"""
+
+from os import urandom
+from sys import argv
+from tempfile import TemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.pithos.dedup import SharedBlocks
+from standin import StandinPithos
+
+
+def main(nfiles=8, nblocks=16, block_kbytes=1024):
+    server = StandinPithos()
+    server.block_size = block_kbytes * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    base = [urandom(server.block_size) for i in range(nblocks)]
+    files = []
+    for i in range(nfiles):
+        f = TemporaryFile()
+        #  Each file has a block of its own, the rest are common
+        f.write(''.join(base[:-1] + [urandom(server.block_size)]))
+        f.flush()
+        files.append(f)
+    print('%s files of %s blocks of %s KB, %s blocks in common' % (
+        nfiles, nblocks, block_kbytes, nblocks - 1))
+    print('mode      shared  uploaded (MB)  ratio  seconds')
+    for pipeline in (False, True):
+        for shared in (None, SharedBlocks()):
+            client.UPLOAD_PIPELINE = pipeline
+            client.shared_blocks = shared
+            server.blocks.clear()
+            server.objects.clear()
+            server.bytes_in, started = 0, time()
+            for i, f in enumerate(files):
+                f.seek(0)
+                client.upload_object('dir/file%s' % i, f)
+            print('%-8s  %6s  %13.1f  %5s  %7.3f' % (
+                'pipeline' if pipeline else 'phases',
+                'yes' if shared else 'no', server.bytes_in / 1048576.0,
+                '%.2f' % shared.ratio() if shared else '-',
+                time() - started))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
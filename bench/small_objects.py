@@ -0,0 +1,84 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare uploading many small files with the hashmap protocol and with a
+single PUT each, against a local stand-in Pithos server that waits before
+each response, like a high-latency link
+
+Usage: python bench/small_objects.py [files] [ms]
+"""
+
+from os import path, urandom
+from random import randint
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(files=10000, latency=1):
+    server = StandinPithos(latency=latency / 1000.0)
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    tmpdir = mkdtemp()
+    try:
+        names = []
+        for i in range(files):
+            names.append(path.join(tmpdir, 'f%s' % i))
+            with open(names[-1], 'wb') as f:
+                f.write(urandom(randint(100, 16 * 1024)))
+        print('%s files, %s ms per request' % (files, latency))
+        print('upload      requests  seconds  files/s')
+        for small in (0, PithosClient.SMALL_OBJECT_SIZE):
+            client.SMALL_OBJECT_SIZE = small
+            server.blocks.clear()
+            server.objects.clear()
+            server.requests, cache, started = 0, dict(), time()
+            for name in names:
+                with open(name, 'rb') as f:
+                    client.upload_object(
+                        path.basename(name), f, container_info_cache=cache)
+            took = time() - started
+            print('%-10s  %8s  %7.3f  %7.1f' % (
+                'single PUT' if small else 'hashmap', server.requests, took,
+                files / took))
+            assert len(server.objects) == files
+    finally:
+        rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:3]])
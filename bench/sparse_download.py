@@ -0,0 +1,83 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Download a sparse disk image, mostly all-zero blocks, from a local
+stand-in Pithos server that waits before each response, like a high-latency
+link. Zero blocks are downloaded and written as any other block, and then
+skipped and left as holes in the local file.
+
+Usage: python bench/sparse_download.py [MB] [% of data blocks] [ms]
+"""
+
+from os import fstat, urandom
+from random import Random
+from sys import argv
+from tempfile import TemporaryFile, NamedTemporaryFile
+from time import time
+
+from kamaki.clients import pithos
+from standin import StandinPithos
+
+
+def main(size=256, percent=10, latency=5):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = bs = 1024 * 1024
+    client = pithos.PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MAX_THREADS = 16
+    image, rand = TemporaryFile(), Random(0)
+    for i in range(size):
+        image.write(urandom(bs) if rand.randint(1, 100) <= percent else (
+            '\x00' * bs))
+    image.seek(0)
+    client.upload_object('image', image)
+    print('%s MB image, %s%% data blocks, %s ms' % (size, percent, latency))
+    print('zeros     time (s)  requests  MB received  MB on disk')
+    zero_block_hash = pithos.zero_block_hash
+    for skip in (False, True):
+        pithos.zero_block_hash = zero_block_hash if skip else (
+            lambda blockhash: None)
+        local = NamedTemporaryFile()
+        server.requests, server.bytes_out, started = 0, 0, time()
+        client.download_object('image', local)
+        print('%-8s  %8.3f  %8s  %11.1f  %10.1f' % (
+            'skipped' if skip else 'fetched', time() - started,
+            server.requests, server.bytes_out / 1024.0 / 1024,
+            fstat(local.fileno()).st_blocks * 512 / 1024.0 / 1024))
+        local.seek(0)
+        image.seek(0)
+        assert local.read() == image.read()
+    pithos.zero_block_hash = zero_block_hash
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,123 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Measure HTTPS connections (TLS handshakes) per second, with and without
+cached SSL contexts in kamaki.clients.utils.https
+
+A local TLS server runs with a self-signed certificate, generated with the
+openssl command. The CA bundle of the client contains the system bundle and
+this certificate, so that the cost of loading a real bundle is included.
+
+Usage: python bench/ssl_handshakes.py [connections] [system CA bundle]
+"""
+
+import socket
+import ssl
+from os import path
+from shutil import rmtree
+from subprocess import check_call
+from sys import argv
+from tempfile import mkdtemp
+from threading import Thread
+from time import time
+
+from kamaki.clients.utils import https
+
+SYSTEM_BUNDLE = '/etc/ssl/certs/ca-certificates.crt'
+
+
+def make_certs(tmpdir, system_bundle):
+    key, cert = path.join(tmpdir, 'key.pem'), path.join(tmpdir, 'cert.pem')
+    with open(path.join(tmpdir, 'openssl.log'), 'w') as out:
+        check_call([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-days', '1', '-subj', '/CN=localhost',
+            '-keyout', key, '-out', cert], stdout=out, stderr=out)
+    bundle = path.join(tmpdir, 'bundle.pem')
+    with open(bundle, 'w') as f:
+        if path.exists(system_bundle):
+            with open(system_bundle) as system:
+                f.write(system.read())
+        with open(cert) as c:
+            f.write(c.read())
+    return key, cert, bundle
+
+
+def serve(listener, key, cert):
+    while True:
+        conn, addr = listener.accept()
+        try:
+            ssl.wrap_socket(
+                conn, key, cert, server_side=True).close()
+        except (ssl.SSLError, socket.error):
+            conn.close()
+
+
+def connections_per_second(port, bundle, connections):
+    started = time()
+    for i in range(connections):
+        conn = https.HTTPSClientAuthConnection(
+            'localhost', port, ca_file=bundle)
+        conn.connect()
+        conn.close()
+    return connections / (time() - started)
+
+
+def main(connections=200, system_bundle=SYSTEM_BUNDLE):
+    tmpdir = mkdtemp()
+    try:
+        key, cert, bundle = make_certs(tmpdir, system_bundle)
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        listener.listen(64)
+        server = Thread(target=serve, args=(listener, key, cert))
+        server.daemon = True
+        server.start()
+        port = listener.getsockname()[1]
+
+        has_context = https.HAS_CONTEXT
+        https.HAS_CONTEXT = False
+        legacy = connections_per_second(port, bundle, connections)
+        https.HAS_CONTEXT = has_context
+        cached = connections_per_second(port, bundle, connections)
+        print('CA bundle: %s bytes' % path.getsize(bundle))
+        print('%s connections per second with ssl.wrap_socket' % legacy)
+        print('%s connections per second with a cached context%s' % (
+            cached, ' and sessions' if https.HAS_SESSION else ''))
+    finally:
+        rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*([int(argv[1])] if argv[1:] else []) + argv[2:3])
@@ -0,0 +1,242 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""A stand-in Pithos server for benchmarks, running in a thread
+
+Paths are of the form /<account>/<container>[/<object>]. It serves container
+listings (format=json), gzip-compressed if the client accepts it, and
+container metadata. Listings have an ETag and container metadata a
+Last-Modified header, for conditional requests.
+
+Objects are uploaded as blocks (POST to the container) and hashmaps (PUT), or
+as data (PUT), and downloaded as hashmaps or data ranges (GET), like in Pithos.
+Many ranges are served as a multipart/byteranges reply.
+"""
+
+import gzip
+from cStringIO import StringIO
+from hashlib import md5, sha256
+from json import dumps, loads
+from threading import Thread
+from time import sleep
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    #  Buffer responses, small writes stall on delayed ACKs
+    wbufsize = -1
+
+    def log_message(self, *args):
+        pass
+
+    def _parse(self):
+        url = urlparse(self.path)
+        self.params = dict([(k, v[0]) for k, v in parse_qs(
+            url.query, keep_blank_values=True).items()])
+        return url.path.strip('/').split('/', 2)
+
+    def _respond(self, status, body='', headers={}):
+        self.server.requests += 1
+        if body and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as f:
+                f.write(body)
+            body, headers = buf.getvalue(), dict(
+                headers, **{'Content-Encoding': 'gzip'})
+        self.server.bytes_out += len(body)
+        delay = self.server.latency
+        if self.server.bandwidth:
+            delay += len(body) / self.server.bandwidth
+        if delay:
+            sleep(delay)
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', '%s' % len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        size = int(self.headers.get('Content-Length', 0))
+        self.server.bytes_in += size
+        return self.rfile.read(size)
+
+    def _get_object(self, key):
+        hashes, size = self.server.objects[key]
+        if self.params.get('hashmap') and self.params.get('format') == 'json':
+            self._respond(200, dumps(dict(
+                block_size=self.server.block_size, block_hash='sha256',
+                bytes=size, hashes=hashes)), {
+                    'Content-Type': 'application/json; charset=utf-8'})
+            return
+        data_range = self.headers.get('Range')
+        if not data_range:
+            self._respond(200, self._data(hashes, 0, size - 1))
+            return
+        spans = [[int(i) for i in span.split('-')] for span in (
+            data_range.split('=')[1].split(','))]
+        if len(spans) == 1:
+            start, end = spans[0]
+            self._respond(206, self._data(hashes, start, end), {
+                'Content-Range': 'bytes %s-%s/%s' % (start, end, size)})
+            return
+        boundary = 'st4nd1n'
+        self._respond(206, ''.join([
+            '\r\n--%s\r\nContent-Range: bytes %s-%s/%s\r\n\r\n%s' % (
+                boundary, start, end, size, self._data(hashes, start, end))
+            for start, end in spans]) + '\r\n--%s--\r\n' % boundary, {
+                'Content-Type': 'multipart/byteranges; boundary=%s' % (
+                    boundary)})
+
+    def _data(self, hashes, start, end):
+        bs = self.server.block_size
+        data = ''.join([self.server.blocks[h] for h in hashes[
+            start // bs:end // bs + 1]])
+        return data[start % bs:start % bs + end - start + 1]
+
+    def do_POST(self):
+        path = self._parse()
+        if len(path) == 2 and self.params.get('update') is not None:
+            data, bs, hashes = self._body(), self.server.block_size, []
+            for i in range(0, len(data), bs):
+                block = data[i:i + bs]
+                hashes.append(sha256(block.rstrip('\x00')).hexdigest())
+                self.server.blocks[hashes[-1]] = block
+            self._respond(202, dumps(hashes), {
+                'Content-Type': 'application/json; charset=utf-8'})
+        else:
+            self._body()
+            self._respond(404)
+
+    def do_PUT(self):
+        path, body = self._parse(), self._body()
+        if len(path) == 3 and self.params.get('hashmap'):
+            hashmap = loads(body)
+            missing = [
+                h for h in hashmap['hashes'] if h not in self.server.blocks]
+            if missing:
+                self._respond(409, dumps(missing), {
+                    'Content-Type': 'application/json; charset=utf-8'})
+                return
+            self.server.objects[tuple(path[1:])] = (
+                hashmap['hashes'], hashmap['bytes'])
+            self._respond(201)
+        elif len(path) == 3:
+            bs, hashes = self.server.block_size, []
+            for i in range(0, len(body), bs):
+                block = body[i:i + bs]
+                hashes.append(sha256(block.rstrip('\x00')).hexdigest())
+                self.server.blocks[hashes[-1]] = block
+            self.server.objects[tuple(path[1:])] = (hashes, len(body))
+            self._respond(201)
+        else:
+            self._respond(404)
+
+    def do_GET(self):
+        path = self._parse()
+        if tuple(path[1:]) in self.server.objects:
+            self._get_object(tuple(path[1:]))
+        elif len(path) == 2:
+            container = self.server.containers.get(path[1], [])
+            if self.params.get('format') == 'json':
+                body = dumps(container)
+                etag = md5(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self._respond(304, headers={'ETag': etag})
+                    return
+                self._respond(200, body, {
+                    'Content-Type': 'application/json; charset=utf-8',
+                    'ETag': etag})
+            else:
+                self._respond(200, '\n'.join([
+                    o['name'] for o in container]).encode('utf-8'))
+        else:
+            self._respond(404)
+
+    def do_HEAD(self):
+        path = self._parse()
+        if len(path) == 2:
+            headers = {
+                'X-Container-Block-Size': '%s' % self.server.block_size,
+                'X-Container-Block-Hash': 'sha256',
+                'X-Container-Object-Count': '%s' % len(
+                    self.server.containers.get(path[1], [])),
+                'Last-Modified': self.server.last_modified}
+            if self.headers.get('If-Modified-Since') == (
+                    self.server.last_modified):
+                self._respond(304, headers=headers)
+            else:
+                self._respond(204, headers=headers)
+        else:
+            self._respond(404)
+
+
+class StandinPithos(ThreadingMixIn, HTTPServer):
+    """Serve in a daemon thread, at self.url
+
+    :param bandwidth: (float) if set, simulate a link of bandwidth bytes/s
+        per response
+
+    :param latency: (float) seconds to wait before each response
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, bandwidth=None, latency=0.0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.containers, self.bytes_out, self.requests = dict(), 0, 0
+        self.bytes_in = 0
+        self.blocks, self.objects = dict(), dict()
+        self.bandwidth, self.latency = bandwidth, latency
+        self.block_size = 4 * 1024 * 1024
+        self.last_modified = 'Thu, 01 Jan 2015 00:00:00 GMT'
+        self.url = 'http://127.0.0.1:%s' % self.server_port
+        thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def add_listing(self, container, size):
+        """Fill a container with size fake object entries"""
+        self.containers[container] = [dict(
+            name='dir/file-%08d.txt' % i, bytes=1024 * i,
+            hash='%064x' % i, content_type='text/plain',
+            last_modified='2015-01-01T00:00:00.%06d+00:00' % i,
+            x_object_uuid='%032x' % i, x_object_version=i,
+            x_object_modified_by='user-%s' % (i % 10),
+            x_object_version_timestamp='1420070400.%06d' % i)
+            for i in range(size)]
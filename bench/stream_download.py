@@ -0,0 +1,89 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Download an object to a pipe, block by block and with the ordered
+parallel engine of PithosClient.download_object, from a local stand-in
+Pithos server that waits before each response, like a high-latency link.
+A reader thread drains the pipe and checks the data.
+
+Usage: python bench/stream_download.py [MB] [ms] [window]
+"""
+
+from hashlib import md5
+from os import fdopen, pipe, urandom
+from sys import argv
+from tempfile import TemporaryFile
+from threading import Thread
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(size=64, latency=20, window=16):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = 1024 * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MAX_THREADS, client.STREAM_WINDOW = 16, window
+    src = TemporaryFile()
+    data = urandom(size * 1024 * 1024)
+    src.write(data)
+    src.seek(0)
+    client.upload_object('obj', src)
+    print('%s MB of 1 MB blocks, %s ms, window of %s blocks' % (
+        size, latency, window))
+    print('mode      time (s)  MB/s')
+    for mode in ('serial', 'ordered'):
+        r, w = pipe()
+        r, w = fdopen(r, 'rb'), fdopen(w, 'wb')
+        received = []
+        reader = Thread(target=lambda: received.append(md5(r.read())))
+        reader.start()
+        started = time()
+        if mode == 'serial':
+            hashmap = client.get_object_hashmap('obj')
+            client._dump_blocks_sync(
+                'obj', hashmap['hashes'], hashmap['block_size'],
+                hashmap['bytes'], w, None)
+        else:
+            client.download_object('obj', w)
+        w.close()
+        reader.join()
+        took = time() - started
+        r.close()
+        assert received[0].digest() == md5(data).digest()
+        print('%-8s  %8.3f  %4.0f' % (mode, took, size / took))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,90 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare uploading the output of a command by spooling it to a temporary
+file first and by streaming it from a pipe, against a local stand-in Pithos
+server
+
+Usage: python bench/stream_upload.py [MB]
+"""
+
+from os import urandom
+from shutil import copyfileobj
+from subprocess import Popen, PIPE
+from sys import argv, executable
+from tempfile import TemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+PRODUCER = (
+    'import sys\n'
+    'chunk = sys.stdin.read()\n'
+    'for i in range(%s):\n'
+    '    sys.stdout.write(chunk[i:] + chunk[:i])\n')
+
+
+def main(mbytes=256):
+    server = StandinPithos()
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    chunk = urandom(1024 * 1024)
+    print('%s MB' % mbytes)
+    print('upload    bytes through disk  seconds')
+    for spool in (True, False):
+        server.blocks.clear()
+        server.objects.clear()
+        started = time()
+        producer = Popen(
+            [executable, '-c', PRODUCER % mbytes], stdin=PIPE, stdout=PIPE)
+        producer.stdin.write(chunk)
+        producer.stdin.close()
+        if spool:
+            src = TemporaryFile()
+            copyfileobj(producer.stdout, src)
+            src.seek(0)
+        else:
+            src = producer.stdout
+        client.upload_object('object', src)
+        producer.wait()
+        took = time() - started
+        print('%-8s  %18s  %7.3f' % (
+            'spooled' if spool else 'streamed',
+            2 * mbytes * 1024 * 1024 if spool else 0, took))
+        assert server.objects[('container', 'object')][1] == (
+            mbytes * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:2]])
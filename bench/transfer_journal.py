@@ -0,0 +1,112 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Resume interrupted transfers with and without a TransferJournal, from and
+to a local stand-in Pithos server: a directory upload that completed all but
+its last file, and a large download that wrote half of its blocks. Without a
+journal, the upload is repeated and the download hashes the local file.
+
+Usage: python bench/transfer_journal.py [files] [download MB] [ms]
+"""
+
+from os import urandom
+from shutil import rmtree
+from sys import argv
+from tempfile import TemporaryFile, NamedTemporaryFile, mkdtemp
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.pithos.journal import TransferJournal
+from standin import StandinPithos
+
+
+def main(nfiles=500, size=256, latency=5):
+    server = StandinPithos(latency=latency / 1000.0)
+    server.block_size = 1024 * 1024
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MAX_THREADS = 16
+    files = []
+    for i in range(nfiles):
+        f = TemporaryFile()
+        f.write(urandom(64 * 1024 if i % 100 else 8 * 1024 * 1024))
+        f.flush()
+        files.append((f, 'dir/file%s' % i))
+    big = TemporaryFile()
+    big.write(urandom(size * 1024 * 1024))
+    big.seek(0)
+    client.upload_object('big', big)
+    tmpdir = mkdtemp()
+    print('%s files (1%% of 8 MB, others 64 KB), %s MB download, %s ms' % (
+        nfiles, size, latency))
+    print('journal  upload (s)  requests  download (s)  requests')
+    try:
+        for journal in (None, TransferJournal.open('job', tmpdir)):
+            client.journal = journal
+            for f, obj in files:
+                f.seek(0)
+            for r in client.upload_objects(
+                    (f, obj, dict()) for f, obj in files[:-1]):
+                assert not isinstance(r[2], Exception), r[2]
+            local = NamedTemporaryFile()
+            client.download_object('big', local)
+            name = client._journal_name('download', 'big')
+            if journal:
+                #  Leave the journal of a download interrupted at half
+                journal.begin(name, journal.key(local, identity=True))
+                hashes = client.get_object_hashmap('big')['hashes']
+                journal.record(name, [(i * server.block_size, h) for i, h in (
+                    enumerate(hashes[:len(hashes) // 2]))])
+            local.truncate(size * 1024 * 1024 // 2)
+            local.seek(0)
+
+            for f, obj in files:
+                f.seek(0)
+            server.requests, started = 0, time()
+            for r in client.upload_objects(
+                    (f, obj, dict()) for f, obj in files):
+                assert not isinstance(r[2], Exception), r[2]
+            uploaded, requests = time(), server.requests
+            server.requests = 0
+            client.download_object('big', local, resume=True)
+            print('%-7s  %10.3f  %8s  %12.3f  %8s' % (
+                'on' if journal else 'off', uploaded - started, requests,
+                time() - uploaded, server.requests))
+            local.seek(0)
+            big.seek(0)
+            assert local.read() == big.read()
+    finally:
+        rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -0,0 +1,80 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""Compare uploading a new object and uploading it again, in phases (hash,
+hashmap PUT, upload the missing blocks), pipelined (upload blocks while
+hashing) and with the automatic choice, which costs a hashmap GET to probe
+the first blocks, against a local stand-in Pithos server that waits before
+each response, like a high-latency link
+
+Usage: python bench/upload_pipeline.py [MB] [requests in flight] [ms]
+"""
+
+from os import urandom
+from sys import argv
+from itertools import product
+from tempfile import TemporaryFile
+from time import time
+
+from kamaki.clients.pithos import PithosClient
+from standin import StandinPithos
+
+
+def main(mbytes=256, in_flight=8, latency=200):
+    server = StandinPithos(latency=latency / 1000.0)
+    client = PithosClient(server.url, 't0k3n', 'account', 'container')
+    client.MIN_THREADS = client.MAX_THREADS = in_flight
+    f = TemporaryFile()
+    chunk = urandom(1024 * 1024)
+    for i in range(mbytes):
+        f.write(chunk[i:] + chunk[:i])
+    f.flush()
+    print('%s MB, %s requests in flight, %s ms' % (
+        mbytes, in_flight, latency))
+    print('mode       object  seconds')
+    for mode, fresh in product((False, True, None), (True, False)):
+        if fresh:
+            server.blocks.clear()
+            server.objects.clear()
+        client.UPLOAD_PIPELINE = mode
+        f.seek(0)
+        started = time()
+        client.upload_object('object', f)
+        print('%-9s  %6s  %7.3f' % (
+            {False: 'phases', True: 'pipeline', None: 'auto'}[mode],
+            'new' if fresh else 'again', time() - started))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in argv[1:4]])
@@ -33,6 +33,7 @@
 
 from sys import stdin, stdout, stderr, exit
 from traceback import format_exc
+import atexit
 
 from kamaki.cli.logger import get_logger
 from kamaki.cli.utils import (
@@ -41,10 +42,25 @@ from kamaki.cli.utils import (
 from kamaki.cli.argument import ValueArgument, ProgressBarArgument
 from kamaki.cli.errors import CLIInvalidArgument, CLIBaseUrlError
 from kamaki.cli.cmds import errors
-from kamaki.clients.utils import escape_ctrl_chars
+from kamaki.clients.utils import (
+    escape_ctrl_chars, timing, httpcache, eventloop)
+from kamaki.clients.pithos import hashindex
 
 
 log = get_logger(__name__)
+_timing_aggregator = []
+
+
+def _log_timing():
+    """Log the timing of each HTTP request and percentiles at exit"""
+    if _timing_aggregator:
+        return
+    _timing_aggregator.append(timing.TimingAggregator())
+    timing.add_hook(timing.log_hook)
+    timing.add_hook(_timing_aggregator[0])
+    atexit.register(lambda: timing.log.debug('\n'.join(
+        ['HTTP request timing percentiles (seconds)'] + (
+            _timing_aggregator[0].summary()))))
 
 
 def dont_raise(*errs):
@@ -219,6 +235,39 @@ class CommandInit(object):
         except Exception as e:
             log.debug('Failed to read custom log_pid setting:'
                       '%s\n default for log_pid is off' % e)
+        try:
+            if self['config'].get('global', 'log_timing').lower() == 'on':
+                _log_timing()
+        except Exception as e:
+            log.debug('Failed to read custom log_timing setting:'
+                      '%s\n default for log_timing is off' % e)
+        try:
+            self.client.ACCEPT_COMPRESSION = self['config'].get(
+                'global', 'http_compression').lower() == 'on'
+        except Exception as e:
+            log.debug('Failed to read custom http_compression setting:'
+                      '%s\n default for http_compression is off' % e)
+        try:
+            if self['config'].get('global', 'http_cache').lower() == 'on':
+                self.client.http_cache = httpcache.get_cache()
+        except Exception as e:
+            log.debug('Failed to set up http_cache: %s' % e)
+        try:
+            if self['config'].get(
+                    'global', 'http_transport').lower() == 'eventloop':
+                self.client.transport = eventloop.get_loop()
+        except Exception as e:
+            log.debug('Failed to set up http_transport: %s' % e)
+        if hasattr(self.client, 'hash_index'):
+            self._set_hash_index(self.client)
+
+    def _set_hash_index(self, client):
+        """Let a pithos client skip hashing files uploaded before"""
+        try:
+            if self['config'].get('global', 'hash_index').lower() == 'on':
+                client.hash_index = hashindex.get_index()
+        except Exception as e:
+            log.debug('Failed to set up hash_index: %s' % e)
 
     def _safe_progress_bar(
             self, msg, arg='progress_bar', countdown=False, timeout=100):
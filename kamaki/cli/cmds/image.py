@@ -429,6 +429,7 @@ class image_register(_ImageInit, OptionalOutput):
     def _get_pithos_client(self, locator):
         pithos = self.get_client(PithosClient, 'pithos')
         pithos.account, pithos.container = locator.uuid, locator.container
+        self._set_hash_index(pithos)
         return pithos
 
     def _load_params_from_file(self, location):
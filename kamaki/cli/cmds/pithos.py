@@ -35,9 +35,11 @@ from time import localtime, strftime
 from io import StringIO
 from pydoc import pager
 from os import path, walk, makedirs
-from threading import activeCount, enumerate as activethreads
 
 from kamaki.clients.pithos import PithosClient, ClientError
+from kamaki.clients.pithos.dedup import SharedBlocks
+from kamaki.clients.pithos.journal import TransferJournal, job_id
+from kamaki.clients.utils import workers
 from kamaki.clients.utils import escape_ctrl_chars
 
 from kamaki.cli import command
@@ -99,6 +101,19 @@ class _PithosInit(CommandInit):
     def main(self):
         self._run()
 
+    def _wait_for_workers(self):
+        """Pending transfers are cancelled on Ctrl-C, wait for the running
+        ones to finish"""
+        pool, timeout = workers.get_pool(), 0.5
+        if pool.busy:
+            self._err.write('\nWait for %s threads: ' % pool.busy)
+            while not pool.join(timeout):
+                self._err.write('.')
+                self._err.flush()
+                timeout += 0.1
+            self._err.write('*\n')
+            self._err.flush()
+
 
 class _PithosAccount(_PithosInit):
     """Setup account"""
@@ -176,6 +191,34 @@ class _PithosContainer(_PithosAccount):
         finally:
             self.container = bu_cont
 
+    def _open_journal(self, *terms):
+        """Set up the journal of a transfer job, if requested. Unless given,
+        the job id is derived from the remote location and terms
+
+        :returns: (bool) True if an interrupted job is resumed
+        """
+        if not (self['journal'] or self['job_id']):
+            return False
+        job = self['job_id'] or job_id(
+            self.client.endpoint_url, self.client.account,
+            self.client.container, *terms)
+        self.client.journal = TransferJournal.open(job)
+        if self.client.journal.empty():
+            return False
+        self.error('Resume job %s' % job)
+        return True
+
+    def _close_journal(self, completed):
+        """Report the files skipped by the journal, and delete it if the job
+        is completed"""
+        journal = self.client.journal
+        if journal:
+            if journal.skipped:
+                self.error('Skipped %s file(s) transferred before' % (
+                    journal.skipped))
+            if completed:
+                journal.remove()
+
     def _run(self, url=None):
         acc, con, self.path = self.resolve_pithos_url(url or '')
         super(_PithosContainer, self)._run()
@@ -915,7 +958,9 @@ class file_upload(_PithosContainer):
     """Upload a file
 
     The default destination is /pithos/NAME
-    where NAME is the base name of the source path"""
+    where NAME is the base name of the source path
+    Use - as the source path to upload the standard input, e.g., a pipe
+    (the destination must be given)"""
 
     arguments = dict(
         max_threads=IntArgument('default: 5', '--threads'),
@@ -947,6 +992,14 @@ class file_upload(_PithosContainer):
             'Confirm upload with a custom checksum (MD5)', '--etag'),
         use_hashes=FlagArgument(
             'Source file contains hashmap not data', '--source-is-hashmap'),
+        journal=FlagArgument(
+            'Keep a journal of a directory upload, to resume it if '
+            'interrupted, by running the same command again',
+            '--journal'),
+        job_id=ValueArgument(
+            'Keep the journal of a directory upload under this id (implies '
+            '--journal)',
+            '--job-id'),
     )
 
     def _sharing(self):
@@ -962,8 +1015,8 @@ class file_upload(_PithosContainer):
     def _check_container_limit(self, path):
         cl_dict = self.client.get_container_limit()
         container_limit = int(cl_dict['x-container-policy-quota'])
-        r = self.client.container_get()
-        used_bytes = sum(int(o['bytes']) for o in r.json)
+        r = self.client.container_get(stream=True)
+        used_bytes = sum(int(o['bytes']) for o in r.iter_json())
         path_size = get_path_size(path)
         if container_limit and path_size > (container_limit - used_bytes):
             raise CLIError(
@@ -981,7 +1034,33 @@ class file_upload(_PithosContainer):
                     '\t/file containerlimit set <new limit> %s' % (
                         self.client.container)])
 
+    def _stdin_dst(self, remote_path):
+        """Check the destination of the standard input"""
+        try:
+            robj = self.client.get_object_info(remote_path)
+            if self.object_is_dir(robj):
+                raise CLIError(
+                    'Object /%s/%s is a directory' % (
+                        self.container, remote_path),
+                    details=['Give the full path of the destination object'])
+            if not self['overwrite']:
+                raise CLIError(
+                    'Object /%s/%s already exists' % (
+                        self.container, remote_path),
+                    details=['use -f to overwrite'])
+        except ClientError as ce:
+            if ce.status in (404, ):
+                self._container_exists()
+            else:
+                raise
+        yield self._in, remote_path
+
     def _src_dst(self, local_path, remote_path, objlist=None):
+        if local_path == '-':
+            return self._stdin_dst(remote_path)
+        return self._files_dst(local_path, remote_path, objlist)
+
+    def _files_dst(self, local_path, remote_path, objlist=None):
         lpath = path.abspath(local_path)
         short_path = path.basename(path.abspath(local_path))
         rpath = remote_path or short_path
@@ -1011,28 +1090,30 @@ class file_upload(_PithosContainer):
                         if ce.status not in (404, ):
                             raise
             self._check_container_limit(lpath)
-            prev = ''
-            for top, subdirs, files in walk(lpath):
-                if top != prev:
-                    prev = top
-                    try:
-                        rel_path = rpath + top.split(lpath)[1]
-                    except IndexError:
-                        rel_path = rpath
-                    # Use the '/' separator for directories that
-                    # are about to be created in Pithos
-                    rel_path = rel_path.replace(path.sep, '/')
-                    self.error('remote: mkdir /%s/%s' % (
-                        self.client.container, rel_path))
-                    self.client.create_directory(rel_path)
-                for f in files:
+            #  Walk first, to create the remote directories at once
+            dirs, files = [], []
+            for top, subdirs, fnames in walk(lpath):
+                try:
+                    rel_path = rpath + top.split(lpath)[1]
+                except IndexError:
+                    rel_path = rpath
+                # Use the '/' separator for directories that
+                # are about to be created in Pithos
+                rel_path = rel_path.replace(path.sep, '/')
+                dirs.append(rel_path)
+                for f in fnames:
                     fpath = path.join(top, f)
                     if path.isfile(fpath):
-                        rel_path = rel_path.replace(path.sep, '/')
                         pathfix = f.replace(path.sep, '/')
-                        yield open(fpath, 'rb'), '%s/%s' % (rel_path, pathfix)
+                        files.append((fpath, '%s/%s' % (rel_path, pathfix)))
                     else:
                         self.error('%s not a regular file' % fpath)
+            for rel_path in dirs:
+                self.error('remote: mkdir /%s/%s' % (
+                    self.client.container, rel_path))
+            self.client.create_directories(dirs)
+            for fpath, rel_path in files:
+                yield open(fpath, 'rb'), rel_path
         else:
             if not path.isfile(lpath):
                 raise CLIError(('%s is not a regular file' % lpath) if (
@@ -1065,11 +1146,17 @@ class file_upload(_PithosContainer):
             public=self['public'])
         container_info_cache = dict()
         rpref = 'pithos://%s' if self['account'] else ''
+        if not self['unchunked'] and local_path != '-' and path.isdir(
+                local_path):
+            self._upload_tree(
+                local_path, remote_path, params, container_info_cache)
+            return
         for f, rpath in self._src_dst(local_path, remote_path):
+            stdin = f is self._in
             self.error('%s --> %s/%s/%s' % (
-                f.name, rpref, self.client.container, rpath))
+                '-' if stdin else f.name, rpref, self.client.container, rpath))
             if not (self['content_type'] and self['content_encoding']):
-                ctype, cenc = guess_mime_type(f.name)
+                ctype, cenc = guess_mime_type(rpath if stdin else f.name)
                 params['content_type'] = self['content_type'] or ctype
                 params['content_encoding'] = self['content_encoding'] or cenc
             if self['unchunked']:
@@ -1079,8 +1166,10 @@ class file_upload(_PithosContainer):
                     **params)
             else:
                 try:
-                    (progress_bar, upload_cb) = self._safe_progress_bar(
-                        'Uploading %s' % f.name.split(path.sep)[-1])
+                    #  The size of the standard input is not known
+                    (progress_bar, upload_cb) = (None, None) if (
+                        stdin) else self._safe_progress_bar(
+                            'Uploading %s' % f.name.split(path.sep)[-1])
                     if progress_bar:
                         hash_bar = progress_bar.clone()
                         hash_cb = hash_bar.get_generator(
@@ -1094,23 +1183,7 @@ class file_upload(_PithosContainer):
                         container_info_cache=container_info_cache,
                         **params)
                 except KeyboardInterrupt:
-                    timeout = 0.5
-                    msg = '\n'
-                    while activeCount() > 1:
-                        msg += 'Wait for %s threads: ' % (activeCount() - 1)
-                        self._err.write(msg)
-                        for thread in activethreads():
-                            try:
-                                thread.join(timeout)
-                                self._err.write(
-                                    '.' if thread.isAlive() else '*')
-                                self._err.flush()
-                            except RuntimeError:
-                                continue
-                            finally:
-                                timeout += 0.1
-                                self._err.flush()
-                                msg = '\b' * len(msg)
+                    self._wait_for_workers()
                     raise CLIError('Upload canceled by user')
                 except Exception:
                     self._safe_progress_bar_finish(progress_bar)
@@ -1123,9 +1196,67 @@ class file_upload(_PithosContainer):
                 self.write('%s\n' % obj.get('x-object-public', ''))
             self.error('Upload completed')
 
+    def _upload_tree(
+            self, local_path, remote_path, params, container_info_cache):
+        """Upload the files of a directory in parallel. Their blocks are
+        shared, so that each block is sent once per run. Failed files are
+        reported at the end"""
+        shared = self.client.shared_blocks = SharedBlocks()
+        rpref = 'pithos://%s' if self['account'] else ''
+        if self._open_journal('upload', path.abspath(local_path), remote_path):
+            self.arguments['overwrite'].value = True
+
+        def sources():
+            for f, rpath in self._src_dst(local_path, remote_path):
+                kwargs = dict(
+                    params, container_info_cache=container_info_cache)
+                if not (self['content_type'] and self['content_encoding']):
+                    ctype, cenc = guess_mime_type(f.name)
+                    kwargs['content_type'] = self['content_type'] or ctype
+                    kwargs['content_encoding'] = self[
+                        'content_encoding'] or cenc
+                yield f, rpath, kwargs
+
+        failed, uploads = [], self.client.upload_objects(sources())
+        try:
+            for f, rpath, r in uploads:
+                f.close()
+                if isinstance(r, Exception):
+                    self.error('%s --> %s/%s/%s failed: %s' % (
+                        f.name, rpref, self.client.container, rpath, r))
+                    failed.append('%s: %s' % (f.name, r))
+                    continue
+                self.error('%s --> %s/%s/%s' % (
+                    f.name, rpref, self.client.container, rpath))
+                if self['public']:
+                    obj = self.client.get_object_info(rpath)
+                    self.write('%s\n' % obj.get('x-object-public', ''))
+        except KeyboardInterrupt:
+            #  Stop the uploads in flight, then wait for their workers
+            uploads.close()
+            self._wait_for_workers()
+            raise CLIError('Upload canceled by user')
+        if shared.blocks:
+            self.error(
+                'Deduplicated %s of %s blocks (%s of %s), ratio %.2f' % (
+                    shared.blocks - shared.sent_blocks, shared.blocks,
+                    format_size(shared.bytes - shared.sent_bytes),
+                    format_size(shared.bytes), shared.ratio()))
+        self._close_journal(not failed)
+        if failed:
+            raise CLIError(
+                'Failed to upload %s file(s)' % len(failed), details=failed)
+        self.error('Upload completed')
+
     def main(self, local_path, remote_path_or_url=None):
         super(self.__class__, self)._run(remote_path_or_url)
-        if local_path.endswith('.') or local_path.endswith(path.sep):
+        if local_path == '-':
+            if not self.path:
+                raise CLIInvalidArgument(
+                    'Missing destination of the standard input', details=[
+                        'e.g., tar c DIR | kamaki file upload - DIR.tar'])
+            remote_path = self.path
+        elif local_path.endswith('.') or local_path.endswith(path.sep):
             remote_path = self.path or ''
         else:
             remote_path = self.path or path.basename(path.abspath(local_path))
@@ -1211,7 +1342,9 @@ class file_cat(_PithosContainer):
 
 @command(file_cmds)
 class file_download(_PithosContainer):
-    """Download a remove file or directory object to local file system"""
+    """Download a remove file or directory object to local file system
+    Use - as the local path to write a file to the standard output, e.g., a
+    pipe"""
 
     arguments = dict(
         resume=FlagArgument(
@@ -1231,12 +1364,24 @@ class file_download(_PithosContainer):
         object_version=ValueArgument(
             'download a file of a specific version', '--object-version'),
         max_threads=IntArgument('default: 5', '--threads'),
+        max_buffer=DataSizeArgument(
+            'Max memory for blocks in flight or waiting to be written, '
+            'e.g., 256MiB (default: 64MiB)',
+            '--max-buffer'),
         progress_bar=ProgressBarArgument(
             'do not show progress bar', ('-N', '--no-progress-bar'),
             default=False),
         recursive=FlagArgument(
             'Download a remote directory object and its contents',
-            ('-r', '--recursive'))
+            ('-r', '--recursive')),
+        journal=FlagArgument(
+            'Keep a journal of the download, to resume it if interrupted, by '
+            'running the same command again',
+            '--journal'),
+        job_id=ValueArgument(
+            'Keep the journal of the download under this id (implies '
+            '--journal)',
+            '--job-id'),
         )
 
     def _src_dst(self, local_path):
@@ -1285,11 +1430,12 @@ class file_download(_PithosContainer):
                 result = self.client.container_get(
                     prefix=prefix,
                     if_modified_since=self['modified_since_date'],
-                    if_unmodified_since=self['unmodified_since_date'])
+                    if_unmodified_since=self['unmodified_since_date'],
+                    stream=True)
 
                 # Find the final local path for each remote object
                 # [(remote name, final local path),.]
-                for o in result.json:
+                for o in result.iter_json():
                     remote = o['name']
                     # First find the relative path of the object
                     # without the prefix and any leading '/'
@@ -1350,6 +1496,8 @@ class file_download(_PithosContainer):
                         'Use %s to download containers' % parsed_name,
                         '  kamaki file download %s /%s [LOCAL_PATH]' % (
                             parsed_name, self.container)])
+        elif local_path == '-':
+            ret.append((prefix, local_path, None))
         else:
             #  Remote object is just a file
             #  The local path to be stored already exists
@@ -1368,7 +1516,9 @@ class file_download(_PithosContainer):
             ret.append((prefix, local_path, self['resume']))
 
         for r, l, resume in ret:
-            if r:
+            if r and l == '-':
+                yield (r, self._out)
+            elif r:
                 mode = 'rb+' if resume and path.exists(l) else 'wb+'
                 with open(l, mode) as f:
                     yield (r, f)
@@ -1383,6 +1533,10 @@ class file_download(_PithosContainer):
     @errors.Pithos.local_path_download
     def _run(self, local_path):
         self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        if self['max_buffer']:
+            self.client.DOWNLOAD_BUFFER = self['max_buffer']
+        if self._open_journal('download', path.abspath(local_path), self.path):
+            self.arguments['resume'].value = True
         progress_bar = None
         try:
             # From _src_dst():
@@ -1397,7 +1551,8 @@ class file_download(_PithosContainer):
                     continue
                 # Download a file
                 self.error('/%s/%s --> %s' % (
-                    self.container, rpath, output_file.name))
+                    self.container, rpath,
+                    '-' if output_file is self._out else output_file.name))
                 progress_bar, download_cb = self._safe_progress_bar(
                     '  download')
                 self.client.download_object(
@@ -1411,24 +1566,14 @@ class file_download(_PithosContainer):
                     if_modified_since=self['modified_since_date'],
                     if_unmodified_since=self['unmodified_since_date'])
         except KeyboardInterrupt:
-            timeout = 0.5
-            msg = '\n'
-            while activeCount() > 1:
-                msg += 'Wait for %s threads: ' % (activeCount() - 1)
-                self._err.write(msg)
-                for thread in activethreads():
-                    try:
-                        thread.join(timeout)
-                        self._err.write('.' if thread.isAlive() else '*')
-                        self._err.flush()
-                    except RuntimeError:
-                        continue
-                    finally:
-                        msg = '\b' * len(msg)
-                        timeout += 0.1
+            self._wait_for_workers()
             raise CLIError('Download canceled by user')
         finally:
             self._safe_progress_bar_finish(progress_bar)
+        if self.client.resumed_bytes:
+            self.error('Skipped %s of local data downloaded before' % (
+                format_size(self.client.resumed_bytes)))
+        self._close_journal(True)
         self.error('Download completed')
 
     def main(self, remote_path_or_url, local_path=None):
@@ -1439,8 +1584,13 @@ class file_download(_PithosContainer):
         rpath = self.path.rstrip('/').replace('/', path.sep) or self.container
         # If remote path is /pithos/dir1/dir2/ then here we download dir2
         base = path.basename(rpath)
+        if local_path == '-':
+            if self['recursive']:
+                raise CLIInvalidArgument(
+                    'Cannot download a directory to the standard output',
+                    details=['Give a local directory as the destination'])
         # If local_path is not given use current dir
-        if not local_path:
+        elif not local_path:
             local_path = path.join('.', base)
         # existing_dir/ -> existing_dir/base
         elif path.exists(local_path) and path.isdir(local_path):
@@ -92,6 +92,18 @@ DOCUMENTATION['global']['log_token'] = (
 DOCUMENTATION['global']['log_data'] = (
     'show HTTP data (body) in logs (on / off)'),
 DOCUMENTATION['global']['log_pid'] = 'show process id in HTTP logs (on / off)',
+DOCUMENTATION['global']['log_timing'] = (
+    'log HTTP request timings and their percentiles (on / off)'),
+DOCUMENTATION['global']['http_compression'] = (
+    'ask for compressed API responses, e.g., listings (on / off)'),
+DOCUMENTATION['global']['http_cache'] = (
+    'keep GET responses in ~/.kamaki and revalidate them (on / off)'),
+DOCUMENTATION['global']['http_transport'] = (
+    'perform parallel HTTP requests on threads or on a single-threaded event '
+    'loop (threads / eventloop)'),
+DOCUMENTATION['global']['hash_index'] = (
+    'keep the block hashes of uploaded files in ~/.kamaki, to upload them '
+    'again without reading them, unless modified (on / off)'),
 DOCUMENTATION['global']['ignore_ssl'] = (
     'allow insecure HTTP connections (on / off)'),
 DOCUMENTATION['global']['ca_certs'] = (
@@ -144,6 +156,11 @@ DEFAULTS = {
         'log_token': 'off',
         'log_data': 'off',
         'log_pid': 'off',
+        'log_timing': 'off',
+        'http_compression': 'off',
+        'http_cache': 'off',
+        'http_transport': 'threads',
+        'hash_index': 'on',
         'history_file': HISTORY_PATH,
         'history_limit': 0,
         'user_cli': 'astakos',
@@ -67,8 +67,8 @@ class scripts_verifyfs(_PithosAccount, OptionalOutput):
     @errors.Pithos.container
     def _run(self):
         dirs, files, empty_files = [], [], []
-        result = self.client.container_get()
-        for o in result.json:
+        result = self.client.container_get(stream=True)
+        for o in result.iter_json():
             name = o['name']
             if self.object_is_dir(o):
                 dirs.append(name)
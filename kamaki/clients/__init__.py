@@ -33,15 +33,20 @@
 from urllib2 import quote, unquote
 from urlparse import urlparse
 from threading import Thread
+from Queue import Queue
 from json import dumps, loads
 from time import time
 from httplib import ResponseNotReady, HTTPException
 from time import sleep
 from random import random
-from logging import getLogger
+from logging import getLogger, INFO
 import ssl
+import zlib
 
-from kamaki.clients.utils import https
+from kamaki.clients.utils import (
+    https, workers, concurrency, timing, jsonparse)
+from kamaki.clients.utils.workers import (
+    WorkerPool, Future, CancelledError, as_completed)
 
 from kamaki.clients import utils
 
@@ -60,6 +65,14 @@ def _encode(v):
     return v
 
 
+def _limit(controller, limit=None):
+    """:returns: (int) the limit of the controller, or limit if lower. A
+    callable limit is called each time"""
+    if callable(limit):
+        return min(controller.limit, limit())
+    return min(controller.limit, limit or controller.limit)
+
+
 class ClientError(Exception):
     def __init__(self, message, status=0, details=None):
         log.debug('ClientError: msg[%s], sts[%s], dtl[%s]' % (
@@ -109,8 +122,23 @@ class Logged(object):
     LOG_TOKEN = False
     LOG_DATA = False
     LOG_PID = False
+    #  Max bytes of each request or response body to log, if LOG_DATA is set
+    LOG_DATA_LIMIT = 64 * 1024
     _token = None
 
+    def _data_to_log(self, data):
+        """:returns: (str) data without the token, with control characters
+        escaped, truncated to LOG_DATA_LIMIT"""
+        if not isinstance(data, basestring):
+            data = memoryview(data).tobytes()
+        if self._token:
+            data = data.replace(self._token, '...')
+        more = len(data) - self.LOG_DATA_LIMIT
+        if more > 0:
+            return '%s... (%s more)' % (
+                utils.escape_ctrl_chars(data[:self.LOG_DATA_LIMIT]), more)
+        return utils.escape_ctrl_chars(data)
+
 
 class RequestManager(Logged):
     """Handle http request information"""
@@ -149,10 +177,13 @@ class RequestManager(Logged):
             assert isinstance(headers, dict)
         self.headers = dict(headers)
         self.method, self.data = method, data
+        self.sent_at = None
         self.scheme, self.netloc = self._connection_info(url, path, params)
         self._headers_to_quote, self._header_prefices = [], []
 
     def dump_log(self):
+        if not sendlog.isEnabledFor(INFO):
+            return
         plog = ('\t[%s]' % self) if self.LOG_PID else ''
         sendlog.info('%s %s://%s%s%s' % (
             self.method, self.scheme, self.netloc, self.path, plog))
@@ -163,8 +194,7 @@ class RequestManager(Logged):
         if self.data:
             sendlog.info('data size: %s%s' % (len(self.data), plog))
             if self.LOG_DATA:
-                sendlog.info(utils.escape_ctrl_chars(self.data.replace(
-                    self._token, '...') if self._token else self.data))
+                sendlog.info(self._data_to_log(self.data))
         else:
             sendlog.info('data size: 0%s' % plog)
 
@@ -193,6 +223,7 @@ class RequestManager(Logged):
                 url=self.path.encode('utf-8'),
                 headers=self.headers,
                 body=self.data)
+            self.sent_at = time()
             sendlog.info('')
             keep_trying = TIMEOUT
             while keep_trying > 0:
@@ -231,19 +262,95 @@ class RequestManager(Logged):
 class ResponseManager(Logged):
     """Manage the http request and handle the response data, headers, etc."""
 
-    def __init__(self, request, poolsize=None, connection_retry_limit=0):
+    def __init__(
+            self, request,
+            poolsize=None, connection_retry_limit=0, stream=False):
         """
         :param request: (RequestManager)
 
         :param poolsize: (int) the size of the connection pool
 
         :param connection_retry_limit: (int)
+
+        :param stream: (bool) if set, do not read the response body at once.
+            The connection is kept out of the pool until the body is consumed
+            (see iter_content, readinto) or the response is closed
+
+        The outcome of the request is reported to self.controller (a
+        ConcurrencyController), if set. The timing breakdown is kept in
+        self.timing (a RequestTiming) and passed to the timing hooks
+
+        If self.decompress is set, gzip or deflate encoded bodies are
+        decompressed while read
+
+        If self.cache (an HTTPCache) and self.cache_key are set, a stored
+        response is revalidated with a conditional request and served on 304
+
+        If self.transport (an EventLoop) is set, the request is performed on
+        it instead of a pooled connection, and the body is read in memory
+
+        If self.budget (a ConcurrencyController) is set, the request waits
+        for a slot of it, released once the request is performed
         """
         self.CONNECTION_TRY_LIMIT = 1 + connection_retry_limit
         self.request = request
         self._request_performed = False
         self.poolsize = poolsize
+        self.stream = stream
+        self._pooled, self._response, self._bytes_read = None, None, 0
         self._headers_to_decode, self._header_prefices = [], []
+        self.controller, self._started = None, None
+        self.timing, self._timing = None, dict()
+        self._log_on = False
+        self._json = None
+        self.decompress, self._decompressor = False, None
+        self.cache, self.cache_key = None, None
+        self.transport, self._pending = None, None
+        self.budget = None
+        self._cached, self._first_started = None, None
+        self._key_prefices = None
+
+    def _prepare(self):
+        """Set up logging and conditional headers, before the first try"""
+        self._first_started = time()
+        self._log_on = recvlog.isEnabledFor(INFO)
+        self.request.LOG_TOKEN = self.LOG_TOKEN
+        self.request.LOG_DATA = self.LOG_DATA
+        self.request.LOG_PID = self.LOG_PID
+        self._cached = self.cache.get(
+            self.cache_key) if self.cache_key else None
+        if self._cached:
+            if self._cached['etag']:
+                self.request.headers['If-None-Match'] = self._cached['etag']
+            if self._cached['last_modified']:
+                self.request.headers['If-Modified-Since'] = self._cached[
+                    'last_modified']
+
+    def start(self):
+        """Send the request on self.transport, without waiting for the
+        response
+
+        :returns: (Future) of the transport response
+        """
+        if not self._pending:
+            if not self._first_started:
+                self._prepare()
+            self.request.sent_at = None
+            self.request._encode_headers()
+            self.request.dump_log()
+            if self.budget:
+                self.budget.acquire()
+            self._started = time()
+            try:
+                self._pending = self.transport.submit(self.request)
+            except Exception:
+                if self.budget:
+                    self.budget.release()
+                raise
+            if self.budget:
+                self._pending.add_done_callback(
+                    lambda pending, budget=self.budget: budget.release())
+        return self._pending
 
     def _get_headers_to_decode(self, headers):
         keys = set([k.lower() for k, v in headers])
@@ -259,47 +366,104 @@ class ResponseManager(Logged):
     def _get_response(self):
         if self._request_performed:
             return
+        budget = None if self.transport else self.budget
+        if budget:
+            budget.acquire()
+        try:
+            self._perform()
+        finally:
+            if budget:
+                budget.release()
 
+    def _perform(self):
         pool_kw = dict(size=self.poolsize) if self.poolsize else dict()
+        if not self._pending:
+            self._prepare()
+        cached = self._cached
         for retries in range(1, self.CONNECTION_TRY_LIMIT + 1):
+            pooled, acquire_started = None, time()
+            if not self.transport:
+                pooled = https.PooledHTTPConnection(
+                    self.request.netloc, self.request.scheme, **pool_kw)
+                connection = pooled.acquire()
+                self._started = time()
+                self.request.sent_at = None
+            self._timing = dict(
+                first_started=self._first_started, retries=retries - 1,
+                pool_wait=time() - acquire_started)
             try:
-                with https.PooledHTTPConnection(
-                        self.request.netloc, self.request.scheme,
-                        **pool_kw) as connection:
-                    self.request.LOG_TOKEN = self.LOG_TOKEN
-                    self.request.LOG_DATA = self.LOG_DATA
-                    self.request.LOG_PID = self.LOG_PID
+                if self.transport:
+                    r = self._transport_response()
+                    connection = r
+                else:
                     r = self.request.perform(connection)
-                    plog = ''
-                    if self.LOG_PID:
-                        recvlog.info('\n%s <-- %s <-- [req: %s]\n' % (
-                            self, r, self.request))
-                        plog = '\t[%s]' % self
-                    self._request_performed = True
-                    self._status_code, self._status = r.status, unquote(
-                        r.reason)
+                self._timing['headers_at'] = time()
+                self._timing.update(vars(connection).pop('timing', None) or {})
+                if self.transport:
+                    self._started += self._timing['pool_wait']
+                plog = ('\t[%s]' % self) if self.LOG_PID else ''
+                if self._log_on and self.LOG_PID:
+                    recvlog.info('\n%s <-- %s <-- [req: %s]\n' % (
+                        self, r, self.request))
+                self._request_performed = True
+                self._status_code, self._status = r.status, unquote(
+                    r.reason)
+                self._headers = dict()
+
+                r_headers = r.getheaders()
+                enc_headers = self._get_headers_to_decode(r_headers)
+                for k, v in r_headers:
+                    self._headers[k] = unquote(v).decode('utf-8') if (
+                        k.lower()) in enc_headers else v
+                if self._key_prefices:
+                    Client._unquote_header_keys(
+                        self._headers, self._key_prefices)
+                if self._log_on:
                     recvlog.info(
                         '%d %s%s' % (self.status_code, self.status, plog))
-                    self._headers = dict()
-
-                    r_headers = r.getheaders()
-                    enc_headers = self._get_headers_to_decode(r_headers)
                     for k, v in r_headers:
-                        self._headers[k] = unquote(v).decode('utf-8') if (
-                            k.lower()) in enc_headers else v
                         recvlog.info('  %s: %s%s' % (k, v, plog))
+                if cached and r.status == 304:
+                    r.read()
+                    self._status_code, self._status = (
+                        cached['status'], cached['reason'])
+                    self._headers, self._content = (
+                        cached['headers'], cached['body'])
+                    self.cache.hit(self.cache_key)
+                    if self._log_on:
+                        recvlog.info('data size: %s (cached)%s' % (
+                            len(self._content), plog))
+                    self._record(0)
+                    break
+                if self.decompress and r.getheader(
+                        'content-encoding', '').lower() in ('gzip', 'deflate'):
+                    #  Accept gzip or zlib headers
+                    self._decompressor = zlib.decompressobj(
+                        32 + zlib.MAX_WBITS)
+                if self.stream:
+                    #  The body is read on demand, keep the connection
+                    self._pooled, self._response = pooled, r
+                    pooled = None
+                    if self._log_on:
+                        recvlog.info('data size: (streamed)%s' % plog)
+                else:
                     self._content = r.read()
-                    recvlog.info('data size: %s%s' % (
-                        len(self._content) if self._content else 0, plog))
-                    if self.LOG_DATA and self._content:
-                        data = '%s%s' % (self._content, plog)
-                        data = utils.escape_ctrl_chars(data)
-                        if self._token:
-                            data = data.replace(self._token, '...')
-                        recvlog.info(data)
+                    size = len(self._content or '')
+                    if self._decompressor:
+                        self._content = self._decompress(
+                            self._content) + self._decompress('')
+                    self._log_data(self._content)
+                    self._record(size)
+                    if self.cache_key:
+                        self.cache.set(
+                            self.cache_key, self._status_code, self._status,
+                            self._headers, self._content,
+                            r.getheader('etag'), r.getheader('last-modified'))
                 break
             except Exception as err:
+                self._pending = None
                 if isinstance(err, HTTPException):
+                    self._record(0, failed=True)
                     if retries >= self.CONNECTION_TRY_LIMIT:
                         raise ClientError(
                             'Connection to %s failed %s times (%s: %s )' % (
@@ -309,6 +473,163 @@ class ResponseManager(Logged):
                     recvlog.debug(
                         '\n'.join(['%s' % type(err)] + format_stack()))
                     raise
+            finally:
+                if pooled:
+                    pooled.release()
+
+    def unquote_header_keys(self, prefices):
+        """Unquote the keys of the headers that start with prefices, when
+        the response arrives, so that the request is not forced to perform
+
+        :param prefices: (str or tuple of str) lower case key prefices
+        """
+        self._key_prefices = prefices
+        if self._request_performed:
+            Client._unquote_header_keys(self._headers, prefices)
+
+    def _transport_response(self):
+        """:returns: (eventloop.Response) once received"""
+        try:
+            return self.start().result()
+        except ssl.SSLError as ssle:
+            raise KamakiSSLError('SSL Connection error (%s)' % ssle)
+
+    def _log_data(self, data):
+        if not self._log_on:
+            return
+        plog = ('\t[%s]' % self) if self.LOG_PID else ''
+        recvlog.info('data size: %s%s' % (len(data) if data else 0, plog))
+        if self.LOG_DATA and data:
+            recvlog.info('%s%s' % (self._data_to_log(data), plog))
+
+    def _record(self, nbytes, failed=False):
+        """Report the outcome of the request to the concurrency controller
+        and the timing hooks"""
+        now, status = time(), None if failed else self._status_code
+        bytes_out = len(self.request.data or '')
+        if self.controller:
+            self.controller.record(
+                now - self._started, nbytes + bytes_out, status)
+        t = self._timing
+        connecting = sum([t.get(k, 0.0) for k in ('dns', 'connect', 'tls')])
+        sent_at = getattr(self.request, 'sent_at', None) or self._started
+        headers_at = t.get('headers_at', now)
+        self.timing = timing.RequestTiming(
+            self.request.method, self.request.netloc, self.request.path,
+            status=status, bytes_out=bytes_out, bytes_in=nbytes,
+            retries=t.get('retries', 0), pool_wait=t.get('pool_wait', 0.0),
+            dns=t.get('dns', 0.0), connect=t.get('connect', 0.0),
+            tls=t.get('tls', 0.0),
+            send=max(0.0, sent_at - self._started - connecting),
+            ttfb=max(0.0, headers_at - sent_at),
+            transfer=now - headers_at,
+            total=now - t.get('first_started', self._started))
+        timing.emit(self.timing)
+
+    def _release_connection(self, reusable=True):
+        """Return a streaming connection to the pool. If the body was not
+        fully consumed, the connection is closed first, so that it will not
+        be reused with a pending response on it"""
+        pooled, self._pooled, self._response = self._pooled, None, None
+        if pooled:
+            if not reusable:
+                pooled.obj.close()
+            pooled.release()
+
+    def _decompress(self, data, size=0):
+        """Decompress data, keep what exceeds size in the decompressor
+
+        :returns: (str) decompressed data, up to size bytes if size is set
+        """
+        try:
+            return self._decompressor.decompress(data, size) if (
+                data) else self._decompressor.flush()
+        except zlib.error as ze:
+            self.close()
+            raise ClientError('Failed to decompress response (%s)' % ze)
+
+    def _read_compressed(self, size):
+        """:returns: (str) up to size bytes of the decompressed body"""
+        while True:
+            data = self._decompressor.unconsumed_tail
+            if not data:
+                data = self._response.read(size)
+                self._bytes_read += len(data)
+            chunk = self._decompress(data, size)
+            if chunk or not data:
+                return chunk
+
+    def _read_chunk(self, size):
+        """:returns: (str) up to size bytes of the streamed body"""
+        if not self._response:
+            return ''
+        if not size:
+            chunk = ''
+        elif self._decompressor:
+            chunk = self._read_compressed(size)
+        else:
+            chunk = self._response.read(size)
+            self._bytes_read += len(chunk)
+        if size and not chunk:
+            if self._log_on:
+                recvlog.info('data size: %s (streamed)' % self._bytes_read)
+            self._record(self._bytes_read)
+            self._release_connection()
+        return chunk
+
+    def iter_content(self, chunk_size=65536):
+        """Iterate over the response body
+
+        :param chunk_size: (int) max size of each chunk in bytes
+
+        :returns: (generator of str)
+        """
+        self._get_response()
+        if not self.stream:
+            content = self._content or ''
+            for pos in xrange(0, len(content), chunk_size):
+                yield content[pos:pos + chunk_size]
+            return
+        try:
+            chunk = self._read_chunk(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = self._read_chunk(chunk_size)
+        finally:
+            self.close()
+
+    def readinto(self, buf):
+        """Read response body data into a pre-allocated buffer
+
+        :param buf: (bytearray or memoryview) the buffer to fill
+
+        :returns: (int) number of bytes written in buf, 0 means end of body
+        """
+        self._get_response()
+        if not self.stream:
+            content = self._content or ''
+            start = getattr(self, '_content_offset', 0)
+            size = min(len(buf), len(content) - start)
+            buf[:size] = content[start:start + size]
+            self._content_offset = start + size
+            return size
+        size = 0
+        while size < len(buf):
+            chunk = self._read_chunk(len(buf) - size)
+            if not chunk:
+                break
+            buf[size:size + len(chunk)] = chunk
+            size += len(chunk)
+        return size
+
+    def close(self):
+        """Release the connection of a streamed response. Unread data are
+        discarded"""
+        if getattr(self, '_pooled', None):
+            self._release_connection(reusable=False)
+
+    def __del__(self):
+        self.close()
 
     @property
     def status_code(self):
@@ -328,6 +649,9 @@ class ResponseManager(Logged):
     @property
     def content(self):
         self._get_response()
+        if self.stream:
+            self._content = ''.join(self.iter_content())
+            self.stream = False
         return self._content
 
     @property
@@ -335,8 +659,7 @@ class ResponseManager(Logged):
         """
         :returns: (str) content
         """
-        self._get_response()
-        return '%s' % self._content
+        return '%s' % self.content
 
     @property
     def headers_to_decode(self):
@@ -358,12 +681,36 @@ class ResponseManager(Logged):
 
     @property
     def json(self):
-        """
+        """The content is decoded once, the same object is returned on each
+        call, so do not modify it
+
         :returns: (dict) squeezed from json-formated content
         """
-        self._get_response()
+        content = self.content
+        if self._json and self._json[0] is content:
+            return self._json[1]
         try:
-            return loads(self._content)
+            self._json = (content, jsonparse.loads(content))
+        except ValueError as err:
+            raise ClientError('Response not formated in JSON - %s' % err)
+        return self._json[1]
+
+    def iter_json(self, key=None, chunk_size=65536):
+        """Decode a JSON array from the content, one element at a time.
+        For large listings, perform the request with stream=True, so that
+        neither the content nor the decoded array are ever kept in memory
+
+        :param key: (str) if set, the array is the value of key in a JSON
+            object (e.g., "servers")
+
+        :param chunk_size: (int) bytes to read at a time, if streamed
+
+        :returns: (generator) the elements of the array
+        """
+        try:
+            for item in jsonparse.iter_array(
+                    self.iter_content(chunk_size), key):
+                yield item
         except ValueError as err:
             raise ClientError('Response not formated in JSON - %s' % err)
 
@@ -394,7 +741,10 @@ class SilentEvent(Thread):
 
 class Client(Logged):
     service_type = ''
+    MIN_THREADS = 1
     MAX_THREADS = 1
+    #  Ask for gzip/deflate compressed responses (see _accept_compression)
+    ACCEPT_COMPRESSION = False
     DATE_FORMATS = ['%a %b %d %H:%M:%S %Y', ]
     CONNECTION_RETRY_LIMIT = 0
 
@@ -406,6 +756,14 @@ class Client(Logged):
         self.token = token
         self.headers, self.params = dict(), dict()
         self.poolsize = None
+        #  An HTTPCache for GET and HEAD responses, e.g., httpcache.get_cache()
+        self.http_cache = None
+        #  An EventLoop to perform requests on, e.g., eventloop.get_loop()
+        #  If not set, each request keeps a thread busy until it is done
+        self.transport = None
+        #  A ConcurrencyController to keep requests within its limit, e.g.,
+        #  self._concurrency(), when many transfers run in parallel
+        self.budget = None
         self.request_headers_to_quote = []
         self.request_header_prefices_to_quote = []
         self.response_headers = []
@@ -438,36 +796,105 @@ class Client(Logged):
         for old, new in new_keys.items():
             headers[new] = headers.pop(old)
 
-    def _init_thread_limit(self, limit=1):
-        assert isinstance(limit, int) and limit > 0, 'Thread limit not a +int'
-        self._thread_limit = limit
-        self._elapsed_old = 0.0
-        self._elapsed_new = 0.0
-
-    def _watch_thread_limit(self, threadlist):
-        self._thread_limit = getattr(self, '_thread_limit', 1)
-        self._elapsed_new = getattr(self, '_elapsed_new', 0.0)
-        self._elapsed_old = getattr(self, '_elapsed_old', 0.0)
-        recvlog.debug('# running threads: %s' % len(threadlist))
-        if self._elapsed_old and self._elapsed_old >= self._elapsed_new and (
-                self._thread_limit < self.MAX_THREADS):
-            self._thread_limit += 1
-        elif self._elapsed_old <= self._elapsed_new and self._thread_limit > 1:
-            self._thread_limit -= 1
-
-        self._elapsed_old = self._elapsed_new
-        if len(threadlist) >= self._thread_limit:
-            self._elapsed_new = 0.0
-            for thread in threadlist:
-                begin_time = time()
-                thread.join()
-                self._elapsed_new += time() - begin_time
-            self._elapsed_new = self._elapsed_new / len(threadlist)
-            return []
-        return threadlist
+    def _concurrency(self):
+        """:returns: (BoundedController) the ConcurrencyController of the
+        endpoint host, with its limit bounded by MIN_THREADS and
+        MAX_THREADS of this client"""
+        return concurrency.BoundedController(
+            concurrency.get_controller(urlparse(self.endpoint_url).netloc),
+            self.MIN_THREADS, self.MAX_THREADS)
+
+    def _accept_compression(self, method, headers, params):
+        """Whether to ask for a compressed response. Range requests are not
+        compressed, since compression would break offsets
+
+        :returns: (bool)
+        """
+        keys = [k.lower() for k in headers]
+        return self.ACCEPT_COMPRESSION and not (
+            'range' in keys or 'accept-encoding' in keys)
+
+    def _cache_key(self, method, headers, url, stream):
+        """Only plain GET and HEAD requests are cached
+
+        :returns: (str) the http_cache key of a request, None if not cached
+        """
+        if not self.http_cache or stream or (
+                method.upper() not in ('GET', 'HEAD')):
+            return None
+        conditional = ('range', 'if-match', 'if-none-match',
+                       'if-modified-since', 'if-unmodified-since')
+        if [k for k in headers if k.lower() in conditional]:
+            return None
+        return self.http_cache.key(method, url, headers.get('X-Auth-Token'))
+
+    def _async_iter(self, method, kwarg_iter, limit=None):
+        """Run method(**kwargs) on the shared worker pool for each kwargs in
+        kwarg_iter. The number of calls in flight is adjusted by the
+        concurrency controller of the endpoint host, between MIN_THREADS and
+        MAX_THREADS
+
+        :param limit: (int or callable) if set, never run more calls in
+            parallel, e.g., to bound the memory held by calls in flight. If
+            callable, it is called before each call
+
+        :returns: (generator of Future) in completion order
+        """
+        controller = self._concurrency()
+        return workers.get_pool().run(
+            method, kwarg_iter, lambda: _limit(controller, limit))
+
+    def _async_requests(self, method, kwarg_iter, limit=None):
+        """Like _async_iter, for methods that perform a single request and
+        return its ResponseManager, e.g., self.object_get. If self.transport
+        is set, the requests are multiplexed on the event loop, instead of
+        keeping a worker thread busy each. Since the status is checked when
+        the response arrives, the expected status codes should be given in
+        each kwargs (success)
+
+        :param limit: (int or callable) if set, never send more requests in
+            parallel
+
+        :returns: (generator of Future) in completion order, the result of
+            each is a ResponseManager
+        """
+        if not self.transport:
+            return self._async_iter(method, kwarg_iter, limit)
+        return self._pipeline(method, kwarg_iter, limit)
+
+    def _pipeline(self, method, kwarg_iter, limit=None):
+        controller = self._concurrency()
+        completed, flying = Queue(), set()
+        kwarg_iter, index = iter(kwarg_iter), 0
+        try:
+            while True:
+                while kwarg_iter and len(flying) < max(
+                        1, _limit(controller, limit)):
+                    try:
+                        kwargs = next(kwarg_iter)
+                    except StopIteration:
+                        kwarg_iter = None
+                        break
+                    r = method(**dict(kwargs, success=None))
+                    future = Future(
+                        self._raise_for_status, r, kwargs.get('success', 200))
+                    future.index, index = index, index + 1
+                    flying.add(future)
+                    r.start().add_done_callback(
+                        lambda pending, future=future: completed.put(future))
+                if not flying:
+                    break
+                future = completed.get(True, workers._FOREVER)
+                flying.discard(future)
+                #  The response is processed on this thread, not on the loop
+                future._run()
+                yield future
+        finally:
+            for future in flying:
+                future.args[0].start().cancel()
 
     def async_run(self, method, kwarg_list):
-        """Fire threads of operations
+        """Run operations in parallel
 
         :param method: the method to run in each thread
 
@@ -477,29 +904,10 @@ class Client(Logged):
         :returns: (list) the results of each method call w.r. to the order of
             kwarg_list
         """
-        flying, results = {}, {}
-        self._init_thread_limit()
-        for index, kwargs in enumerate(kwarg_list):
-            self._watch_thread_limit(flying.values())
-            flying[index] = SilentEvent(method=method, **kwargs)
-            flying[index].start()
-            unfinished = {}
-            for key, thread in flying.items():
-                if thread.isAlive():
-                    unfinished[key] = thread
-                elif thread.exception:
-                    raise thread.exception
-                else:
-                    results[key] = thread.value
-            flying = unfinished
-        sendlog.info('- - - wait for threads to finish')
-        for key, thread in flying.items():
-            if thread.isAlive():
-                thread.join()
-            if thread.exception:
-                raise thread.exception
-            results[key] = thread.value
-        return results.values()
+        results = dict()
+        for future in self._async_iter(method, kwarg_list):
+            results[future.index] = future.result()
+        return [results[i] for i in sorted(results)]
 
     def set_header(self, name, value, iff=True):
         """Set a header 'name':'value'"""
@@ -519,6 +927,8 @@ class Client(Logged):
         These classes perform a lazy http request. Present method, by default,
         enforces them to perform the http call. Hint: call present method with
         success=None to get a non-performed ResponseManager object.
+        Call with stream=True to get a response with a body that is read on
+        demand (see ResponseManager.iter_content and readinto).
         """
         assert isinstance(method, str) or isinstance(method, unicode)
         assert method
@@ -529,6 +939,7 @@ class Client(Logged):
             params = dict(self.params)
             params.update(async_params)
             success = kwargs.pop('success', 200)
+            stream = kwargs.pop('stream', False)
             data = kwargs.pop('data', None)
             headers.setdefault('X-Auth-Token', self.token)
             if 'json' in kwargs:
@@ -536,6 +947,9 @@ class Client(Logged):
                 headers.setdefault('Content-Type', 'application/json')
             if data:
                 headers.setdefault('Content-Length', '%s' % len(data))
+            decompress = self._accept_compression(method, headers, params)
+            if decompress:
+                headers['Accept-Encoding'] = 'gzip, deflate'
             plog = ('\t[%s]' % self) if self.LOG_PID else ''
             sendlog.debug('\n\nCMT %s@%s%s', method, self.endpoint_url, plog)
             req = RequestManager(
@@ -547,28 +961,51 @@ class Client(Logged):
             r = ResponseManager(
                 req,
                 poolsize=self.poolsize,
-                connection_retry_limit=self.CONNECTION_RETRY_LIMIT)
+                connection_retry_limit=self.CONNECTION_RETRY_LIMIT,
+                stream=stream)
             r.headers_to_decode = self.response_headers
             r.header_prefices = self.response_header_prefices
             r.LOG_TOKEN, r.LOG_DATA, r.LOG_PID = (
                 self.LOG_TOKEN, self.LOG_DATA, self.LOG_PID)
             r._token = headers['X-Auth-Token']
+            r.controller = self._concurrency()
+            r.decompress = decompress
+            r.transport = self.transport
+            r.budget = self.budget
+            if self.http_cache:
+                r.cache_key = self._cache_key(
+                    method, headers, req.url, stream)
+                r.cache = self.http_cache if r.cache_key else None
         finally:
             self.headers = dict()
             self.params = dict()
 
         if success is not None:
-            # Success can either be an int or a collection
-            success = (success,) if isinstance(success, int) else success
-            if r.status_code not in success:
-                log.debug(u'Client caught error %s (%s)' % (r, type(r)))
-                status_msg = getattr(r, 'status', '')
-                try:
-                    message = u'%s %s\n' % (status_msg, r.text)
-                except:
-                    message = u'%s %s\n' % (status_msg, r)
-                status = getattr(r, 'status_code', getattr(r, 'status', 0))
-                raise ClientError(message, status=status)
+            self._raise_for_status(r, success)
+        return r
+
+    @staticmethod
+    def _raise_for_status(r, success):
+        """
+        :param r: (ResponseManager)
+
+        :param success: (int or collection of int) the expected status codes
+
+        :returns: (ResponseManager) r
+
+        :raises ClientError: if the response status is not expected
+        """
+        # Success can either be an int or a collection
+        success = (success,) if isinstance(success, int) else success
+        if r.status_code not in success:
+            log.debug(u'Client caught error %s (%s)' % (r, type(r)))
+            status_msg = getattr(r, 'status', '')
+            try:
+                message = u'%s %s\n' % (status_msg, r.text)
+            except:
+                message = u'%s %s\n' % (status_msg, r)
+            status = getattr(r, 'status_code', getattr(r, 'status', 0))
+            raise ClientError(message, status=status)
         return r
 
     def delete(self, path, **kwargs):
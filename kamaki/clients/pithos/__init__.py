@@ -31,25 +31,30 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
-from threading import enumerate as activethreads
-
-from os import fstat
-from hashlib import new as newhashlib
+from os import fstat, fsync
+from copy import copy
+from threading import Event
+from stat import S_ISREG
 from time import time
 from StringIO import StringIO
+from functools import partial
+from itertools import chain, islice
 
-from binascii import hexlify
-
-from kamaki.clients import SilentEvent, sendlog
+from kamaki.clients import sendlog
 from kamaki.clients.pithos.rest_api import PithosRestClient
+from kamaki.clients.pithos.hashing import (
+    BlockHasher, block_hash, zero_block_hash)
+from kamaki.clients.pithos.journal import digest
+from kamaki.clients.pithos.ranges import (
+    RangePlanner, range_header, iter_byteranges, cut)
 from kamaki.clients.storage import ClientError
-from kamaki.clients.utils import path4url, filter_in, readall
+from kamaki.clients.utils import path4url, filter_in, readall, readinto
+from kamaki.clients.utils import workers
+from kamaki.clients.utils.buffers import get_pool as get_buffers
 
 
 def _pithos_hash(block, blockhash):
-    h = newhashlib(blockhash)
-    h.update(block.rstrip('\x00'))
-    return h.hexdigest()
+    return block_hash(block, blockhash)
 
 
 def _range_up(start, end, max_value, a_range):
@@ -99,12 +104,64 @@ def _range_up(start, end, max_value, a_range):
     return ','.join(selected)
 
 
+class _PrefixedFile(object):
+    """Read data that was read from a file before, then the rest of the
+    file"""
+
+    def __init__(self, prefix, fileobj):
+        self.prefix, self.fileobj = prefix, fileobj
+
+    def read(self, size):
+        if self.prefix:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+            return data
+        return self.fileobj.read(size)
+
+
 class PithosClient(PithosRestClient):
     """Synnefo Pithos+ API client"""
 
+    #  Parallel block hashers for uploads and resumed downloads, 0 means one
+    #  per CPU
+    HASH_WORKERS = 0
+    #  Hash in worker processes instead of threads
+    HASH_PROCESSES = False
+    #  Upload blocks while hashing: True, False or None to decide per upload
+    UPLOAD_PIPELINE = None
+    #  Blocks hashed to decide whether to pipeline an upload
+    PIPELINE_PROBE_BLOCKS = 4
+    #  Max bytes of blocks in flight in a pipelined upload
+    PIPELINE_WINDOW = 64 * 1024 * 1024
+    #  Max bytes of blocks uploaded with one POST, 0 for a block per POST
+    BLOCK_BATCH_SIZE = 4 * 1024 * 1024
+    #  Objects up to this size are uploaded with a single data PUT, 0 for never
+    SMALL_OBJECT_SIZE = 4 * 1024 * 1024
+    #  Max bytes of blocks fetched with one GET, less if requests are fast
+    #  (see ranges.RangePlanner), 0 for a block per GET
+    GET_BATCH_SIZE = 4 * 1024 * 1024
+    #  Max bytes of downloaded blocks in flight or waiting to be written
+    DOWNLOAD_BUFFER = 64 * 1024 * 1024
+    #  Max blocks in flight or waiting for earlier ones, when a download is
+    #  written in order to a pipe or another sink that cannot seek
+    STREAM_WINDOW = 16
+    #  Seconds between journal checkpoints of a download, which sync the
+    #  local file to disk
+    JOURNAL_INTERVAL = 2.0
+
     def __init__(self, endpoint_url, token, account=None, container=None):
         super(PithosClient, self).__init__(
             endpoint_url, token, account, container)
+        #  A HashIndex of uploaded files, e.g., hashindex.get_index()
+        self.hash_index = None
+        #  The SharedBlocks of a batch of uploads, e.g., dedup.SharedBlocks()
+        self.shared_blocks = None
+        #  The TransferJournal of a job, e.g., journal.TransferJournal.open(id)
+        self.journal = None
+        #  Bytes of local files found downloaded before, by resumed downloads
+        self.resumed_bytes = 0
+        #  A threading.Event, set to stop the uploads of the client, e.g., by
+        #  upload_objects if interrupted
+        self.cancel = None
 
     def create_container(
             self,
@@ -243,19 +300,131 @@ class PithosClient(PithosRestClient):
         return r.headers
 
     # upload_* auxiliary methods
-    def _put_block_async(self, data, hash):
-        event = SilentEvent(method=self._put_block, data=data, hash=hash)
-        event.start()
-        return event
-
-    def _put_block(self, data, hash):
-        r = self.container_post(
-            update=True,
-            content_type='application/octet-stream',
-            content_length=len(data),
-            data=data,
-            format='json')
-        assert r.json[0] == hash, 'Local hash does not match server'
+    def _batch_blocks(self, blocks, blocksize=None):
+        """Group consecutive blocks in batches of up to BLOCK_BATCH_SIZE
+        bytes. The server splits the data of a POST in blocks of blocksize
+        bytes, so only the last block of a batch may be shorter
+
+        :param blocks: (iterable of (hash, data))
+
+        :param blocksize: (int) the container block size, if not given each
+            block is a batch
+
+        :returns: (generator of lists of (hash, data))
+        """
+        budget = self.BLOCK_BATCH_SIZE if blocksize else 0
+        batch, size = [], 0
+        for hash, data in blocks:
+            if batch and size + len(data) > budget:
+                yield batch
+                batch, size = [], 0
+            batch.append((hash, data))
+            size += len(data)
+            if size >= budget or len(data) != blocksize:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _check_cancel(self):
+        """:raises ClientError: if self.cancel is set"""
+        if self.cancel is not None and self.cancel.is_set():
+            raise ClientError('Upload canceled')
+
+    def _put_blocks(self, blocks, limit=None, blocksize=None):
+        """Upload blocks in parallel and check the hashes returned. If
+        blocksize is given, consecutive blocks are sent in batches (see
+        _batch_blocks). If the server rejects a batch, its blocks are sent
+        one by one and batches are not used again by this client.
+
+        The data of a batch are copied in a pooled buffer, recycled when the
+        batch is uploaded. The data of blocks are not copied, so they must
+        not change until their hash is yielded back. Each POST is prepared
+        on a clone of the client (see _clone), since they run in parallel.
+        No more POSTs are sent once self.cancel is set.
+
+        :param blocks: (iterable of (hash, data)) data may be a str or a
+            memoryview
+
+        :param limit: (int) max requests in flight, default is set by the
+            concurrency controller
+
+        :param blocksize: (int) the container block size
+
+        :returns: (generator of (str, bool)) the hash of each block and
+            whether the upload failed, in completion order
+        """
+        batches, rejected = [], []
+
+        def requests():
+            for batch in self._batch_blocks(blocks, blocksize):
+                self._check_cancel()
+                buf, data = None, batch[0][1]
+                if len(batch) > 1:
+                    buf, size = get_buffers(self.BLOCK_BATCH_SIZE).get(), 0
+                    for hash, block in batch:
+                        buf[size:size + len(block)] = block
+                        size += len(block)
+                    data = memoryview(buf)[:size]
+                batches.append((batch, buf))
+                yield dict(
+                    update=True,
+                    content_type='application/octet-stream',
+                    content_length=len(data),
+                    data=data,
+                    format='json',
+                    success=202)
+
+        for future in self._async_requests(
+                lambda **kwargs: self._clone().container_post(**kwargs),
+                requests(), limit):
+            (batch, buf), batches[future.index] = batches[future.index], None
+            if buf:
+                get_buffers(len(buf)).put(buf)
+            try:
+                returned = future.result().json
+                assert len(returned) == len(batch), 'Got %s hashes' % len(
+                    returned)
+            except Exception as e:
+                sendlog.debug('Failed to upload %s block(s) %s: %s' % (
+                    len(batch), batch[0][0], e))
+                if len(batch) > 1:
+                    rejected += batch
+                    continue
+                returned = [None]
+            for (hash, data), remote in zip(batch, returned):
+                yield hash, remote != hash
+        if rejected:
+            sendlog.info('Batch upload failed, upload blocks one by one')
+            self.BLOCK_BATCH_SIZE = 0
+            for hash, failed in self._put_blocks(rejected, limit):
+                yield hash, failed
+
+    def _claim_block(self, hash, size, claims, skipped, in_flight=True):
+        """Claim a block in shared_blocks, if set
+
+        :returns: (bool) True if the block must be uploaded, else it is added
+            to skipped
+        """
+        if self.shared_blocks is None or self.shared_blocks.claim(
+                hash, size, claims, in_flight):
+            return True
+        skipped.append(hash)
+        return False
+
+    def _put_claimed_blocks(self, blocks, claims, limit=None, blocksize=None):
+        """Upload blocks with _put_blocks and report them to shared_blocks,
+        if set. Claims not reported when this generator exits (e.g., on
+        errors) are released, so that other uploads do not wait for them"""
+        shared = self.shared_blocks
+        try:
+            for hash, failed in self._put_blocks(blocks, limit, blocksize):
+                if shared:
+                    shared.done(hash, claims, failed)
+                yield hash, failed
+        finally:
+            if shared:
+                shared.release(claims)
 
     def _get_file_block_info(self, fileobj, size=None, cache=None):
         """
@@ -308,70 +477,323 @@ class PithosClient(PithosRestClient):
             success=success)
         return (None if r.status_code == 201 else r.json), r.headers
 
+    @staticmethod
+    def _regular_file_size(fileobj):
+        """:returns: (int) the size of fileobj if it is a regular file, else
+        None (e.g., pipes and sockets)"""
+        try:
+            st = fstat(fileobj.fileno())
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+        return st.st_size if S_ISREG(st.st_mode) else None
+
+    def _small_object_size(self, fileobj, size=None):
+        """:returns: (int) the size of the data to upload, if small enough to
+        upload with a single PUT, otherwise None"""
+        if not self.SMALL_OBJECT_SIZE:
+            return None
+        if size is None:
+            size = self._regular_file_size(fileobj)
+            if size is None:
+                return None
+        return size if size <= self.SMALL_OBJECT_SIZE else None
+
+    def _put_small_object(
+            self, obj, data,
+            hash_cb=None,
+            upload_cb=None,
+            etag=None,
+            if_etag_match=None,
+            if_not_exist=None,
+            content_encoding=None,
+            content_disposition=None,
+            content_type=None,
+            sharing=None,
+            public=None):
+        """Upload an object with a single PUT, without its hashmap, so that
+        container info is not needed and there is one round trip
+
+        :returns: (dict) response headers
+        """
+        r = self.object_put(
+            obj,
+            data=data,
+            content_type=content_type or 'application/octet-stream',
+            content_encoding=content_encoding,
+            content_disposition=content_disposition,
+            if_etag_match=if_etag_match,
+            if_etag_not_match='*' if if_not_exist else None,
+            etag=etag,
+            permissions=sharing,
+            public=public,
+            success=201)
+        for cb in (hash_cb, upload_cb):
+            if cb:
+                try:
+                    gen = cb(1)
+                    gen.next()
+                    gen.next()
+                except:
+                    sendlog.debug('Progress bar failure')
+        return r.headers
+
+    def _hash_index_key(self, fileobj, size, blocksize, blockhash):
+        """:returns: (str) the hash_index key of fileobj, if it is read from
+        the start, otherwise None"""
+        if self.hash_index and size:
+            try:
+                if fileobj.tell() == 0:
+                    return self.hash_index.key(
+                        fileobj, size, blocksize, blockhash)
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+        return None
+
     def _calculate_blocks_for_upload(
             self, blocksize, blockhash, size, nblocks, hashes, hmap, fileobj,
-            hash_cb=None):
+            hash_cb=None, blocks=None, key=None):
+        """:param blocks: (iterable of (hash, offset, bytes, buffer)) the
+        BlockHasher.iter_blocks of fileobj, if reading has started (see
+        _pipeline_upload), and then key is the hash_index key of fileobj
+        """
         offset = 0
         if hash_cb:
             hash_gen = hash_cb(nblocks)
             hash_gen.next()
 
-        for i in xrange(nblocks):
-            block = readall(fileobj, min(blocksize, size - offset))
-            bytes = len(block)
-            if bytes <= 0:
-                break
-            hash = _pithos_hash(block, blockhash)
-            hashes.append(hash)
-            hmap[hash] = (offset, bytes)
-            offset += bytes
-            if hash_cb:
-                hash_gen.next()
+        indexed = None
+        if blocks is None:
+            key = self._hash_index_key(fileobj, size, blocksize, blockhash)
+            indexed = self.hash_index.get(key) if key else None
+        if indexed and len(indexed) == nblocks:
+            for hash in indexed:
+                bytes = min(blocksize, size - offset)
+                hashes.append(hash)
+                hmap[hash] = (offset, bytes)
+                offset += bytes
+                if hash_cb:
+                    hash_gen.next()
+            fileobj.seek(offset)
+        else:
+            if blocks is None:
+                hasher = BlockHasher(
+                    blocksize, blockhash,
+                    workers=self.HASH_WORKERS, processes=self.HASH_PROCESSES)
+                blocks = (block + (None, ) for block in hasher.iter_hashes(
+                    fileobj, size))
+            pool = get_buffers(blocksize)
+            for hash, offset, bytes, buf in blocks:
+                if buf is not None:
+                    pool.put(buf)
+                self._check_cancel()
+                hashes.append(hash)
+                hmap[hash] = (offset, bytes)
+                offset += bytes
+                if hash_cb:
+                    hash_gen.next()
+            if key and offset == size and key == self.hash_index.key(
+                    fileobj, size, blocksize, blockhash):
+                self.hash_index.set(key, hashes[-nblocks:])
         msg = ('Failed to calculate uploading blocks: '
                'read bytes(%s) != requested size (%s)' % (offset, size))
         assert offset == size, msg
 
-    def _upload_missing_blocks(self, missing, hmap, fileobj, upload_gen=None):
-        """upload missing blocks asynchronously"""
-
-        self._init_thread_limit()
+    def _pipeline_upload(
+            self, obj, fileobj, blocksize, blockhash, size, nblocks):
+        """Decide whether to upload blocks while hashing them: only if the
+        file has to be hashed and the server seems to miss most of its
+        blocks. The first blocks are hashed and looked up in the hashmap of
+        the existing object, if any, which is usually an older version of
+        the file. This costs a round trip, but saves uploading the blocks of
+        a file uploaded again (see bench/upload_pipeline.py)
+
+        :returns: (bool, dict) whether to pipeline and, if blocks were read
+            to decide, the blocks and key arguments of _upload_pipelined and
+            _calculate_blocks_for_upload, so that the blocks are not read again
+        """
+        if self.UPLOAD_PIPELINE is not None:
+            return self.UPLOAD_PIPELINE, dict()
+        if nblocks < 2:
+            return False, dict()
+        key = self._hash_index_key(fileobj, size, blocksize, blockhash)
+        if key and self.hash_index.get(key):
+            return False, dict()
+        blocks = BlockHasher(
+            blocksize, blockhash,
+            workers=self.HASH_WORKERS,
+            processes=self.HASH_PROCESSES).iter_blocks(fileobj, size)
+        sample = list(islice(blocks, self.PIPELINE_PROBE_BLOCKS))
+        try:
+            remote = set(self.get_object_hashmap(obj).get('hashes', []))
+        except ClientError as ce:
+            if ce.status != 404:
+                raise
+            remote = set()
+        found = len([block for block in sample if block[0] in remote])
+        sendlog.info('%s of %s probe blocks exist in %s' % (
+            found, len(sample), obj))
+        return 2 * found < len(sample), dict(
+            blocks=chain(sample, blocks), key=key)
+
+    def _upload_pipelined(
+            self, blocksize, blockhash, size, nblocks, hashes, hmap, fileobj,
+            hash_cb=None, upload_gen=None, blocks=None, key=None):
+        """Hash blocks and upload them as soon as they are read, while at
+        most PIPELINE_WINDOW bytes are in flight. Blocks repeated in the
+        file are uploaded once.
+
+        If size is None, fileobj is read once, until EOF, e.g., a pipe, so
+        failed blocks are kept in memory and uploaded again here. Otherwise,
+        they are left to the caller.
+
+        Blocks are read in pooled buffers and hashed in parallel (see
+        BlockHasher.iter_blocks), and the buffers are recycled when the blocks
+        are uploaded. Blocks of shared_blocks are skipped, except blocks in
+        flight if size is None. Skipped blocks are waited for at the end,
+        and sent if the upload they were left to failed.
+
+        :param blocks: (iterable of (hash, offset, bytes, buffer)) the
+            BlockHasher.iter_blocks of fileobj, if reading has started (see
+            _pipeline_upload), and then key is the hash_index key of fileobj
+
+        :returns: (int) the number of bytes read
+        """
+        read, unsent, owners = [0], dict(), dict()
+        claims, skipped = set(), []
+        pool = get_buffers(blocksize)
+        if blocks is None:
+            key = self._hash_index_key(fileobj, size, blocksize, blockhash)
+            blocks = BlockHasher(
+                blocksize, blockhash,
+                workers=self.HASH_WORKERS,
+                processes=self.HASH_PROCESSES).iter_blocks(fileobj, size)
+        if hash_cb:
+            hash_gen = hash_cb(nblocks)
+            hash_gen.next()
 
-        flying = []
-        failures = []
-        for hash in missing:
-            offset, bytes = hmap[hash]
-            fileobj.seek(offset)
-            data = readall(fileobj, bytes)
-            r = self._put_block_async(data, hash)
-            flying.append(r)
-            unfinished = self._watch_thread_limit(flying)
-            for thread in set(flying).difference(unfinished):
-                if thread.exception:
-                    failures.append(thread)
-                    if isinstance(
-                            thread.exception,
-                            ClientError) and thread.exception.status == 502:
-                        self.POOLSIZE = self._thread_limit
-                elif thread.isAlive():
-                    flying.append(thread)
-                elif upload_gen:
+        def release(hash):
+            buf = owners.pop(hash, None)
+            if buf is not None:
+                pool.put(buf)
+
+        def fresh_blocks():
+            for hash, offset, bytes, buf in blocks:
+                self._check_cancel()
+                hashes.append(hash)
+                fresh = hash not in hmap
+                hmap[hash] = (offset, bytes)
+                read[0] += bytes
+                if hash_cb:
+                    hash_gen.next()
+                if fresh and self._claim_block(
+                        hash, bytes, claims, skipped, size is not None):
+                    block, owners[hash] = memoryview(buf)[:bytes], buf
+                    if size is None:
+                        unsent[hash] = block
+                    yield hash, block
+                else:
+                    pool.put(buf)
+
+        def upload(blocks):
+            failures = []
+            for hash, failed in self._put_claimed_blocks(
+                    blocks, claims,
+                    max(1, self.PIPELINE_WINDOW // max(
+                        blocksize, self.BLOCK_BATCH_SIZE)),
+                    blocksize):
+                if failed:
+                    failures.append(hash)
+                    if size is not None:
+                        release(hash)
+                    continue
+                unsent.pop(hash, None)
+                release(hash)
+                if upload_gen:
                     try:
                         upload_gen.next()
                     except:
                         pass
-            flying = unfinished
+            return failures
+
+        failures, retries = upload(fresh_blocks()), 7
+        while unsent and retries:
+            sendlog.info('%s blocks missing' % len(failures))
+            num_of_blocks = len(failures)
+            failures = upload([(hash, unsent[hash]) for hash in failures])
+            if num_of_blocks == len(failures):
+                retries -= 1
+        if unsent:
+            raise ClientError('%s blocks failed to upload' % len(unsent))
+        if size is not None:
+            msg = ('Failed to calculate uploading blocks: '
+                   'read bytes(%s) != requested size (%s)' % (read[0], size))
+            assert read[0] == size, msg
+        if key and key == self.hash_index.key(
+                fileobj, size, blocksize, blockhash):
+            self.hash_index.set(key, hashes[-nblocks:])
+        #  Blocks left to uploads which failed are claimed and sent here
+        lost = [hash for hash in skipped if not self.shared_blocks.wait(hash)]
+        retries = 7
+        while lost and retries:
+            sendlog.info('%s shared blocks missing' % len(lost))
+            num_of_blocks = len(lost)
+            lost = self._upload_missing_blocks(
+                lost, hmap, fileobj, blocksize=blocksize, claims=claims)
+            if num_of_blocks == len(lost):
+                retries -= 1
+        if lost:
+            raise ClientError('%s blocks failed to upload' % len(lost))
+        if upload_gen:
+            for i in range(len(hashes) - len(hmap) + len(skipped)):
+                try:
+                    upload_gen.next()
+                except:
+                    break
+        return read[0]
+
+    def _upload_missing_blocks(
+            self, missing, hmap, fileobj, upload_gen=None, blocksize=None,
+            claims=None):
+        """upload missing blocks asynchronously, in batches if blocksize is
+        given. Blocks are read in pooled buffers, recycled when they are
+        uploaded. Blocks of shared_blocks are not read, but waited for. If
+        the upload claimed blocks before, claims is the set it claimed them
+        with, so that they are not counted again"""
+        pool, owners = get_buffers(blocksize) if blocksize else None, dict()
+        claims, skipped = set() if claims is None else claims, []
+
+        def blocks():
+            for hash in missing:
+                offset, bytes = hmap[hash]
+                if not self._claim_block(hash, bytes, claims, skipped):
+                    continue
+                buf = pool.get() if pool else bytearray(bytes)
+                fileobj.seek(offset)
+                owners[hash] = buf
+                yield hash, memoryview(buf)[:readinto(fileobj, buf, bytes)]
 
-        for thread in flying:
-            thread.join()
-            if thread.exception:
-                failures.append(thread)
+        failures = []
+        for hash, failed in self._put_claimed_blocks(
+                blocks(), claims, blocksize=blocksize):
+            buf = owners.pop(hash, None)
+            if pool and buf is not None:
+                pool.put(buf)
+            if failed:
+                failures.append(hash)
             elif upload_gen:
                 try:
                     upload_gen.next()
                 except:
                     pass
-
-        return [failure.kwargs['hash'] for failure in failures]
+        for hash in skipped:
+            if not self.shared_blocks.wait(hash):
+                failures.append(hash)
+            elif upload_gen:
+                try:
+                    upload_gen.next()
+                except:
+                    pass
+        return failures
 
     def upload_object(
             self, obj, f,
@@ -387,7 +809,10 @@ class PithosClient(PithosRestClient):
             sharing=None,
             public=None,
             container_info_cache=None):
-        """Upload an object using multiple connections (threads)
+        """Upload an object using multiple connections (threads). Objects up
+        to SMALL_OBJECT_SIZE bytes are uploaded with a single PUT instead.
+        If size is not given and f is not a regular file (e.g., a pipe), f is
+        read once, until EOF, and its blocks are uploaded while read.
 
         :param obj: (str) remote object path
 
@@ -423,18 +848,69 @@ class PithosClient(PithosRestClient):
         """
         self._assert_container()
 
-        block_info = (
-            blocksize, blockhash, size, nblocks) = self._get_file_block_info(
-                f, size, container_info_cache)
+        data, small = None, self._small_object_size(f, size)
+        stream = size is None and self._regular_file_size(f) is None
+        if stream and self.SMALL_OBJECT_SIZE:
+            head = readall(f, self.SMALL_OBJECT_SIZE + 1)
+            if len(head) <= self.SMALL_OBJECT_SIZE:
+                data = head
+            else:
+                f = _PrefixedFile(head, f)
+        elif small is not None:
+            data = readall(f, small)
+            msg = ('Failed to read object data: read bytes(%s) != '
+                   'requested size (%s)' % (len(data), small))
+            assert len(data) == small, msg
+        if data is not None:
+            return self._put_small_object(
+                obj, data,
+                hash_cb=hash_cb,
+                upload_cb=upload_cb,
+                etag=etag,
+                if_etag_match=if_etag_match,
+                if_not_exist=if_not_exist,
+                content_encoding=content_encoding,
+                content_disposition=content_disposition,
+                content_type=content_type,
+                sharing=sharing,
+                public=public)
+
+        if stream:
+            blocksize, blockhash = self._get_file_block_info(
+                f, 0, container_info_cache)[:2]
+            block_info = (blocksize, blockhash, None, None)
+            hash_cb = upload_cb = None
+        else:
+            block_info = (
+                blocksize, blockhash, size,
+                nblocks) = self._get_file_block_info(
+                    f, size, container_info_cache)
         (hashes, hmap, offset) = ([], {}, 0)
         content_type = content_type or 'application/octet-stream'
 
-        self._calculate_blocks_for_upload(
-            *block_info,
-            hashes=hashes,
-            hmap=hmap,
-            fileobj=f,
-            hash_cb=hash_cb)
+        upload_gen, pipeline, probe = None, True, dict()
+        if not stream:
+            pipeline, probe = self._pipeline_upload(obj, f, *block_info)
+        if pipeline:
+            if upload_cb:
+                upload_gen = upload_cb(nblocks)
+                upload_gen.next()
+            size = self._upload_pipelined(
+                *block_info,
+                hashes=hashes,
+                hmap=hmap,
+                fileobj=f,
+                hash_cb=hash_cb,
+                upload_gen=upload_gen,
+                **probe)
+        else:
+            self._calculate_blocks_for_upload(
+                *block_info,
+                hashes=hashes,
+                hmap=hmap,
+                fileobj=f,
+                hash_cb=hash_cb,
+                **probe)
 
         hashmap = dict(bytes=size, hashes=hashes)
         missing, obj_headers = self._create_object_or_get_missing_hashes(
@@ -450,8 +926,12 @@ class PithosClient(PithosRestClient):
 
         if missing is None:
             return obj_headers
+        if stream:
+            raise ClientError(
+                '%s blocks are missing, but the source cannot be read '
+                'again' % len(missing))
 
-        if upload_cb:
+        if upload_cb and not upload_gen:
             upload_gen = upload_cb(len(hashmap['hashes']))
             for i in range(len(hashmap['hashes']) + 1 - len(missing)):
                 try:
@@ -459,15 +939,13 @@ class PithosClient(PithosRestClient):
                 except:
                     sendlog.debug('Progress bar failure')
                     break
-        else:
-            upload_gen = None
 
-        retries = 7
+        retries, claims = 7, set()
         while retries:
             sendlog.info('%s blocks missing' % len(missing))
             num_of_blocks = len(missing)
             missing = self._upload_missing_blocks(
-                missing, hmap, f, upload_gen)
+                missing, hmap, f, upload_gen, blocksize, claims)
             if missing:
                 if num_of_blocks == len(missing):
                     retries -= 1
@@ -499,6 +977,103 @@ class PithosClient(PithosRestClient):
             success=201)
         return r.headers
 
+    def _clone(self):
+        """:returns: (PithosClient) a copy of self with its own request
+        headers and params, so that requests are prepared in parallel"""
+        client = copy(self)
+        client.headers, client.params = dict(), dict()
+        return client
+
+    def _get_block(self, obj, **kwargs):
+        """GET a range of obj on a clone of the client (see _clone), since
+        the GETs of a download run in parallel
+
+        :returns: (ResponseManager)
+        """
+        return self._clone().object_get(obj, **kwargs)
+
+    def _journal_name(self, direction, obj):
+        """:returns: (str) the name of a transfer in the journal"""
+        return '%s /%s/%s/%s' % (direction, self.account, self.container, obj)
+
+    def create_directories(self, objects):
+        """Create many directory objects, in parallel
+
+        :param objects: (iterable of str) directory object paths
+
+        :raises ClientError: the first failure, if any
+        """
+        self._assert_container()
+        for future in self._async_requests(
+                lambda **kwargs: self._clone().object_put(**kwargs),
+                (dict(
+                    obj=obj,
+                    content_type='application/directory',
+                    content_length=0,
+                    success=201) for obj in objects)):
+            future.result()
+
+    def upload_objects(self, sources, retries=2):
+        """Upload many objects in parallel, e.g., the files of a directory.
+        The requests of all uploads share the concurrency limit of the
+        endpoint host as a budget, so that small objects are uploaded while
+        blocks of large ones are in flight. A failed upload is retried from
+        the start of its file and then reported, without stopping the others.
+
+        :param sources: (iterable of (file, str, dict)) open files, object
+            paths and keyword arguments of upload_object (e.g., content_type),
+            consumed lazily
+
+        :param retries: (int) times to retry a failed upload
+
+        :returns: (generator of (file, str, dict or Exception)) each source
+            with the upload_object result or the last error, in completion
+            order. With a journal, files uploaded before are not read again,
+            and their result is their recorded ETag only. If the generator
+            is interrupted or closed (e.g., on Ctrl-C), the uploads in flight
+            stop at their next block and release their claims
+        """
+        budget, journal, cancel = self._concurrency(), self.journal, Event()
+
+        def upload(f, obj, kwargs, start):
+            key = journal.key(f) if (journal and start == 0) else None
+            if key:
+                name = self._journal_name('upload', obj)
+                etag = journal.completed(name, key)
+                if etag is not None:
+                    return dict(etag=etag)
+            client = self._clone()
+            client.budget, client.cancel = budget, cancel
+            f.seek(start)
+            r = client.upload_object(obj, f, **kwargs)
+            if key and key == journal.key(f):
+                journal.complete(name, key, r.get('etag', ''))
+            return r
+
+        jobs = (dict(f=f, obj=obj, kwargs=kwargs, start=f.tell()) for (
+            f, obj, kwargs) in sources)
+        try:
+            for attempt in range(retries + 1):
+                failed = []
+                for future in workers.get_pool().run(
+                        upload, jobs, lambda: budget.limit):
+                    job = future.kwargs
+                    try:
+                        r = future.result()
+                    except Exception as e:
+                        if attempt < retries:
+                            sendlog.info('Upload of %s failed (%s), retry' % (
+                                job['obj'], e))
+                            failed.append(job)
+                            continue
+                        r = e
+                    yield job['f'], job['obj'], r
+                jobs = failed
+                if not jobs:
+                    break
+        finally:
+            cancel.set()
+
     def upload_from_string(
             self, obj, input_str,
             hash_cb=None,
@@ -512,7 +1087,8 @@ class PithosClient(PithosRestClient):
             sharing=None,
             public=None,
             container_info_cache=None):
-        """Upload an object using multiple connections (threads)
+        """Upload an object using multiple connections (threads). Objects up
+        to SMALL_OBJECT_SIZE bytes are uploaded with a single PUT instead
 
         :param obj: (str) remote object path
 
@@ -548,6 +1124,21 @@ class PithosClient(PithosRestClient):
         """
         self._assert_container()
 
+        if self.SMALL_OBJECT_SIZE and (
+                len(input_str) <= self.SMALL_OBJECT_SIZE):
+            return self._put_small_object(
+                obj, input_str,
+                hash_cb=hash_cb,
+                upload_cb=upload_cb,
+                etag=etag,
+                if_etag_match=if_etag_match,
+                if_not_exist=if_not_exist,
+                content_encoding=content_encoding,
+                content_disposition=content_disposition,
+                content_type=content_type,
+                sharing=sharing,
+                public=public)
+
         blocksize, blockhash, size, nblocks = self._get_file_block_info(
                 fileobj=None, size=len(input_str), cache=container_info_cache)
         (hashes, hmap, offset) = ([], {}, 0)
@@ -584,39 +1175,20 @@ class PithosClient(PithosRestClient):
 
         tries = 7
         old_failures = 0
-        try:
-            while tries and missing:
-                flying = []
-                failures = []
-                for hash in missing:
-                    offset, block = hmap[hash]
-                    bird = self._put_block_async(block, hash)
-                    flying.append(bird)
-                    unfinished = self._watch_thread_limit(flying)
-                    for thread in set(flying).difference(unfinished):
-                        if thread.exception:
-                            failures.append(thread.kwargs['hash'])
-                        if thread.isAlive():
-                            flying.append(thread)
-                        else:
-                            self._cb_next()
-                    flying = unfinished
-                for thread in flying:
-                    thread.join()
-                    if thread.exception:
-                        failures.append(thread.kwargs['hash'])
-                    self._cb_next()
-                missing = failures
-                if missing and len(missing) == old_failures:
-                    tries -= 1
-                old_failures = len(missing)
-            if missing:
-                raise ClientError('%s blocks failed to upload' % len(missing))
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
-            raise
+        while tries and missing:
+            failures = []
+            for hash, failed in self._put_blocks(
+                    ((hash, hmap[hash][1]) for hash in missing),
+                    blocksize=blocksize):
+                if failed:
+                    failures.append(hash)
+                self._cb_next()
+            missing = failures
+            if missing and len(missing) == old_failures:
+                tries -= 1
+            old_failures = len(missing)
+        if missing:
+            raise ClientError('%s blocks failed to upload' % len(missing))
         self._cb_next()
 
         r = self.object_put(
@@ -668,82 +1240,232 @@ class PithosClient(PithosRestClient):
                     self._cb_next()
                     continue
                 args['data_range'] = 'bytes=%s' % data_range
-                r = self.object_get(obj, success=(200, 206), **args)
+                r = self.object_get(
+                    obj, success=(200, 206), stream=True, **args)
+                for chunk in r.iter_content():
+                    dst.write(chunk)
                 self._cb_next()
-                dst.write(r.content)
                 dst.flush()
 
-    def _get_block_async(self, obj, **args):
-        event = SilentEvent(self.object_get, obj, success=(200, 206), **args)
-        event.start()
-        return event
+    def _dump_blocks_ordered(
+            self, obj, remote_hashes, blocksize, total_size, dst, crange,
+            **args):
+        """Download blocks in parallel and write them in order, e.g., to a
+        pipe. Blocks that arrive early wait in memory, so that at most
+        STREAM_WINDOW blocks are in flight or waiting"""
+        if not total_size:
+            return
+        ready, window = dict(), max(1, self.STREAM_WINDOW)
 
-    def _hash_from_file(self, fp, start, size, blockhash):
-        fp.seek(start)
-        block = readall(fp, size)
-        h = newhashlib(blockhash)
-        h.update(block.strip('\x00'))
-        return hexlify(h.digest())
+        def blocks():
+            for blockid in range(len(remote_hashes)):
+                start = blocksize * blockid
+                is_last = start + blocksize > total_size
+                end = (total_size - 1) if is_last else (start + blocksize - 1)
+                data_range = _range_up(start, end, total_size, crange)
+                if not data_range:
+                    self._cb_next()
+                    continue
+                yield dict(
+                    args,
+                    success=(200, 206),
+                    async_headers={'Range': 'bytes=%s' % data_range})
+
+        index = 0
+        for future in self._async_requests(
+                partial(self._get_block, obj), blocks(),
+                lambda: window - len(ready)):
+            ready[future.index] = future.result().content
+            while index in ready:
+                dst.write(ready.pop(index))
+                index += 1
+                self._cb_next()
+        dst.flush()
 
-    def _thread2file(self, flying, blockids, local_file, offset=0, **restargs):
-        """write the results of a greenleted rest call to a file
+    @staticmethod
+    def _seekable(fileobj):
+        """:returns: (bool) False if fileobj cannot seek, e.g., a pipe"""
+        try:
+            return fileobj.seekable()
+        except AttributeError:
+            pass
+        try:
+            fileobj.tell()
+            return True
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
 
-        :param offset: the offset of the file up to blocksize
-        - e.g. if the range is 10-100, all blocks will be written to
-        normal_position - 10
-        """
-        for key, g in flying.items():
-            if g.isAlive():
-                continue
-            if g.exception:
-                raise g.exception
-            block = g.value.content
-            for block_start in blockids[key]:
-                local_file.seek(block_start + offset)
-                local_file.write(block)
-                self._cb_next()
-            flying.pop(key)
-            blockids.pop(key)
+    def _sync_journal(self, name, local_file, blocks):
+        """Sync local_file to disk, then record its written blocks"""
         local_file.flush()
+        fsync(local_file.fileno())
+        self.journal.record(name, blocks)
+        del blocks[:]
 
     def _dump_blocks_async(
             self, obj, remote_hashes, blocksize, total_size, local_file,
-            blockhash=None, resume=False, filerange=None, **restargs):
+            blockhash=None, resume=False, filerange=None, journal=None,
+            **restargs):
+        """Download blocks in parallel and write them at their positions.
+        Unless a range is given, local_file is first truncated to total_size
+        (emptied first, if not resumed), so that all-zero blocks are not
+        downloaded or written, but left as holes. Blocks are written on a
+        writer stage, and at most DOWNLOAD_BUFFER bytes of blocks are in
+        flight or wait to be written. Unless a range is given, blocks are
+        fetched in order and grouped in GETs of many ranges (see
+        ranges.RangePlanner). When resumed, the blocks of local_file are
+        hashed in parallel, like uploads (see HASH_WORKERS), while the
+        blocks past its end are downloaded
+
+        :param journal: (str) the name of the download in self.journal, to
+            trust the blocks it recorded instead of hashing local_file
+        """
         file_size = fstat(local_file.fileno()).st_size if resume else 0
-        flying = dict()
-        blockid_dict = dict()
+        trusted = self.journal.begin(
+            journal, self.journal.key(local_file, identity=True),
+            resume) if journal else None
+        positions, written = [], []
         offset = 0
-
-        self._init_thread_limit()
-        for block_hash, blockids in remote_hashes.items():
-            blockids = [blk * blocksize for blk in blockids]
-            unsaved = [blk for blk in blockids if not (
-                blk < file_size and block_hash == self._hash_from_file(
-                        local_file, blk, blocksize, blockhash))]
+        zero = None
+        if blockhash and not filerange:
+            zero = zero_block_hash(blockhash)
+            if not resume:
+                local_file.truncate(0)
+            local_file.truncate(total_size)
+
+        #  The hashes of the local blocks, by offset
+        local, verifier = dict() if trusted is None else trusted, None
+        if trusted is None and file_size:
+            hasher = BlockHasher(
+                blocksize, blockhash,
+                workers=self.HASH_WORKERS, processes=self.HASH_PROCESSES)
+            verifier = workers.Prefetcher(hasher.iter_regions(
+                local_file, sorted([(blk, min(
+                    blocksize, total_size - blk, file_size - blk)) for blk in [
+                        i * blocksize for ids in remote_hashes.values()
+                        for i in ids] if blk < file_size])))
+
+        max_blocks = max(1, self.DOWNLOAD_BUFFER // blocksize)
+        planner = RangePlanner(blocksize, 1 if filerange else min(
+            max_blocks, self.GET_BATCH_SIZE // blocksize))
+        batch = []
+
+        def request(batch):
+            positions.append(batch)
+            return dict(
+                restargs,
+                success=(200, 206),
+                stream=len(batch) > 1,
+                async_headers={'Range': range_header(
+                    [(key, end) for key, end, block_hash, starts in batch])})
+
+        def missing(block_hash, blockids):
+            """:returns: (generator of dict) the GET of the blocks of
+            block_hash which are not saved locally, if any"""
+            unsaved = [blk for blk in blockids if (
+                blk >= file_size or local.get(blk) != block_hash)]
             self._cb_next(len(blockids) - len(unsaved))
+            self.resumed_bytes += sum([min(
+                blocksize, total_size - blk) for blk in blockids if (
+                    blk not in unsaved)])
+            if unsaved and block_hash == zero:
+                #  Past the old file size they are holes, already
+                for blk in unsaved:
+                    if blk < file_size:
+                        writer.put(write, '\x00' * min(
+                            blocksize, total_size - blk), zero, [blk])
+                    elif journal:
+                        writer.put(written.append, (blk, zero))
+                    self._cb_next()
+                return
             if unsaved:
                 key = unsaved[0]
-                self._watch_thread_limit(flying.values())
-                self._thread2file(
-                    flying, blockid_dict, local_file, offset,
-                    **restargs)
                 end = total_size - 1 if (
                     key + blocksize > total_size) else key + blocksize - 1
                 if end < key:
                     self._cb_next()
-                    continue
+                    return
+                if not filerange:
+                    batch.append((key, end, block_hash, unsaved))
+                    if len(batch) >= planner.blocks:
+                        yield request(batch[:])
+                        del batch[:]
+                    return
                 data_range = _range_up(key, end, total_size, filerange)
                 if not data_range:
                     self._cb_next()
+                    return
+                positions.append([(key, end, block_hash, unsaved)])
+                yield dict(
+                    restargs,
+                    success=(200, 206),
+                    async_headers={'Range': 'bytes=%s' % data_range})
+
+        def blocks():
+            verified = []
+            for block_hash, blockids in sorted(
+                    remote_hashes.items(), key=lambda item: min(item[1])):
+                blockids = [blk * blocksize for blk in blockids]
+                if verifier and blockids[0] < file_size:
+                    verified.append((max([
+                        blk for blk in blockids if blk < file_size]),
+                        block_hash, blockids))
                     continue
-                restargs[
-                    'async_headers'] = {'Range': 'bytes=%s' % data_range}
-                flying[key] = self._get_block_async(obj, **restargs)
-                blockid_dict[key] = unsaved
+                for kwargs in missing(block_hash, blockids):
+                    yield kwargs
+            if batch:
+                yield request(batch[:])
+                del batch[:]
+            #  Then, the blocks of each hash once its local blocks are hashed
+            verified.sort(reverse=True)
+            for local_hash, blk, size in (verifier or []):
+                local[blk] = local_hash
+                while verified and verified[-1][0] <= blk:
+                    last, block_hash, blockids = verified.pop()
+                    for kwargs in missing(block_hash, blockids):
+                        yield kwargs
+            if batch:
+                yield request(batch)
+
+        checkpoint = [time() + self.JOURNAL_INTERVAL]
+
+        def write(block, block_hash, starts):
+            for block_start in starts:
+                local_file.seek(block_start + offset)
+                local_file.write(block)
+            if journal:
+                written.extend([(start, block_hash) for start in starts])
+                if time() >= checkpoint[0]:
+                    self._sync_journal(journal, local_file, written)
+                    checkpoint[0] = time() + self.JOURNAL_INTERVAL
 
-        for thread in flying.values():
-            thread.join()
-        self._thread2file(flying, blockid_dict, local_file, offset, **restargs)
+        writer = workers.SerialQueue(max_blocks)
+        try:
+            for future in self._async_requests(
+                    partial(self._get_block, obj), blocks(),
+                    lambda: (max_blocks - writer.pending) // planner.blocks):
+                r = future.result()
+                requested = positions[future.index]
+                #  The reply to a GET of a single block is that block
+                parts = list(iter_byteranges(r, requested[0][0])) if (
+                    len(requested) > 1) else None
+                #  A streamed reply is timed once read
+                planner.observe(getattr(r, 'timing', None))
+                if parts and r.status_code == 200:
+                    planner.whole_reply()
+                for key, end, block_hash, starts in requested:
+                    block = cut(parts, key, end) if parts else r.content
+                    writer.put(write, block, block_hash, starts)
+                    self._cb_next(len(starts))
+        finally:
+            if verifier:
+                verifier.close()
+            writer.close()
+            if written and writer.error is None:
+                self._sync_journal(journal, local_file, written)
+        if writer.error:
+            raise writer.error
+        local_file.flush()
 
     def download_object(
             self, obj, dst,
@@ -755,11 +1477,16 @@ class PithosClient(PithosRestClient):
             if_none_match=None,
             if_modified_since=None,
             if_unmodified_since=None):
-        """Download an object (multiple connections, random blocks)
+        """Download an object (multiple connections, random blocks). With a
+        journal, an object downloaded before is not downloaded again, and a
+        resumed download trusts the blocks recorded in the journal, instead of
+        hashing the local file. If dst cannot seek (e.g., a pipe), blocks are
+        downloaded in parallel and written in order
 
         :param obj: (str) remote object path
 
-        :param dst: open file descriptor (wb+)
+        :param dst: open file descriptor (wb+), or a pipe, a terminal or
+            another object with a write method
 
         :param download_cb: optional progress.bar object for downloading
 
@@ -796,7 +1523,17 @@ class PithosClient(PithosRestClient):
             self.progress_bar_gen = download_cb(len(hash_list))
             self._cb_next()
 
-        if dst.isatty():
+        name = None
+        if self.journal and not range_str:
+            key = self.journal.key(dst)
+            if key:
+                name, etag = self._journal_name('download', obj), digest(
+                    total_size, hash_list)
+                if self.journal.completed(name, key, etag):
+                    self._complete_cb()
+                    return
+
+        if getattr(dst, 'isatty', lambda: False)():
             self._dump_blocks_sync(
                 obj,
                 hash_list,
@@ -805,6 +1542,15 @@ class PithosClient(PithosRestClient):
                 dst,
                 range_str,
                 **restargs)
+        elif not self._seekable(dst):
+            self._dump_blocks_ordered(
+                obj,
+                hash_list,
+                blocksize,
+                total_size,
+                dst,
+                range_str,
+                **restargs)
         else:
             self._dump_blocks_async(
                 obj,
@@ -815,9 +1561,14 @@ class PithosClient(PithosRestClient):
                 blockhash,
                 resume,
                 range_str,
+                journal=name,
                 **restargs)
             if not range_str:
                 dst.truncate(total_size)
+            if name:
+                dst.flush()
+                fsync(dst.fileno())
+                self.journal.complete(name, self.journal.key(dst), etag)
 
         self._complete_cb()
 
@@ -832,6 +1583,8 @@ class PithosClient(PithosRestClient):
             if_unmodified_since=None):
         """Download an object to a string (multiple connections). This method
         uses threads for http requests, but stores all content in memory.
+        Without range_str, consecutive blocks are fetched with a single GET,
+        as many as planned by a ranges.RangePlanner
 
         :param obj: (str) remote object path
 
@@ -871,35 +1624,42 @@ class PithosClient(PithosRestClient):
             self.progress_bar_gen = download_cb(len(hash_list))
             self._cb_next()
 
-        num_of_blocks = len(remote_hashes)
-        ret = [''] * num_of_blocks
-        self._init_thread_limit()
-        flying = dict()
-        try:
-            for blockid, blockhash in enumerate(remote_hashes):
-                start = blocksize * blockid
-                is_last = start + blocksize > total_size
-                end = (total_size - 1) if is_last else (start + blocksize - 1)
+        ret = [''] * len(hash_list)
+        blockids = []
+        planner = RangePlanner(blocksize, 1 if range_str else (
+            self.GET_BATCH_SIZE // blocksize))
+
+        def blocks():
+            blockid = 0
+            while blockid < len(hash_list):
+                #  Without a range, fetch as many blocks as planned at once
+                last = min(len(hash_list), blockid + planner.blocks) - 1
+                start, end = blocksize * blockid, min(
+                    total_size, blocksize * (last + 1)) - 1
                 data_range_str = _range_up(start, end, end, range_str)
                 if data_range_str:
-                    self._watch_thread_limit(flying.values())
-                    restargs['data_range'] = 'bytes=%s' % data_range_str
-                    flying[blockid] = self._get_block_async(obj, **restargs)
-                for runid, thread in flying.items():
-                    if (blockid + 1) == num_of_blocks:
-                        thread.join()
-                    elif thread.isAlive():
-                        continue
-                    if thread.exception:
-                        raise thread.exception
-                    ret[runid] = thread.value.content
-                    self._cb_next()
-                    flying.pop(runid)
-            return ''.join(ret)
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+                    blockids.append((blockid, last - blockid + 1, start, end))
+                    yield dict(
+                        restargs,
+                        data_range=None,
+                        success=(200, 206),
+                        stream=last > blockid,
+                        async_headers={'Range': 'bytes=%s' % data_range_str})
+                blockid = last + 1
+
+        for future in self._async_requests(
+                partial(self._get_block, obj), blocks()):
+            r = future.result()
+            blockid, count, start, end = blockids[future.index]
+            #  The reply to a GET of a single block is that block
+            ret[blockid] = cut(list(iter_byteranges(
+                r, start)), start, end) if count > 1 else r.content
+            #  A streamed reply is timed once read
+            planner.observe(getattr(r, 'timing', None))
+            if count > 1 and r.status_code == 200:
+                planner.whole_reply()
+            self._cb_next(count)
+        return ''.join(ret)
 
     #Command Progress Bar method
     def _cb_next(self, step=1):
@@ -1311,50 +2071,31 @@ class PithosClient(PithosRestClient):
         blocksize = int(meta['x-container-block-size'])
         filesize = fstat(source_file.fileno()).st_size
         nblocks = 1 + (filesize - 1) // blocksize
-        offset = 0
         headers = {}
         if upload_cb:
             self.progress_bar_gen = upload_cb(nblocks)
             self._cb_next()
-        flying = {}
-        self._init_thread_limit()
-        try:
+
+        def blocks():
+            offset = 0
             for i in range(nblocks):
                 block = source_file.read(min(blocksize, filesize - offset))
                 offset += len(block)
-
-                self._watch_thread_limit(flying.values())
-                unfinished = {}
-                flying[i] = SilentEvent(
-                    method=self.object_post,
+                yield dict(
                     obj=obj,
                     update=True,
                     content_range='bytes */*',
                     content_type='application/octet-stream',
                     content_length=len(block),
                     data=block)
-                flying[i].start()
 
-                for key, thread in flying.items():
-                    if thread.isAlive():
-                        if i < (nblocks - 1):
-                            unfinished[key] = thread
-                            continue
-                        thread.join()
-                    if thread.exception:
-                        raise thread.exception
-                    headers[key] = thread.value.headers
-                    self._cb_next()
-                flying = unfinished
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+        try:
+            for future in self._async_iter(self.object_post, blocks()):
+                headers[future.index] = future.result().headers
+                self._cb_next()
         finally:
-            from time import sleep
-            sleep(2 * len(activethreads()))
             self._cb_next()
-        return headers.values()
+        return [headers[i] for i in sorted(headers)]
 
     def truncate_object(self, obj, upto_bytes):
         """
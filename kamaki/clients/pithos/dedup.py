@@ -0,0 +1,127 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+from threading import Event, Lock
+
+from kamaki.clients.utils.workers import _FOREVER
+
+
+class SharedBlocks(object):
+    """The blocks uploaded, or being uploaded, by a batch of uploads (e.g.,
+    the files of a directory), so that a block shared by many files is sent
+    once. Each upload claims the blocks it is about to send and reports them
+    when their requests complete. Blocks claimed by another upload are
+    skipped and waited for before the upload completes.
+    """
+
+    def __init__(self):
+        #  hash: True if uploaded, (claims, Event) while in flight
+        self._blocks, self._lock = dict(), Lock()
+        #  (hash, id(claims)) of the blocks counted, and the claims of each
+        #  id, kept so that ids are not reused, e.g., by a later upload
+        self._counted, self._claims = set(), dict()
+        self.blocks, self.bytes = 0, 0
+        self.sent_blocks, self.sent_bytes = 0, 0
+
+    def claim(self, hash, size, claims, in_flight=True):
+        """
+        :param hash: (str) the block hash
+
+        :param size: (int) the block size
+
+        :param claims: (set) the hashes claimed by the caller, the block is
+            added if claimed
+
+        :param in_flight: (bool) skip blocks being uploaded by others, else
+            skip only blocks already uploaded (e.g., for sources which
+            cannot be read again if the other upload fails)
+
+        :returns: (bool) True if the caller must upload the block. Blocks
+            are counted once per claims, even if claimed again (e.g., to
+            retry a failed upload)
+        """
+        with self._lock:
+            state = self._blocks.get(hash)
+            if (hash, id(claims)) not in self._counted:
+                self._counted.add((hash, id(claims)))
+                self._claims[id(claims)] = claims
+                self.blocks, self.bytes = self.blocks + 1, self.bytes + size
+            if state is True or (state and in_flight):
+                return False
+            if state is None:
+                self._blocks[hash] = (claims, Event())
+                claims.add(hash)
+            self.sent_blocks += 1
+            self.sent_bytes += size
+            return True
+
+    def done(self, hash, claims, failed=False):
+        """Report the upload of a block"""
+        with self._lock:
+            state = self._blocks.get(hash)
+            if state is True or (failed and (
+                    state is None or state[0] is not claims)):
+                claims.discard(hash)
+                return
+            if failed:
+                self._blocks.pop(hash)
+            else:
+                self._blocks[hash] = True
+            claims.discard(hash)
+        if state:
+            state[1].set()
+
+    def release(self, claims):
+        """Report the blocks of claims as failed, e.g., if the upload was
+        interrupted"""
+        for hash in list(claims):
+            self.done(hash, claims, failed=True)
+
+    def wait(self, hash):
+        """Wait while a block is in flight
+
+        :returns: (bool) True if the block is uploaded
+        """
+        with self._lock:
+            state = self._blocks.get(hash)
+        if state and state is not True:
+            state[1].wait(_FOREVER)
+        with self._lock:
+            return self._blocks.get(hash) is True
+
+    def ratio(self):
+        """:returns: (float) the bytes of the blocks the uploads had to send,
+        over the bytes actually sent"""
+        if not self.sent_bytes:
+            return float('inf') if self.bytes else 1.0
+        return float(self.bytes) / self.sent_bytes
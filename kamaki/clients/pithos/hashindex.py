@@ -0,0 +1,165 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+import sqlite3
+from binascii import hexlify, unhexlify
+from hashlib import new as newhashlib
+from os import fstat, makedirs, path
+from stat import S_ISREG
+from threading import local, Lock
+from time import time
+from logging import getLogger
+
+log = getLogger(__name__)
+
+DEFAULT_PATH = path.expanduser(path.join('~', '.kamaki', 'hash_index.db'))
+#  Files modified less than RACY_SECONDS ago are not indexed, because they
+#  may be modified again without a change in their modification time
+RACY_SECONDS = 2
+
+
+class HashIndex(object):
+    """An on-disk index of the block hashes of local files, so that files
+    uploaded before are not hashed again. Files are identified by device,
+    inode, size and modification time, so any change of a file invalidates
+    its hashes.
+
+    The index may be shared by many processes. Database errors are logged and
+    treated as misses.
+    """
+
+    def __init__(self, filename=DEFAULT_PATH, max_size=64 * 1024 * 1024):
+        """
+        :param filename: (str) the database file, the directory is created if
+            missing
+
+        :param max_size: (int) the maximum total size of stored hashes, least
+            recently used files are evicted first
+        """
+        self.filename, self.max_size = filename, max_size
+        self.hits, self.misses = 0, 0
+        self._local, self._lock = local(), Lock()
+        dirname = path.dirname(filename)
+        if dirname and not path.isdir(dirname):
+            makedirs(dirname, 0700)
+        self._execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'key TEXT PRIMARY KEY, hashes BLOB, accessed REAL, size INTEGER)')
+
+    def _execute(self, query, *args):
+        """:returns: (list) the result rows, None on database errors"""
+        db = getattr(self._local, 'db', None)
+        try:
+            if db is None:
+                db = sqlite3.connect(self.filename, timeout=10)
+                db.text_factory = str
+                self._local.db = db
+            with db:
+                return db.execute(query, args).fetchall()
+        except sqlite3.Error as e:
+            log.debug('Hash index %s: %s' % (self.filename, e))
+
+    @staticmethod
+    def key(fileobj, size, blocksize, blockhash):
+        """:returns: (str) the key of the first size bytes of fileobj, None
+        if fileobj is not a regular file of this size or it was modified
+        less than RACY_SECONDS ago
+        """
+        try:
+            st = fstat(fileobj.fileno())
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+        if not S_ISREG(st.st_mode) or st.st_size != size or (
+                time() - st.st_mtime < RACY_SECONDS):
+            return None
+        return '%s:%s:%s:%s:%s:%s' % (
+            st.st_dev, st.st_ino, st.st_size, int(st.st_mtime * 1e9),
+            blocksize, blockhash)
+
+    def get(self, key):
+        """:returns: (list) the hex block hashes of a file, or None"""
+        rows = self._execute('SELECT hashes FROM hashes WHERE key = ?', key)
+        with self._lock:
+            if not rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._execute(
+            'UPDATE hashes SET accessed = ? WHERE key = ?', time(), key)
+        hashes, digest_size = str(rows[0][0]), newhashlib(
+            key.rpartition(':')[2]).digest_size
+        return [hexlify(hashes[i:i + digest_size]) for i in range(
+            0, len(hashes), digest_size)]
+
+    def set(self, key, hashes):
+        """Store the hex block hashes of a file"""
+        hashes = ''.join([unhexlify(h) for h in hashes])
+        if len(hashes) > self.max_size / 8:
+            return
+        self._execute(
+            'INSERT OR REPLACE INTO hashes VALUES (?,?,?,?)',
+            key, sqlite3.Binary(hashes), time(), len(hashes))
+        self.evict()
+
+    def evict(self):
+        """Drop the least recently used files while the total size exceeds
+        max_size"""
+        rows = self._execute('SELECT SUM(size) FROM hashes')
+        excess = ((rows and rows[0][0]) or 0) - self.max_size
+        if excess <= 0:
+            return
+        dropped = []
+        for key, size in self._execute(
+                'SELECT key, size FROM hashes ORDER BY accessed') or []:
+            if excess <= 0:
+                break
+            dropped.append(key)
+            excess -= size
+        for key in dropped:
+            self._execute('DELETE FROM hashes WHERE key = ?', key)
+
+    def clear(self):
+        self._execute('DELETE FROM hashes')
+
+
+_indices, _indices_lock = dict(), Lock()
+
+
+def get_index(filename=DEFAULT_PATH, **kwargs):
+    """:returns: (HashIndex) shared by all clients of the process, per file
+    """
+    with _indices_lock:
+        if filename not in _indices:
+            _indices[filename] = HashIndex(filename, **kwargs)
+        return _indices[filename]
@@ -0,0 +1,275 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+from os import open as os_open, close as os_close, fstat, O_RDONLY
+from stat import S_ISREG
+from mmap import mmap, ACCESS_READ, ALLOCATIONGRANULARITY
+from hashlib import new as newhashlib
+from multiprocessing import cpu_count, Pool
+from threading import Lock
+import atexit
+
+from kamaki.clients.utils import readall, readinto
+from kamaki.clients.utils.buffers import get_pool as get_buffers
+from kamaki.clients.utils.workers import get_pool
+
+_WINDOW = 64 * 1024
+_ZEROS = '\x00' * _WINDOW
+
+
+def trimmed_size(data, size=None):
+    """The size of data without its trailing zeros, computed without copying
+    more than a window of data (Pithos+ does not hash trailing zeros)
+
+    :param data: (str, buffer or mmap) the block data
+
+    :param size: (int) bytes to consider, default is len(data)
+
+    :returns: (int)
+    """
+    end = len(data) if size is None else size
+    while end:
+        step = min(end, _WINDOW)
+        if buffer(data, end - step, step) != buffer(_ZEROS, 0, step):
+            tail = str(buffer(data, end - step, step))
+            return end - step + len(tail.rstrip('\x00'))
+        end -= step
+    return 0
+
+
+def block_hash(data, blockhash, size=None):
+    """:returns: (str) the hex digest of a Pithos+ block"""
+    h = newhashlib(blockhash)
+    h.update(buffer(data, 0, trimmed_size(data, size)))
+    return h.hexdigest()
+
+
+def zero_block_hash(blockhash):
+    """:returns: (str) the hex digest of an all-zero block of any size, since
+    trailing zeros are not hashed"""
+    return block_hash('', blockhash)
+
+
+def _hash_mapped(source, offset, size, blockhash):
+    """Hash a file region, mapping only this region in memory
+
+    :param source: (int or str) a file descriptor or a file path
+    """
+    fd = source if isinstance(source, int) else os_open(source, O_RDONLY)
+    try:
+        delta = offset % ALLOCATIONGRANULARITY
+        mm = mmap(fd, size + delta, access=ACCESS_READ, offset=offset - delta)
+        try:
+            return block_hash(buffer(mm, delta, size), blockhash)
+        finally:
+            mm.close()
+    finally:
+        if fd is not source:
+            os_close(fd)
+
+
+_processes, _processes_lock = None, Lock()
+
+
+def get_process_pool():
+    """:returns: (multiprocessing.Pool) the hashing processes shared by all
+    hashers of a process, one per CPU, started on first use"""
+    global _processes
+    with _processes_lock:
+        if _processes is None:
+            _processes = Pool(cpu_count())
+        return _processes
+
+
+@atexit.register
+def _terminate():
+    if _processes is not None:
+        _processes.terminate()
+
+
+def _hash_task(offset, bytes, hasher, args, processes=False):
+    """:returns: (hasher(*args), offset, bytes), computed on a process of
+    the shared process pool if processes is set"""
+    if processes:
+        return get_process_pool().apply(hasher, args), offset, bytes
+    return hasher(*args), offset, bytes
+
+
+class BlockHasher(object):
+    """Calculate the block hashes of a file in parallel
+
+    Regular files are mapped in memory block by block, so that blocks are
+    neither copied nor read by the main thread. Other file objects (e.g.,
+    pipes) are read sequentially and their blocks are hashed in parallel.
+    Since hashlib releases the GIL while hashing, threads scale with the
+    number of cores, but processes can be used instead (e.g., for hash
+    algorithms implemented in python). Hashers share the worker pool and
+    the hashing processes of the process, instead of starting their own.
+    """
+
+    def __init__(self, blocksize, blockhash, workers=None, processes=False):
+        """
+        :param blocksize: (int) the block size of the container
+
+        :param blockhash: (str) the hash algorithm of the container
+
+        :param workers: (int) parallel hashers, default is one per CPU
+
+        :param processes: (bool) hash in worker processes, not threads
+        """
+        self.blocksize, self.blockhash = blocksize, blockhash
+        self.workers = workers or cpu_count()
+        self.processes = processes
+
+    def _mappable(self, fileobj, size):
+        """:returns: (int, int) descriptor and start offset, or (None, None)
+        if fileobj is not a regular file of at least size bytes
+        """
+        try:
+            fd, start = fileobj.fileno(), fileobj.tell()
+            if not S_ISREG(fstat(fd).st_mode) or (
+                    fstat(fd).st_size < start + size):
+                return None, None
+            fileobj.flush()
+        except (AttributeError, IOError, OSError, ValueError):
+            return None, None
+        return fd, start
+
+    def _blocks(self, fileobj, size):
+        """:returns: (generator of (offset, bytes, method, args)) the hash
+        task of each block, offsets relative to the current file position
+        """
+        fd, start = self._mappable(fileobj, size)
+        source = fd
+        if self.processes and fd is not None:
+            source = getattr(fileobj, 'name', None)
+            fd = fd if isinstance(source, basestring) else None
+        offset = 0
+        while offset < size:
+            bytes = min(self.blocksize, size - offset)
+            if fd is None:
+                block = readall(fileobj, bytes)
+                if not block:
+                    break
+                bytes = len(block)
+                yield offset, bytes, block_hash, (block, self.blockhash)
+            else:
+                yield offset, bytes, _hash_mapped, (
+                    source, start + offset, bytes, self.blockhash)
+            offset += bytes
+        if fd is not None:
+            fileobj.seek(start + offset)
+
+    def iter_hashes(self, fileobj, size):
+        """Hash the next size bytes of fileobj
+
+        :returns: (generator of (hash, offset, bytes)) in block order, where
+            offset is relative to the file position when iteration started
+        """
+        return self._iter_tasks(self._blocks(fileobj, size), self.processes)
+
+    def iter_blocks(self, fileobj, size=None):
+        """Read the next size bytes of fileobj, or until EOF if size is None,
+        and hash the blocks in parallel, e.g., to upload them while hashing.
+        The file is read once and in order, into buffers of the shared
+        BufferPool of blocksize buffers, which are not copied to be hashed
+
+        :returns: (generator of (hash, offset, bytes, buffer)) in block order,
+            where offset is relative to the file position when iteration
+            started and the block is buffer[:bytes]. The caller puts each
+            buffer back to the pool when done with it
+        """
+        pool, buffers = get_buffers(self.blocksize), dict()
+
+        def blocks():
+            offset = 0
+            while size is None or offset < size:
+                buf = pool.get()
+                bytes = readinto(fileobj, buf, self.blocksize if (
+                    size is None) else min(self.blocksize, size - offset))
+                if not bytes:
+                    pool.put(buf)
+                    break
+                buffers[offset] = buf
+                yield offset, bytes, block_hash, (buf, self.blockhash, bytes)
+                offset += bytes
+                if bytes < self.blocksize:
+                    break
+
+        for hash, offset, bytes in self._iter_tasks(blocks(), self.processes):
+            yield hash, offset, bytes, buffers.pop(offset)
+
+    def iter_regions(self, fileobj, regions):
+        """Hash regions of a regular file, e.g., the blocks of a local file
+        to resume a download. The regions are mapped in memory, so the file
+        position is not moved. Trailing zeros are not hashed, as in uploads
+
+        :param regions: (iterable of (offset, bytes)) offsets are absolute
+
+        :returns: (generator of (hash, offset, bytes)) in the order of regions
+        """
+        fileobj.flush()
+        source, processes = fileobj.fileno(), self.processes
+        if processes:
+            name = getattr(fileobj, 'name', None)
+            source, processes = (name, True) if isinstance(
+                name, basestring) else (source, False)
+        return self._iter_tasks(((
+            offset, bytes, _hash_mapped,
+            (source, offset, bytes, self.blockhash))
+            for offset, bytes in regions), processes)
+
+    def _iter_tasks(self, blocks, processes):
+        """:param blocks: (iterable of (offset, bytes, method, args))
+
+        :returns: (generator of (method(*args), offset, bytes)) in order,
+            computed on the shared pool, at most self.workers at a time
+        """
+        if self.workers < 2:
+            for offset, bytes, method, args in blocks:
+                yield method(*args), offset, bytes
+            return
+        futures = get_pool().run(_hash_task, (dict(
+            offset=offset, bytes=bytes, hasher=method, args=args,
+            processes=processes) for offset, bytes, method, args in blocks
+        ), self.workers)
+        done, index = dict(), 0
+        try:
+            for future in futures:
+                done[future.index] = future.result()
+                while index in done:
+                    yield done.pop(index)
+                    index += 1
+        finally:
+            futures.close()
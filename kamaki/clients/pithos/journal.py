@@ -0,0 +1,201 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+import sqlite3
+from hashlib import sha1
+from os import fstat, makedirs, path, remove
+from stat import S_ISREG
+from threading import local
+from logging import getLogger
+
+log = getLogger(__name__)
+
+DEFAULT_DIR = path.expanduser(path.join('~', '.kamaki', 'jobs'))
+
+
+def job_id(*terms):
+    """:returns: (str) a job id derived from terms, e.g., the command, the
+    local path and the remote location of a transfer"""
+    return sha1('\n'.join(['%s' % t for t in terms])).hexdigest()[:16]
+
+
+def digest(size, hashes):
+    """:returns: (str) a digest of the size and block hashes of an object,
+    which changes with its contents"""
+    h = sha1('%s' % size)
+    for hash in hashes:
+        h.update(hash)
+    return h.hexdigest()
+
+
+class TransferJournal(object):
+    """An on-disk journal of a transfer job, e.g., the upload of a directory,
+    so that an interrupted job is resumed without reading or hashing the
+    files it completed. It keeps the completed files with their ETags and,
+    for downloads in progress, the blocks already written and synced to disk.
+
+    Local files are identified by device, inode, size and modification time,
+    so a file modified after its transfer is transferred again. Journal
+    records may be lost in a crash, but never outlive the data they describe.
+    Database errors are logged and treated as misses.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: (str) the database file, the directory is created if
+            missing
+        """
+        self.filename, self.skipped = filename, 0
+        self._local = local()
+        dirname = path.dirname(filename)
+        if dirname and not path.isdir(dirname):
+            makedirs(dirname, 0700)
+        self._execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'name TEXT PRIMARY KEY, key TEXT, etag TEXT, done INTEGER)')
+        self._execute(
+            'CREATE TABLE IF NOT EXISTS blocks ('
+            'name TEXT, offset INTEGER, hash TEXT, PRIMARY KEY(name, offset))')
+
+    @classmethod
+    def open(cls, job, dirname=DEFAULT_DIR):
+        """:returns: (TransferJournal) the journal of a job, by id"""
+        return cls(path.join(dirname, '%s.db' % job))
+
+    def _execute(self, query, *args, **kwargs):
+        """:param many: (iterable) run query once for each tuple of args
+
+        :returns: (list) the result rows, None on database errors
+        """
+        db = getattr(self._local, 'db', None)
+        try:
+            if db is None:
+                db = sqlite3.connect(self.filename, timeout=10)
+                db.text_factory = str
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+                self._local.db = db
+            with db:
+                if 'many' in kwargs:
+                    return db.executemany(query, kwargs['many']).fetchall()
+                return db.execute(query, args).fetchall()
+        except sqlite3.Error as e:
+            log.debug('Transfer journal %s: %s' % (self.filename, e))
+
+    @staticmethod
+    def key(fileobj, identity=False):
+        """:param identity: (bool) identify the file only by device and inode,
+            e.g., while it is being written
+
+        :returns: (str) the key of fileobj, None if it is not a regular file
+        """
+        try:
+            st = fstat(fileobj.fileno())
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+        if not S_ISREG(st.st_mode):
+            return None
+        if identity:
+            return '%s:%s' % (st.st_dev, st.st_ino)
+        return '%s:%s:%s:%s' % (
+            st.st_dev, st.st_ino, st.st_size, int(st.st_mtime * 1e9))
+
+    def empty(self):
+        """:returns: (bool) True if nothing is recorded, e.g., a new job"""
+        rows = self._execute('SELECT COUNT(*) FROM files')
+        return not (rows and rows[0][0])
+
+    def completed(self, name, key, etag=None):
+        """
+        :param etag: (str) if given, the recorded ETag must match
+
+        :returns: (str) the ETag of name, if it was transferred from or to
+            the local file of this key (counted as skipped), otherwise None
+        """
+        rows = self._execute(
+            'SELECT etag FROM files WHERE name = ? AND key = ? AND done = 1',
+            name, key)
+        if rows and etag in (None, rows[0][0]):
+            self.skipped += 1
+            return rows[0][0]
+        return None
+
+    def complete(self, name, key, etag):
+        """Record that name is transferred, and forget its blocks"""
+        self._execute('DELETE FROM blocks WHERE name = ?', name)
+        self._execute(
+            'INSERT OR REPLACE INTO files VALUES (?,?,?,1)', name, key, etag)
+
+    def begin(self, name, key, resume=True):
+        """Start or resume the transfer of name to a local file
+
+        :param key: (str) the identity key of the local file
+
+        :param resume: (bool) if not set, forget the recorded blocks
+
+        :returns: (dict) the hashes of the recorded blocks by offset, None if
+            the transfer of name to this file is not resumed
+        """
+        if resume:
+            rows = self._execute(
+                'SELECT key FROM files WHERE name = ? AND done = 0', name)
+            if rows and rows[0][0] == key:
+                return dict(self._execute(
+                    'SELECT offset, hash FROM blocks WHERE name = ?',
+                    name) or [])
+        self._execute('DELETE FROM blocks WHERE name = ?', name)
+        self._execute(
+            'INSERT OR REPLACE INTO files VALUES (?,?,NULL,0)', name, key)
+        return None
+
+    def record(self, name, blocks):
+        """Record blocks of name, already synced to the local file
+
+        :param blocks: (list of (int, str)) offsets and hashes
+        """
+        self._execute(
+            'INSERT OR REPLACE INTO blocks VALUES (?,?,?)',
+            many=[(name, offset, hash) for offset, hash in blocks])
+
+    def remove(self):
+        """Delete the journal, e.g., when the job is completed"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                remove(self.filename + suffix)
+            except OSError:
+                pass
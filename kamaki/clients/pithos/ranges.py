@@ -0,0 +1,220 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+from math import ceil
+from threading import Lock
+
+from kamaki.clients import ClientError
+
+
+class RangePlanner(object):
+    """Choose how many blocks to fetch with each GET of a download, from the
+    observed latency of its requests. The time to first byte is an overhead
+    paid once per request, so blocks are fetched together (one range per
+    run of contiguous blocks, a multipart/byteranges reply for more runs)
+    until it is at most OVERHEAD_SHARE of each request.
+    """
+
+    #  Aim for a time to first byte of at most that share of each request
+    OVERHEAD_SHARE = 0.2
+
+    def __init__(self, blocksize, max_blocks=1):
+        """
+        :param blocksize: (int) the container block size
+
+        :param max_blocks: (int) never fetch more blocks with a GET
+        """
+        self.blocksize, self.max_blocks = blocksize, max(1, max_blocks)
+        #  Moving averages of seconds to first byte and seconds per byte
+        self.ttfb, self.rate = None, None
+        self._lock = Lock()
+
+    @property
+    def blocks(self):
+        """:returns: (int) the number of blocks to fetch with the next GET,
+        1 until a response is observed"""
+        if self.ttfb is None or self.max_blocks == 1:
+            return 1
+        per_block = self.rate * self.blocksize * self.OVERHEAD_SHARE
+        if per_block <= 0:
+            return self.max_blocks
+        return max(1, min(self.max_blocks, int(ceil(
+            self.ttfb * (1 - self.OVERHEAD_SHARE) / per_block))))
+
+    def whole_reply(self):
+        """Fetch a block per GET from now on, since the server replied to a
+        GET of many blocks with the whole object, e.g., because it does not
+        serve multiple ranges"""
+        self.max_blocks = 1
+
+    def observe(self, timing):
+        """:param timing: (RequestTiming) of a GET, ignored if None"""
+        if timing is None or not timing.bytes_in:
+            return
+        rate = timing.transfer / timing.bytes_in
+        with self._lock:
+            if self.ttfb is None:
+                self.ttfb, self.rate = timing.ttfb, rate
+            else:
+                self.ttfb = 0.8 * self.ttfb + 0.2 * timing.ttfb
+                self.rate = 0.8 * self.rate + 0.2 * rate
+
+
+def range_header(spans):
+    """
+    :param spans: (list of (start, end)) byte spans, inclusive
+
+    :returns: (str) a Range header, with the spans sorted and contiguous
+        spans merged, e.g., bytes=0-99,200-299
+    """
+    merged = []
+    for start, end in sorted(spans):
+        if merged and merged[-1][1] + 1 == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return 'bytes=%s' % ','.join(['%s-%s' % (s, e) for s, e in merged])
+
+
+def _content_range(value):
+    """:returns: (int, int) the first and last byte of a Content-Range"""
+    try:
+        first, last = value.split()[1].split('/')[0].split('-')
+        return int(first), int(last)
+    except (AttributeError, IndexError, ValueError):
+        raise ClientError('Malformed Content-Range: %s' % value)
+
+
+class _ChunkReader(object):
+    """Read lines and sized parts from an iterable of chunks"""
+
+    def __init__(self, chunks):
+        self.chunks, self.buffer = iter(chunks), ''
+
+    def readline(self):
+        while '\n' not in self.buffer:
+            chunk = next(self.chunks, '')
+            if not chunk:
+                break
+            self.buffer += chunk
+        i = self.buffer.find('\n') + 1 or len(self.buffer)
+        line, self.buffer = self.buffer[:i], self.buffer[i:]
+        return line
+
+    def read(self, size):
+        data, length = [self.buffer], len(self.buffer)
+        while length < size:
+            chunk = next(self.chunks, '')
+            if not chunk:
+                break
+            data.append(chunk)
+            length += len(chunk)
+        data = ''.join(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+    def drain(self):
+        """Read the rest of the chunks, e.g., to complete a streamed body"""
+        for chunk in self.chunks:
+            pass
+        self.buffer = ''
+
+
+def iter_byteranges(r, start=0):
+    """Parse the reply to a range GET while its body is read. A
+    multipart/byteranges body is split in its parts, and read to its end.
+    For the body to be parsed while received, the GET must be streamed
+
+    :param r: (ResponseManager)
+
+    :param start: (int) the first byte of the body, if the reply has no
+        Content-Range header. A 200 reply is the whole object (the server
+        ignored the Range header), so its body starts at byte 0
+
+    :returns: (generator of (int, str)) the first byte and the data of each
+        range
+
+    :raises ClientError: if a part is malformed or truncated
+    """
+    ctype, sep, params = r.headers.get('content-type', '').partition(';')
+    if ctype.strip().lower() != 'multipart/byteranges':
+        if r.headers.get('content-range'):
+            start = _content_range(r.headers['content-range'])[0]
+        elif r.status_code == 200:
+            start = 0
+        yield start, r.content
+        return
+    boundary = ''
+    for param in params.split(';'):
+        key, sep, value = param.partition('=')
+        if key.strip().lower() == 'boundary':
+            boundary = value.strip().strip('"')
+    delimiter, reader = '--%s' % boundary, _ChunkReader(r.iter_content())
+    while True:
+        line = reader.readline()
+        if not line:
+            raise ClientError('Truncated multipart/byteranges reply')
+        line = line.strip()
+        if line == delimiter + '--':
+            reader.drain()
+            return
+        if line != delimiter:
+            continue
+        span = None
+        line = reader.readline().strip()
+        while line:
+            key, sep, value = line.partition(':')
+            if key.strip().lower() == 'content-range':
+                span = _content_range(value.strip())
+            line = reader.readline().strip()
+        if not span:
+            raise ClientError('Byte range without Content-Range')
+        data = reader.read(span[1] - span[0] + 1)
+        if len(data) < span[1] - span[0] + 1:
+            raise ClientError('Truncated multipart/byteranges reply')
+        yield span[0], data
+
+
+def cut(parts, start, end):
+    """
+    :param parts: (list of (int, str)) the first byte and the data of each
+        range of a reply, see iter_byteranges
+
+    :returns: (str) bytes start to end (inclusive) of the reply
+
+    :raises ClientError: if they are not in a single range of the reply
+    """
+    for first, data in parts:
+        if first <= start and end < first + len(data):
+            return data[start - first:end - first + 1]
+    raise ClientError('Bytes %s-%s are missing from the reply' % (start, end))
@@ -32,7 +32,7 @@
 # or implied, of GRNET S.A.
 
 from unittest import TestCase
-from mock import patch, call
+from mock import patch, call, MagicMock
 from tempfile import NamedTemporaryFile
 from os import urandom
 from itertools import product
@@ -150,6 +150,12 @@ class FR(object):
     status = None
     status_code = 200
 
+    def iter_content(self, chunk_size=65536):
+        yield self.content
+
+    def unquote_header_keys(self, prefices):
+        pithos.PithosRestClient._unquote_header_keys(self.headers, prefices)
+
 
 class PithosRestClient(TestCase):
 
@@ -769,6 +775,391 @@ class PithosMethods(TestCase):
                 ((42, 333, 800, '100,50-200,-600',), '42-100,50-200,200-333')):
             self.assertEqual(_range_up(*args), expected)
 
+    def test_trimmed_size(self):
+        from kamaki.clients.pithos.hashing import trimmed_size
+        for data, size, expected in (
+                ('', None, 0),
+                ('\x00' * 10, None, 0),
+                ('abc', None, 3),
+                ('abc\x00\x00', None, 3),
+                ('a\x00c\x00', None, 3),
+                ('abc\x00\x00d', 5, 3),
+                ('a' + '\x00' * 200000, None, 1),
+                ('a' * 70000 + '\x00' * 70000, None, 70000)):
+            self.assertEqual(trimmed_size(data, size), expected)
+
+    def test_BlockHasher(self):
+        from hashlib import sha256
+        from StringIO import StringIO
+        from kamaki.clients.pithos import hashing
+        from kamaki.clients.pithos.hashing import BlockHasher, block_hash
+        from kamaki.clients.utils.workers import get_pool
+        blocksize, nblocks = 4096, 9
+        data = urandom(blocksize * 3) + '\x00' * blocksize + urandom(
+            blocksize * 5 - 100) + '\x00' * 50
+        size = len(data)
+        expected = []
+        for offset in range(0, size, blocksize):
+            block = data[offset:offset + blocksize]
+            expected.append((
+                sha256(block.rstrip('\x00')).hexdigest(),
+                offset, len(block)))
+        self.assertEqual(len(expected), nblocks)
+        self.assertEqual(expected[3][0], sha256('').hexdigest())
+        self.assertEqual(block_hash(data, 'sha256'), sha256(
+            data.rstrip('\x00')).hexdigest())
+
+        tmpFile = NamedTemporaryFile()
+        tmpFile.write('head' + data + 'tail')
+        tmpFile.flush()
+        for workers, processes in product((1, 3), (False, True)):
+            hasher = BlockHasher(blocksize, 'sha256', workers, processes)
+            tmpFile.seek(4)
+            r = list(hasher.iter_hashes(tmpFile, size))
+            self.assertEqual(r, expected)
+            self.assertEqual(tmpFile.tell(), 4 + size)
+
+            f = StringIO(data)
+            self.assertEqual(list(hasher.iter_hashes(f, size)), expected)
+            f = StringIO(data[:blocksize * 2 + 10])
+            self.assertEqual(
+                list(hasher.iter_hashes(f, size)), expected[:2] + [(
+                    sha256(data[blocksize * 2:][:10].rstrip(
+                        '\x00')).hexdigest(),
+                    blocksize * 2, 10)])
+
+            #  Blocks read in buffers once, e.g., to upload them while hashed
+            blocks = [e + (data[e[1]:e[1] + e[2]], ) for e in expected]
+            f = StringIO(data)
+            self.assertEqual([(h, o, b, str(buf[:b])) for (
+                h, o, b, buf) in hasher.iter_blocks(f)], blocks)
+            tmpFile.seek(4)
+            self.assertEqual([(h, o, b, str(buf[:b])) for (
+                h, o, b, buf) in hasher.iter_blocks(tmpFile, size)], blocks)
+            self.assertEqual(tmpFile.tell(), 4 + size)
+
+            #  Regions of a file, without moving its position
+            tmpFile.seek(2)
+            regions = [(4 + blocksize * i, blocksize) for i in (5, 1, 3)]
+            self.assertEqual(
+                list(hasher.iter_regions(tmpFile, regions)), [
+                    (expected[i][0], 4 + blocksize * i, blocksize)
+                    for i in (5, 1, 3)])
+            self.assertEqual(tmpFile.tell(), 2)
+
+        #  Hashers share the worker pool and the hashing processes
+        pool = get_pool()
+        with patch.object(pool, 'run', wraps=pool.run) as run:
+            hasher = BlockHasher(blocksize, 'sha256', 3)
+            self.assertEqual(
+                list(hasher.iter_hashes(StringIO(data), size)), expected)
+        self.assertEqual(run.call_args[0][2], 3)
+        self.assertTrue(
+            hashing.get_process_pool() is hashing.get_process_pool())
+
+
+class HashIndex(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from kamaki.clients.pithos.hashindex import HashIndex
+        self.tmpdir = mkdtemp()
+        self.index = HashIndex('%s/sub/index.db' % self.tmpdir, max_size=800)
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    def test_key(self):
+        from os import utime
+        from time import time
+        from StringIO import StringIO
+        f = NamedTemporaryFile()
+        f.write('data')
+        f.flush()
+        self.assertEqual(self.index.key(f, 4, 1024, 'sha256'), None)
+        utime(f.name, (time() - 10, time() - 10))
+        key = self.index.key(f, 4, 1024, 'sha256')
+        self.assertTrue(key.endswith(':4:%s:1024:sha256' % int(
+            pithos.hashindex.fstat(f.fileno()).st_mtime * 1e9)))
+        self.assertNotEqual(key, self.index.key(f, 4, 1024, 'md5'))
+        self.assertEqual(self.index.key(f, 3, 1024, 'sha256'), None)
+        self.assertEqual(
+            self.index.key(StringIO('data'), 4, 1024, 'sha256'), None)
+        utime(f.name, (time() - 20, time() - 20))
+        self.assertNotEqual(key, self.index.key(f, 4, 1024, 'sha256'))
+
+    def test_set_get(self):
+        from hashlib import sha256, md5
+        hashes = [sha256(str(i)).hexdigest() for i in range(3)]
+        self.index.set('1:2:3:4:5:sha256', hashes)
+        self.assertEqual(self.index.get('1:2:3:4:5:sha256'), hashes)
+        hashes = [md5(str(i)).hexdigest() for i in range(3)]
+        self.index.set('1:2:3:4:5:md5', hashes)
+        self.assertEqual(self.index.get('1:2:3:4:5:md5'), hashes)
+        self.assertEqual(self.index.get('1:2:3:4:6:md5'), None)
+        self.assertEqual((self.index.hits, self.index.misses), (2, 1))
+        self.index.set('too:large:sha256', [sha256('').hexdigest()] * 4)
+        self.assertEqual(self.index.get('too:large:sha256'), None)
+
+    def test_evict(self):
+        from hashlib import sha256
+        hashes = [sha256(str(i)).hexdigest() for i in range(3)]
+        now = [0]
+        with patch('kamaki.clients.pithos.hashindex.time', lambda: now[0]):
+            for i in range(8):
+                now[0] += 1
+                self.index.set('k%s:sha256' % i, hashes)
+            now[0] += 1
+            self.index.get('k0:sha256')
+            self.index.set('k8:sha256', hashes)
+        self.assertEqual(sorted(self.index._execute(
+            'SELECT key FROM hashes')), sorted([('k0:sha256', )] + [
+                ('k%s:sha256' % i, ) for i in range(2, 9)]))
+        self.index.clear()
+        self.assertEqual(self.index.get('k8:sha256'), None)
+
+    def test_errors(self):
+        self.index._execute('DROP TABLE hashes')
+        self.assertEqual(self.index.get('k1:sha256'), None)
+        self.index.set('k1:sha256', [])
+
+
+class SharedBlocks(TestCase):
+
+    def setUp(self):
+        from kamaki.clients.pithos.dedup import SharedBlocks
+        self.shared = SharedBlocks()
+
+    def test_claim_done(self):
+        mine, theirs, others = set(), set(), set()
+        self.assertEqual(self.shared.ratio(), 1.0)
+        self.assertTrue(self.shared.claim('h1', 10, mine))
+        self.assertEqual(mine, set(['h1']))
+        self.assertFalse(self.shared.claim('h1', 10, theirs))
+        self.assertTrue(self.shared.claim('h1', 10, theirs, in_flight=False))
+        self.assertEqual(theirs, set())
+        self.shared.done('h1', mine)
+        self.assertEqual(mine, set())
+        self.assertTrue(self.shared.wait('h1'))
+        self.assertFalse(self.shared.claim('h1', 10, others, in_flight=False))
+        self.assertEqual(
+            (self.shared.blocks, self.shared.bytes), (3, 30))
+        self.assertEqual(
+            (self.shared.sent_blocks, self.shared.sent_bytes), (2, 20))
+        self.assertEqual(self.shared.ratio(), 1.5)
+
+        #  Claims of a block again by the same upload are not counted again
+        self.assertFalse(self.shared.claim('h1', 10, theirs))
+        self.assertEqual(
+            (self.shared.blocks, self.shared.bytes), (3, 30))
+
+        #  Failed blocks may be claimed again
+        self.assertTrue(self.shared.claim('h2', 10, mine))
+        self.shared.done('h2', theirs, failed=True)
+        self.assertFalse(self.shared.claim('h2', 10, theirs))
+        self.shared.done('h2', mine, failed=True)
+        self.assertFalse(self.shared.wait('h2'))
+        self.assertTrue(self.shared.claim('h2', 10, theirs))
+        self.shared.release(theirs)
+        self.assertEqual(theirs, set())
+        self.assertFalse(self.shared.wait('h2'))
+
+    def test_wait(self):
+        from threading import Thread
+        from time import sleep
+        mine, theirs = set(), set()
+        self.shared.claim('h1', 10, mine)
+        self.shared.claim('h2', 10, mine)
+        self.assertFalse(self.shared.claim('h1', 10, theirs))
+
+        def upload():
+            sleep(0.1)
+            self.shared.done('h1', mine)
+            self.shared.release(mine)
+
+        t = Thread(target=upload)
+        t.start()
+        self.assertTrue(self.shared.wait('h1'))
+        self.assertFalse(self.shared.wait('h2'))
+        t.join()
+
+
+class TransferJournal(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from kamaki.clients.pithos.journal import TransferJournal
+        self.tmpdir = mkdtemp()
+        self.journal = TransferJournal.open('job', '%s/jobs' % self.tmpdir)
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    def test_job_id(self):
+        from kamaki.clients.pithos.journal import job_id, digest
+        self.assertEqual(job_id('upload', '/a'), job_id('upload', '/a'))
+        self.assertNotEqual(job_id('upload', '/a'), job_id('upload', '/b'))
+        self.assertEqual(len(job_id('upload', '/a')), 16)
+        self.assertNotEqual(digest(8, ['h1', 'h2']), digest(8, ['h2', 'h1']))
+        self.assertNotEqual(digest(8, ['h1', 'h2']), digest(7, ['h1', 'h2']))
+
+    def test_key(self):
+        from os import utime
+        from time import time
+        from StringIO import StringIO
+        f = NamedTemporaryFile()
+        f.write('data')
+        f.flush()
+        key = self.journal.key(f)
+        st = pithos.journal.fstat(f.fileno())
+        self.assertEqual(key, '%s:%s:4:%s' % (
+            st.st_dev, st.st_ino, int(st.st_mtime * 1e9)))
+        self.assertEqual(
+            self.journal.key(f, identity=True), '%s:%s' % (
+                st.st_dev, st.st_ino))
+        utime(f.name, (time() - 10, time() - 10))
+        self.assertNotEqual(key, self.journal.key(f))
+        self.assertEqual(self.journal.key(StringIO('data')), None)
+
+    def test_complete(self):
+        self.assertTrue(self.journal.empty())
+        self.journal.complete('f1', 'k1', 'e1')
+        self.assertFalse(self.journal.empty())
+        self.assertEqual(self.journal.completed('f1', 'k1'), 'e1')
+        self.assertEqual(self.journal.completed('f1', 'k1', 'e1'), 'e1')
+        self.assertEqual(self.journal.completed('f1', 'k1', 'e2'), None)
+        self.assertEqual(self.journal.completed('f1', 'k2'), None)
+        self.assertEqual(self.journal.completed('f2', 'k1'), None)
+        self.assertEqual(self.journal.skipped, 2)
+
+    def test_begin_record(self):
+        self.assertEqual(self.journal.begin('f1', 'i1'), None)
+        self.journal.record('f1', [(0, 'h0'), (8, 'h1')])
+        self.journal.record('f1', [(16, 'h2')])
+        self.assertEqual(self.journal.completed('f1', 'i1'), None)
+        self.assertEqual(
+            self.journal.begin('f1', 'i1'), {0: 'h0', 8: 'h1', 16: 'h2'})
+        self.assertEqual(self.journal.begin('f1', 'i1', resume=False), None)
+        self.assertEqual(self.journal.begin('f1', 'i1'), {})
+        self.journal.record('f1', [(0, 'h0')])
+        self.assertEqual(self.journal.begin('f1', 'i2'), None)
+        self.assertEqual(self.journal.begin('f1', 'i2'), {})
+        self.journal.record('f1', [(0, 'h0')])
+        self.journal.complete('f1', 'k1', 'e1')
+        self.assertEqual(self.journal._execute('SELECT * FROM blocks'), [])
+
+    def test_remove(self):
+        from os import path
+        self.journal.complete('f1', 'k1', 'e1')
+        self.assertTrue(path.exists(self.journal.filename))
+        self.journal.remove()
+        self.assertFalse(path.exists(self.journal.filename))
+
+    def test_errors(self):
+        self.journal._execute('DROP TABLE files')
+        self.assertEqual(self.journal.completed('f1', 'k1'), None)
+        self.assertTrue(self.journal.empty())
+        self.journal.complete('f1', 'k1', 'e1')
+
+
+class ByteRanges(TestCase):
+
+    def _multipart(self, parts, total=100, chunk_size=7):
+        body = ''.join([
+            '\r\n--XyZ\r\nContent-Type: text/plain\r\n'
+            'Content-Range: bytes %s-%s/%s\r\n\r\n%s' % (
+                start, start + len(data) - 1, total, data)
+            for start, data in parts]) + '\r\n--XyZ--\r\n'
+        r = FR()
+        r.headers = {
+            'content-type': 'multipart/byteranges; boundary="XyZ"'}
+        r.iter_content = lambda: [
+            body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        return r
+
+    def test_range_header(self):
+        from kamaki.clients.pithos.ranges import range_header
+        self.assertEqual(range_header([(0, 9)]), 'bytes=0-9')
+        self.assertEqual(
+            range_header([(0, 9), (10, 19), (30, 39), (40, 44)]),
+            'bytes=0-19,30-44')
+
+    def test_iter_byteranges(self):
+        from kamaki.clients import ClientError
+        from kamaki.clients.pithos.ranges import iter_byteranges, cut
+        parts = [(0, 'a\r\n--XyZ\n' * 2), (30, 'b' * 10), (60, 'c')]
+        for chunk_size in (1, 7, 1000):
+            r = self._multipart(parts, chunk_size=chunk_size)
+            self.assertEqual(list(iter_byteranges(r)), parts)
+        self.assertEqual(cut(parts, 32, 35), 'bbbb')
+        self.assertEqual(cut(parts, 60, 60), 'c')
+        self.assertRaises(ClientError, cut, parts, 25, 35)
+
+        #  The body is read to its end, so that a streamed reply completes
+        r = self._multipart(parts, chunk_size=5)
+        chunks, read = r.iter_content() + ['epilogue'], []
+
+        def iter_content():
+            for chunk in chunks:
+                read.append(chunk)
+                yield chunk
+        r.iter_content = iter_content
+        self.assertEqual(list(iter_byteranges(r)), parts)
+        self.assertEqual(read, chunks)
+
+        r = self._multipart(parts)
+        body = ''.join(r.iter_content())
+        r.iter_content = lambda: [body[:-30]]
+        self.assertRaises(ClientError, list, iter_byteranges(r))
+
+        r = FR()
+        r.headers, r.content = {'content-range': 'bytes 10-13/100'}, 'data'
+        self.assertEqual(list(iter_byteranges(r, 20)), [(10, 'data')])
+        r.headers, r.status_code = {}, 206
+        self.assertEqual(list(iter_byteranges(r, 20)), [(20, 'data')])
+
+    def test_iter_byteranges_full_reply(self):
+        from kamaki.clients import ClientError
+        from kamaki.clients.pithos.ranges import iter_byteranges, cut
+        #  The server ignored the Range header of a multi-range GET
+        r = FR()
+        r.headers, r.status_code, r.content = {}, 200, 'abcdefghij'
+        parts = list(iter_byteranges(r, 4))
+        self.assertEqual(parts, [(0, 'abcdefghij')])
+        self.assertEqual(cut(parts, 4, 6), 'efg')
+        self.assertEqual(cut(parts, 8, 9), 'ij')
+        self.assertRaises(ClientError, cut, parts, 8, 10)
+
+    def test_range_planner(self):
+        from kamaki.clients.pithos.ranges import RangePlanner
+        from kamaki.clients.utils.timing import RequestTiming
+        planner = RangePlanner(1000, 16)
+        self.assertEqual(planner.blocks, 1)
+        planner.observe(None)
+        self.assertEqual(planner.blocks, 1)
+
+        #  ttfb of 40ms, 1ms per block: 0.2 = 0.04 / (0.04 + 160 * 0.001)
+        planner.observe(RequestTiming(
+            'GET', 'host', '/path', ttfb=0.04, transfer=0.001,
+            bytes_in=1000))
+        self.assertEqual(planner.blocks, 16)
+        planner.max_blocks = 200
+        self.assertEqual(planner.blocks, 160)
+        for i in range(50):
+            planner.observe(RequestTiming(
+                'GET', 'host', '/path', ttfb=0.001, transfer=0.01,
+                bytes_in=1000))
+        self.assertEqual(planner.blocks, 1)
+        self.assertEqual(RangePlanner(1000, 1).blocks, 1)
+        planner.max_blocks = 200
+        planner.observe(RequestTiming(
+            'GET', 'host', '/path', ttfb=10, transfer=0.001, bytes_in=1000))
+        self.assertTrue(planner.blocks > 1)
+        planner.whole_reply()
+        self.assertEqual(planner.blocks, 1)
+
 
 class PithosClient(TestCase):
 
@@ -846,12 +1237,60 @@ class PithosClient(TestCase):
         for i in range(len(r)):
             self.assert_dicts_are_equal(r[i], container_list[i])
 
+    def test__calculate_blocks_for_upload(self):
+        from hashlib import sha256
+        from os import utime
+        from time import time
+        tmpFile = self._create_temp_file(3)
+        utime(tmpFile.name, (time() - 10, time() - 10))
+        size, blocksize = 3 * 4 * 1024 * 1024 - 10, 4 * 1024 * 1024
+        index = MagicMock()
+        index.key.return_value, index.get.return_value = 'key', None
+        for hash_index in (None, index):
+            self.client.hash_index = hash_index
+            tmpFile.seek(0)
+            hashes, hmap = [], {}
+            self.client._calculate_blocks_for_upload(
+                blocksize, 'sha256', size, 3, hashes, hmap, tmpFile)
+            tmpFile.seek(0)
+            data = tmpFile.read(size)
+            expected = [sha256(data[i:i + blocksize].rstrip(
+                '\x00')).hexdigest() for i in range(0, size, blocksize)]
+            self.assertEqual(hashes, expected)
+            self.assertEqual(
+                hmap[expected[2]], (2 * blocksize, blocksize - 10))
+        self.assertEqual(index.key.mock_calls, [
+            call(tmpFile, size, blocksize, 'sha256')] * 2)
+        index.get.assert_called_once_with('key')
+        index.set.assert_called_once_with('key', expected)
+
+        #  Indexed hashes are not calculated again
+        index.get.return_value = ['h0', 'h1', 'h2']
+        tmpFile.seek(0)
+        hashes, hmap = [], {}
+        with patch('kamaki.clients.pithos.BlockHasher') as BH:
+            self.client._calculate_blocks_for_upload(
+                blocksize, 'sha256', size, 3, hashes, hmap, tmpFile)
+            self.assertFalse(BH.mock_calls)
+        self.assertEqual(hashes, ['h0', 'h1', 'h2'])
+        self.assertEqual(hmap['h2'], (2 * blocksize, blocksize - 10))
+        self.assertEqual(tmpFile.tell(), size)
+        self.assertEqual(index.set.call_count, 1)
+
+        #  Only files read from the start are indexed
+        tmpFile.seek(10)
+        hashes, hmap = [], {}
+        self.client._calculate_blocks_for_upload(
+            blocksize, 'sha256', size, 3, hashes, hmap, tmpFile)
+        self.assertEqual(len(index.key.mock_calls), 3)
+
     @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
     @patch('%s.container_post' % pithos_pkg, return_value=FR())
     @patch('%s.object_put' % pithos_pkg, return_value=FR())
     def test_upload_object(self, OP, CP, GCI):
         num_of_blocks = 8
         tmpFile = self._create_temp_file(num_of_blocks)
+        self.client.UPLOAD_PIPELINE = False
 
         # Without kwargs
         exp_headers = dict(id='container id', name='container name')
@@ -970,12 +1409,489 @@ class PithosClient(TestCase):
         self.assertEqual(OP.mock_calls[-1][2]['if_etag_not_match'], '*')
         self.assertEqual(OP.mock_calls[-1][2]['etag'], etag)
 
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_small_object(self, OP, GCI):
+        from StringIO import StringIO
+        tmpFile = NamedTemporaryFile()
+        self.files.append(tmpFile)
+        data = urandom(1000)
+        tmpFile.write(data)
+        tmpFile.flush()
+        tmpFile.seek(0)
+        FR.headers = dict(etag='3746')
+        bars = []
+
+        def progress(n):
+            bars.append(n)
+            yield
+            bars.append(n)
+            yield
+
+        sharing = dict(read=['u1', 'g1'], write=['u1'])
+        r = self.client.upload_object(
+            obj, tmpFile, hash_cb=progress, upload_cb=progress,
+            etag='3746', if_not_exist=True, content_type='text/plain',
+            sharing=sharing, public=True)
+        self.assertEqual(r, dict(etag='3746'))
+        self.assertEqual(bars, [1, 1, 1, 1])
+        OP.assert_called_once_with(
+            obj, data=data, content_type='text/plain', content_encoding=None,
+            content_disposition=None, if_etag_match=None,
+            if_etag_not_match='*', etag='3746', permissions=sharing,
+            public=True, success=201)
+        self.assertFalse(GCI.mock_calls)
+
+        self.client.upload_from_string(obj, data, if_etag_match='e')
+        self.assertEqual(OP.mock_calls[-1][2]['data'], data)
+        self.assertEqual(OP.mock_calls[-1][2]['if_etag_match'], 'e')
+        self.assertEqual(
+            OP.mock_calls[-1][2]['content_type'], 'application/octet-stream')
+
+        #  The size of files which are not regular must be given
+        self.client.upload_object(obj, StringIO(data), size=10)
+        self.assertEqual(OP.mock_calls[-1][2]['data'], data[:10])
+        self.assertEqual(len(OP.mock_calls), 3)
+        self.assertEqual(self.client._small_object_size(StringIO(data)), None)
+        self.assertRaises(
+            AssertionError, self.client.upload_object,
+            obj, StringIO(data), size=1001)
+        self.client.SMALL_OBJECT_SIZE = 999
+        self.assertEqual(self.client._small_object_size(tmpFile), None)
+        self.client.SMALL_OBJECT_SIZE = 1000
+        self.assertEqual(self.client._small_object_size(tmpFile), 1000)
+        self.client.SMALL_OBJECT_SIZE = 0
+        self.assertEqual(self.client._small_object_size(tmpFile, 10), None)
+        self.assertFalse(GCI.mock_calls)
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s.container_post' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg)
+    def test_upload_object_from_stream(self, OP, CP, GCI):
+        from StringIO import StringIO
+        from hashlib import sha256
+        OP.return_value = MagicMock(status_code=201, headers=dict(a='b'))
+        self.client.upload_object(obj, StringIO('small'))
+        self.assertEqual(OP.mock_calls[-1][2]['data'], 'small')
+        self.assertFalse(GCI.mock_calls)
+
+        blocksize = int(container_info['x-container-block-size'])
+        data = urandom(blocksize) * 2 + urandom(100)
+        hashes = [sha256(data[i:i + blocksize]).hexdigest() for i in range(
+            0, len(data), blocksize)]
+        failing, sent = [data[-100:]], []
+
+        def container_post(**kwargs):
+            sent.append(memoryview(kwargs['data']).tobytes())
+            if kwargs['data'] in failing:
+                failing.remove(kwargs['data'])
+                return MagicMock(json=['wrong'])
+            return MagicMock(json=[sha256(kwargs['data']).hexdigest()])
+
+        CP.side_effect = container_post
+        OP.reset_mock()
+        r = self.client.upload_object(obj, StringIO(data), hash_cb=MagicMock())
+        self.assertEqual(r, dict(a='b'))
+        self.assertEqual(sorted(sent), sorted(
+            [data[:blocksize], data[-100:], data[-100:]]))
+        OP.assert_called_once()
+        self.assertEqual(OP.mock_calls[0][2]['json'], dict(
+            bytes=len(data), hashes=hashes))
+        self.assertEqual(GCI.mock_calls, [call()])
+
+        #  A stream cannot be read again for blocks reported missing
+        OP.reset_mock()
+        OP.return_value = MagicMock(status_code=409, json=hashes[:1])
+        self.assertRaises(
+            ClientError, self.client.upload_object, obj, StringIO(data))
+        OP.assert_called_once()
+
+        #  Blocks that always fail are reported
+        failing.extend([data[-100:]] * 8)
+        OP.reset_mock()
+        self.assertRaises(
+            ClientError, self.client.upload_object, obj, StringIO(data))
+        self.assertFalse(OP.mock_calls)
+
+    def test__batch_blocks(self):
+        self.client.BLOCK_BATCH_SIZE = 10
+        blocks = [('h%s' % i, 'x' * size) for i, size in enumerate(
+            (4, 4, 4, 1, 4, 2, 4, 4, 4))]
+        self.assertEqual(
+            [[h for h, d in batch] for batch in self.client._batch_blocks(
+                blocks, 4)],
+            [['h0', 'h1'], ['h2', 'h3'], ['h4', 'h5'], ['h6', 'h7'], ['h8']])
+        self.client.BLOCK_BATCH_SIZE = 12
+        self.assertEqual(
+            [[h for h, d in batch] for batch in self.client._batch_blocks(
+                blocks, 4)],
+            [['h0', 'h1', 'h2'], ['h3'], ['h4', 'h5'], ['h6', 'h7', 'h8']])
+        self.assertEqual(
+            list(self.client._batch_blocks(blocks)),
+            [[block] for block in blocks])
+        self.client.BLOCK_BATCH_SIZE = 0
+        self.assertEqual(
+            list(self.client._batch_blocks(blocks, 4)),
+            [[block] for block in blocks])
+
+    @patch('%s.container_post' % pithos_pkg)
+    def test__put_blocks(self, CP):
+        from hashlib import sha256
+        blocks = [(sha256(d).hexdigest(), d) for d in (
+            'abcd', 'efgh', 'ijkl', 'mn', 'opqr')]
+        sent = []
+
+        def container_post(data, **kwargs):
+            sent.append(memoryview(data).tobytes())
+            self.assertEqual(kwargs, dict(
+                update=True, content_type='application/octet-stream',
+                content_length=len(data), format='json', success=202))
+            return MagicMock(json=[sha256(data[i:i + 4]).hexdigest() for (
+                i) in range(0, len(data), 4)])
+
+        CP.side_effect = container_post
+        self.client.BLOCK_BATCH_SIZE = 8
+        with patch.object(
+                self.client, '_clone', wraps=self.client._clone) as clone:
+            r = list(self.client._put_blocks(blocks, blocksize=4))
+            #  Parallel POSTs do not share the headers and params of a client
+            self.assertEqual(len(clone.mock_calls), 3)
+        self.assertEqual(sorted(r), sorted([(h, False) for h, d in blocks]))
+        self.assertEqual(sorted(sent), ['abcdefgh', 'ijklmn', 'opqr'])
+
+        #  A wrong hash fails its own block only
+        CP.reset_mock()
+        CP.side_effect = lambda data, **kw: MagicMock(json=[
+            blocks[0][0], 'wrong'] if data == 'abcdefgh' else [
+                sha256(data).hexdigest()])
+        r = dict(self.client._put_blocks(blocks[:2], blocksize=4))
+        self.assertEqual(r, {blocks[0][0]: False, blocks[1][0]: True})
+        self.assertEqual(len(CP.mock_calls), 1)
+
+        #  No more POSTs once canceled, and claims are released
+        from threading import Event
+        from kamaki.clients.pithos.dedup import SharedBlocks
+        CP.reset_mock()
+        shared = self.client.shared_blocks = SharedBlocks()
+        claims = set()
+        for hash, data in blocks:
+            shared.claim(hash, len(data), claims)
+        self.client.cancel = Event()
+        self.client.cancel.set()
+        self.assertRaises(ClientError, list, self.client._put_claimed_blocks(
+            blocks, claims, blocksize=4))
+        self.assertFalse(CP.mock_calls)
+        self.assertEqual(claims, set())
+        self.assertFalse(shared.wait(blocks[0][0]))
+        self.client.cancel = self.client.shared_blocks = None
+
+        #  Rejected batches are sent again, one block per POST
+        CP.reset_mock()
+        CP.side_effect = lambda data, **kw: sent.append(
+            memoryview(data).tobytes()) or MagicMock(json=[
+                sha256(data).hexdigest()])
+        sent = []
+        r = list(self.client._put_blocks(blocks, blocksize=4))
+        self.assertEqual(sorted(r), sorted([(h, False) for h, d in blocks]))
+        self.assertEqual(sorted(sent), [
+            'abcd', 'abcdefgh', 'efgh', 'ijkl', 'ijklmn', 'mn', 'opqr'])
+        self.assertEqual(self.client.BLOCK_BATCH_SIZE, 0)
+
+        #  Failed single blocks are reported
+        CP.reset_mock()
+        CP.side_effect = ClientError('Bad Request', 400)
+        r = list(self.client._put_blocks(blocks[:2], blocksize=4))
+        self.assertEqual(sorted(r), sorted([(h, True) for h, d in blocks[:2]]))
+        self.assertEqual(len(CP.mock_calls), 2)
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test__pipeline_upload(self, GOH):
+        from StringIO import StringIO
+        from hashlib import sha256
+        blocksize = 1024
+        data = urandom(blocksize * 6)
+        f = StringIO(data)
+        args = ('obj', f, blocksize, 'sha256', len(data), 6)
+        for forced in (True, False):
+            self.client.UPLOAD_PIPELINE = forced
+            self.assertEqual(
+                self.client._pipeline_upload(*args), (forced, dict()))
+        self.assertFalse(GOH.mock_calls)
+        self.client.UPLOAD_PIPELINE = None
+        self.assertEqual(self.client._pipeline_upload(
+            'obj', f, blocksize, 'sha256', 10, 1), (False, dict()))
+
+        hashes = [sha256(data[i:i + blocksize]).hexdigest() for i in range(
+            0, len(data), blocksize)]
+        args = ('obj', f, blocksize, 'sha256', len(data) - blocksize, 5)
+        for remote, expected in (
+                (hashes, False),
+                (hashes[3:], False),
+                (hashes[4:], True),
+                ([], True)):
+            GOH.return_value = dict(hashes=remote)
+            f.seek(blocksize)
+            pipeline, probe = self.client._pipeline_upload(*args)
+            self.assertEqual(pipeline, expected)
+            GOH.assert_called_with('obj')
+            #  The probe blocks are not read again
+            self.assertEqual(probe['key'], None)
+            self.assertEqual([(h, o, b, str(buf[:b])) for (
+                h, o, b, buf) in probe['blocks']], [(
+                    hashes[i], (i - 1) * blocksize, blocksize,
+                    data[i * blocksize:(i + 1) * blocksize]) for i in range(
+                        1, 6)])
+            self.assertEqual(f.tell(), len(data))
+
+        GOH.side_effect = ClientError('Not Found', 404)
+        f.seek(blocksize)
+        self.assertTrue(self.client._pipeline_upload(*args)[0])
+        GOH.side_effect = ClientError('Unauthorized', 401)
+        f.seek(blocksize)
+        self.assertRaises(ClientError, self.client._pipeline_upload, *args)
+
+        #  Indexed files are not hashed, so there is nothing to overlap
+        self.client.hash_index = MagicMock()
+        self.client.hash_index.get.return_value = hashes
+        f.seek(0)
+        self.assertEqual(self.client._pipeline_upload(
+            'obj', f, blocksize, 'sha256', len(data), 6), (False, dict()))
+        self.assertEqual(f.tell(), 0)
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s.container_post' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg)
+    def test_upload_object_pipelined(self, OP, CP, GCI):
+        from hashlib import sha256
+        blocksize = int(container_info['x-container-block-size'])
+        tmpFile = self._create_temp_file(3)
+        tmpFile.seek(blocksize)
+        block = tmpFile.read(blocksize)
+        tmpFile.seek(3 * blocksize)
+        tmpFile.write(block[:-10])
+        tmpFile.seek(0)
+        data = tmpFile.read()
+        size = 4 * blocksize - 10
+        hashes = [sha256(data[i:i + blocksize]).hexdigest() for i in range(
+            0, size, blocksize)]
+        self.assertEqual(len(set(hashes)), 4)
+        tmpFile.seek(3 * blocksize)
+        tmpFile.write(block)
+        data, size = data[:3 * blocksize] + block, 4 * blocksize
+        hashes[3] = hashes[1]
+        failing, sent = [], []
+
+        def container_post(**kwargs):
+            sent.append(memoryview(kwargs['data']).tobytes())
+            if kwargs['data'] in failing:
+                failing.remove(kwargs['data'])
+                return MagicMock(json=['wrong'])
+            return MagicMock(json=[sha256(kwargs['data']).hexdigest()])
+
+        CP.side_effect = container_post
+        OP.return_value = MagicMock(status_code=201, headers=dict(a='b'))
+        self.client.UPLOAD_PIPELINE = True
+        self.client.PIPELINE_WINDOW = 2 * blocksize
+        bars = []
+
+        def progress(n):
+            bar = [n, 0]
+            bars.append(bar)
+            while True:
+                yield
+                bar[1] += 1
+
+        tmpFile.seek(0)
+        with patch.object(
+                self.client, '_async_requests',
+                wraps=self.client._async_requests) as AR:
+            r = self.client.upload_object(
+                obj, tmpFile, hash_cb=progress, upload_cb=progress)
+            self.assertEqual(AR.mock_calls[0][1][2], 2)
+        self.assertEqual(r, dict(a='b'))
+        self.assertEqual(sorted(sent), sorted(set([
+            data[i:i + blocksize] for i in range(0, size, blocksize)])))
+        for c in CP.mock_calls:
+            self.assertEqual(c[2]['update'], True)
+            self.assertEqual(c[2]['success'], 202)
+        OP.assert_called_once()
+        self.assertEqual(
+            OP.mock_calls[0][2]['json'], dict(bytes=size, hashes=hashes))
+        self.assertEqual(bars, [[4, 4], [4, 4]])
+
+        #  Blocks that failed to upload are uploaded again
+        CP.reset_mock()
+        del sent[:]
+        failing.append(data[:blocksize])
+        OP.reset_mock()
+        OP.side_effect = [
+            MagicMock(status_code=409, json=[hashes[0]]),
+            MagicMock(status_code=201, headers=dict(a='b'))]
+        tmpFile.seek(0)
+        self.client.upload_object(obj, tmpFile)
+        self.assertEqual(len(CP.mock_calls), 4)
+        self.assertEqual(sent[-1], data[:blocksize])
+        self.assertEqual(len(OP.mock_calls), 2)
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s.container_post' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg)
+    def test_upload_object_shared_blocks(self, OP, CP, GCI):
+        from hashlib import sha256
+        from kamaki.clients.pithos.dedup import SharedBlocks
+        blocksize = int(container_info['x-container-block-size'])
+        tmpFile = self._create_temp_file(2)
+        data = tmpFile.read()
+        hashes = [sha256(data[i:i + blocksize]).hexdigest() for i in range(
+            0, len(data), blocksize)]
+        copy = NamedTemporaryFile()
+        copy.write(data)
+        copy.flush()
+        CP.side_effect = lambda **kw: MagicMock(json=[
+            sha256(kw['data']).hexdigest()])
+        for pipeline in (True, False):
+            self.client.UPLOAD_PIPELINE = pipeline
+            shared = self.client.shared_blocks = SharedBlocks()
+            CP.reset_mock()
+            OP.reset_mock()
+            responses = [
+                MagicMock(status_code=409, json=hashes),
+                MagicMock(status_code=201, headers=dict(a='b'))] * 2
+            OP.side_effect = responses[1::2] if pipeline else responses
+            for f in (tmpFile, copy):
+                f.seek(0)
+                self.client.upload_object(obj, f)
+            self.assertEqual(len(CP.mock_calls), 2)
+            self.assertEqual(
+                (shared.blocks, shared.sent_blocks), (4, 2))
+            self.assertEqual(shared.ratio(), 2.0)
+            self.assertEqual(shared.bytes, 2 * len(data))
+
+        #  Blocks left to an upload which fails are sent
+        from threading import Timer
+        self.client.UPLOAD_PIPELINE = True
+        shared = self.client.shared_blocks = SharedBlocks()
+        theirs = set()
+        shared.claim(hashes[0], blocksize, theirs)
+        sent = []
+        CP.side_effect = lambda **kw: MagicMock(json=[
+            sent.append(sha256(kw['data']).hexdigest()) or sent[-1]])
+        OP.reset_mock()
+        OP.side_effect = [MagicMock(status_code=201, headers=dict(a='b'))]
+        failure = Timer(0.1, shared.done, (hashes[0], theirs, True))
+        failure.start()
+        tmpFile.seek(0)
+        self.client.upload_object(obj, tmpFile)
+        failure.join()
+        self.assertEqual(sorted(sent), sorted(hashes))
+        self.assertTrue(shared.wait(hashes[0]))
+        self.assertEqual((shared.blocks, shared.sent_blocks), (3, 3))
+        self.client.shared_blocks = None
+
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_create_directories(self, OP):
+        dirs = ['d%s' % i for i in range(5)]
+        self.client.create_directories(dirs)
+        self.assertEqual(sorted([c[2]['obj'] for c in OP.mock_calls]), dirs)
+        for c in OP.mock_calls:
+            self.assertEqual(c[2]['content_type'], 'application/directory')
+            self.assertEqual(c[2]['content_length'], 0)
+            self.assertEqual(c[2]['success'], 201)
+        OP.side_effect = ClientError('Forbidden', 403)
+        self.assertRaises(ClientError, self.client.create_directories, dirs)
+
+    @patch('%s.upload_object' % pithos_pkg)
+    def test_upload_objects(self, UO):
+        from StringIO import StringIO
+        attempts = dict()
+
+        def upload_object(obj, f, **kwargs):
+            attempts[obj] = attempts.get(obj, 0) + 1
+            self.assertEqual(f.read(), 'data of %s' % obj)
+            if obj == 'c' or (obj == 'b' and attempts[obj] < 2):
+                raise ClientError('Failed', 500)
+            return dict(etag=obj, type=kwargs['content_type'])
+
+        UO.side_effect = upload_object
+        sources = [(StringIO('skip data of %s' % obj), obj, dict(
+            content_type='text/%s' % obj)) for obj in 'abc']
+        for f, obj, kwargs in sources:
+            f.seek(5)
+        r = sorted(
+            self.client.upload_objects(iter(sources)), key=lambda x: x[1])
+        self.assertEqual(len(r), 3)
+        self.assertEqual([(obj, f) for f, obj, result in r], [
+            (obj, f) for f, obj, kwargs in sources])
+        self.assertEqual(r[0][2], dict(etag='a', type='text/a'))
+        self.assertEqual(r[1][2], dict(etag='b', type='text/b'))
+        self.assertTrue(isinstance(r[2][2], ClientError))
+        self.assertEqual(attempts, dict(a=1, b=2, c=3))
+
+        attempts.clear()
+        r = list(self.client.upload_objects(
+            [(StringIO('data of c'), 'c', dict())], retries=0))
+        self.assertTrue(isinstance(r[0][2], ClientError))
+        self.assertEqual(attempts, dict(c=1))
+
+        #  Uploads in flight are canceled if the generator is closed
+        clones, clone = [], self.client._clone
+
+        def record_clone():
+            clones.append(clone())
+            return clones[-1]
+        with patch.object(self.client, '_clone', side_effect=record_clone):
+            uploads = self.client.upload_objects([(
+                StringIO('data of %s' % obj), obj, dict(
+                    content_type='text/%s' % obj)) for obj in 'ab'])
+            uploads.next()
+            self.assertFalse(clones[0].cancel.is_set())
+            uploads.close()
+        self.assertTrue(clones[0].cancel.is_set())
+        self.assertEqual(self.client.cancel, None)
+
+    @patch('%s.upload_object' % pithos_pkg)
+    def test_upload_objects_journal(self, UO):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from kamaki.clients.pithos.journal import TransferJournal
+        tmpdir = mkdtemp()
+        try:
+            self.client.journal = TransferJournal.open('job', tmpdir)
+            UO.side_effect = lambda obj, f, **kwargs: dict(etag='e' + obj)
+            files = [NamedTemporaryFile() for i in range(3)]
+            for f in files:
+                f.write('data')
+                f.flush()
+                f.seek(0)
+            files[2].seek(2)
+            sources = [(f, 'o%s' % i, dict()) for i, f in enumerate(files)]
+            r = list(self.client.upload_objects(sources))
+            self.assertEqual(len(UO.mock_calls), 3)
+            self.assertEqual(self.client.journal.skipped, 0)
+
+            #  Uploaded files are skipped, unless modified or read in part
+            files[1].write('more data')
+            files[1].flush()
+            for f in files:
+                f.seek(0)
+            files[2].seek(2)
+            r = list(self.client.upload_objects(sources))
+            self.assertEqual(
+                sorted([c[1][0] for c in UO.mock_calls[3:]]), ['o1', 'o2'])
+            self.assertEqual(self.client.journal.skipped, 1)
+            self.assertEqual(
+                [result for f, obj, result in r if obj == 'o0'],
+                [dict(etag='eo0')])
+        finally:
+            rmtree(tmpdir)
+
     @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
     @patch('%s.container_post' % pithos_pkg, return_value=FR())
     @patch('%s.object_put' % pithos_pkg, return_value=FR())
     def test_upload_from_string(self, OP, CP, GCI):
         num_of_blocks = 2
         tmpFile = self._create_temp_file(num_of_blocks)
+        self.client.UPLOAD_PIPELINE = False
         tmpFile.seek(0)
         src_str = tmpFile.read()
 
@@ -1290,7 +2206,11 @@ class PithosClient(TestCase):
     def test_download_to_string(self, GET, GOH):
         FR.content = 'some sample content'
         num_of_blocks = len(object_hashmap['hashes'])
-        r = self.client.download_to_string(obj)
+        with patch.object(
+                self.client, '_clone', wraps=self.client._clone) as clone:
+            r = self.client.download_to_string(obj)
+            #  Parallel GETs do not share the headers and params of a client
+            self.assertEqual(len(clone.mock_calls), num_of_blocks)
         expected_content = FR.content * num_of_blocks
         self.assertEqual(expected_content, r)
         self.assertEqual(len(GET.mock_calls), num_of_blocks)
@@ -1310,11 +2230,15 @@ class PithosClient(TestCase):
         GOH.assert_called_once_with(obj, **expargs)
 
         r = self.client.download_to_string(obj, **kwargs)
-        expargs['data_range'] = 'bytes=%s' % kwargs['range_str']
         for k, v in expargs.items():
             self.assertEqual(
                 GET.mock_calls[-1][2][k],
                 v or kwargs.get(k))
+        #  The range of each GET is a header of its own request
+        self.assertEqual(GET.mock_calls[-1][2]['data_range'], None)
+        self.assertEqual(
+            GET.mock_calls[-1][2]['async_headers'],
+            dict(Range='bytes=%s' % kwargs['range_str']))
 
     @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
     @patch('%s.object_get' % pithos_pkg, return_value=FR())
@@ -1401,6 +2325,352 @@ class PithosClient(TestCase):
                 self.assertTrue('data_range' in GET.mock_calls[-1][2])
             else:
                 self.assertEqual(GET.mock_calls[-1][2][k], v)
+        self.assertTrue(GET.mock_calls[-1][2]['stream'])
+
+    @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
+    @patch('%s.object_get' % pithos_pkg)
+    def test_download_object_buffer(self, GET, GOH):
+        from threading import Lock, current_thread
+        from time import sleep
+        blocksize = object_hashmap['block_size']
+        num_of_blocks = len(object_hashmap['hashes'])
+        lock, started, ahead, writers = Lock(), [0], [], set()
+        tmpFile = NamedTemporaryFile()
+
+        class SlowFile(object):
+            writes = 0
+
+            def __getattr__(self, name):
+                return getattr(tmpFile, name)
+
+            def write(self, data):
+                sleep(0.02)
+                tmpFile.write(data)
+                writers.add(current_thread())
+                with lock:
+                    SlowFile.writes += 1
+
+        def object_get(obj, **kwargs):
+            with lock:
+                started[0] += 1
+                ahead.append(started[0] - SlowFile.writes)
+            return FR()
+
+        GET.side_effect = object_get
+        FR.content = 'x' * 16
+        self.client.MIN_THREADS = self.client.MAX_THREADS = num_of_blocks
+        self.client.DOWNLOAD_BUFFER = 2 * blocksize
+        self.client.download_object(obj, SlowFile())
+        self.assertEqual(len(GET.mock_calls), num_of_blocks)
+        self.assertEqual(SlowFile.writes, num_of_blocks)
+        self.assertTrue(max(ahead) <= 3)
+        self.assertFalse(current_thread() in writers)
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    @patch('%s.object_get' % pithos_pkg, return_value=FR())
+    def test_download_object_sparse(self, GET, GOH):
+        from kamaki.clients.pithos.hashing import zero_block_hash, block_hash
+        blocksize, zero = 1024, zero_block_hash('sha256')
+        hashes = [zero, 'h1', zero, zero, 'h4', zero]
+        GOH.return_value = dict(
+            block_hash='sha256', block_size=blocksize, bytes=5 * 1024 + 10,
+            hashes=hashes)
+        FR.content = 'x' * blocksize
+        tmpFile = NamedTemporaryFile()
+        tmpFile.write('old data' * 1024)
+        self.client.download_object(obj, tmpFile)
+        self.assertEqual(sorted([
+            c[2]['async_headers']['Range'] for c in GET.mock_calls]), [
+                'bytes=1024-2047', 'bytes=4096-5119'])
+        tmpFile.seek(0)
+        data = tmpFile.read()
+        self.assertEqual(len(data), 5 * 1024 + 10)
+        for i, h in enumerate(hashes):
+            self.assertEqual(
+                data[i * blocksize:(i + 1) * blocksize].strip('\x00'),
+                '' if h == zero else 'x' * blocksize)
+
+        #  Resumed, zero blocks over other data are written
+        tmpFile.seek(0)
+        tmpFile.write('y' * 2 * blocksize)
+        tmpFile.flush()
+        GOH.return_value = dict(GOH.return_value, hashes=[
+            zero, 'h1', 'h2', 'h3', block_hash('x' * blocksize, 'sha256'),
+            zero])
+        GET.reset_mock()
+        self.client.download_object(obj, tmpFile, resume=True)
+        self.assertEqual(sorted([
+            c[2]['async_headers']['Range'] for c in GET.mock_calls]), [
+                'bytes=1024-2047', 'bytes=2048-3071', 'bytes=3072-4095'])
+        tmpFile.seek(0)
+        self.assertEqual(tmpFile.read(blocksize), '\x00' * blocksize)
+
+    def _range_get(self, data, ranges):
+        """:returns: a fake object_get of data, which serves multiple ranges
+        with a multipart/byteranges reply and reports a slow first byte"""
+        from kamaki.clients.utils.timing import RequestTiming
+
+        def object_get(obj, **kwargs):
+            data_range = kwargs.get('data_range') or kwargs[
+                'async_headers']['Range']
+            ranges.append(data_range)
+            spans = [[int(i) for i in span.split('-')] for span in (
+                data_range.split('=')[1].split(','))]
+            r = FR()
+            r.status_code = 206
+            r.timing = RequestTiming(
+                'GET', 'host', '/path', ttfb=0.05, transfer=0.001,
+                bytes_in=1024)
+            if len(spans) == 1:
+                r.headers, r.content = dict(), data[
+                    spans[0][0]:spans[0][1] + 1]
+                return r
+            body = ''.join([
+                '\r\n--b0undary\r\nContent-Range: bytes %s-%s/%s'
+                '\r\n\r\n%s' % (start, end, len(data), data[
+                    start:end + 1]) for start, end in spans])
+            r.headers = {
+                'content-type': 'multipart/byteranges; boundary=b0undary'}
+            body += '\r\n--b0undary--\r\n'
+            r.iter_content = lambda: [body[:100], body[100:]]
+            return r
+        return object_get
+
+    def _whole_get(self, range_get, data, blocksize):
+        """:returns: a fake object_get which replies to a GET of more than a
+        block with the whole object, like servers which ignore multi-range
+        headers"""
+        def object_get(obj, **kwargs):
+            r = range_get(obj, **kwargs)
+            spans = [[int(i) for i in span.split('-')] for span in (
+                kwargs['async_headers']['Range'][6:].split(','))]
+            if sum([end - start + 1 for start, end in spans]) > blocksize:
+                r.status_code, r.headers, r.content = 200, dict(), data
+            return r
+        return object_get
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    @patch('%s.object_get' % pithos_pkg)
+    def test_download_object_multirange(self, GET, GOH):
+        blocksize, ranges = 1024, []
+        hashes = ['h0', 'h1', 'h2', 'h3', 'h1', 'h5']
+        data = ''.join([chr(97 + int(h[1])) * blocksize for h in hashes])
+        data = data[:5 * blocksize + 10]
+        GOH.return_value = dict(
+            block_hash='sha256', block_size=blocksize, bytes=len(data),
+            hashes=hashes)
+        GET.side_effect = self._range_get(data, ranges)
+        self.client.GET_BATCH_SIZE = 4 * blocksize
+        tmpFile = NamedTemporaryFile()
+        self.client.download_object(obj, tmpFile)
+        #  One block until the first reply, then runs of blocks at once,
+        #  parsed while read
+        self.assertEqual(ranges, ['bytes=0-1023', 'bytes=1024-4095,5120-5129'])
+        self.assertEqual(
+            [c[2].get('stream') for c in GET.mock_calls], [False, True])
+        tmpFile.seek(0)
+        self.assertEqual(tmpFile.read(), data)
+
+        #  A server which ignores multi-range headers sends the whole object,
+        #  and then blocks are fetched one per GET
+        range_get, GET.side_effect = GET.side_effect, self._whole_get(
+            GET.side_effect, data, blocksize)
+        del ranges[:]
+        self.client.GET_BATCH_SIZE = 2 * blocksize
+        tmpFile = NamedTemporaryFile()
+        self.client.download_object(obj, tmpFile)
+        self.assertEqual(ranges, [
+            'bytes=0-1023', 'bytes=1024-3071', 'bytes=3072-4095',
+            'bytes=5120-5129'])
+        tmpFile.seek(0)
+        self.assertEqual(tmpFile.read(), data)
+        GET.side_effect = range_get
+
+        #  With a range, a block per GET
+        del ranges[:]
+        self.client.download_object(
+            obj, NamedTemporaryFile(), range_str='0-9999')
+        self.assertEqual(len(ranges), 5)
+
+        #  GET_BATCH_SIZE=0 for a block per GET
+        del ranges[:]
+        self.client.GET_BATCH_SIZE = 0
+        self.client.download_object(obj, NamedTemporaryFile())
+        self.assertEqual(len(ranges), 5)
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    @patch('%s.object_get' % pithos_pkg)
+    def test_download_object_verify(self, GET, GOH):
+        from threading import Event
+        from kamaki.clients.pithos import hashing
+        blocksize, ranges, fetched, waited = 1024, [], Event(), []
+        #  Leading zeros are hashed, as in uploads
+        data = urandom(blocksize) * 2 + '\x00' * 10 + urandom(
+            3 * blocksize - 10) + urandom(10)
+        GOH.return_value = dict(
+            block_hash='sha256', block_size=blocksize, bytes=len(data),
+            hashes=[hashing.block_hash(
+                data[i:i + blocksize], 'sha256') for i in range(
+                    0, len(data), blocksize)])
+        range_get = self._range_get(data, ranges)
+
+        def object_get(obj, **kwargs):
+            r = range_get(obj, **kwargs)
+            if ranges[-1] == 'bytes=4096-5119':
+                fetched.set()
+            return r
+        GET.side_effect = object_get
+        hash_mapped = hashing._hash_mapped
+
+        def slow_hash(*args):
+            waited.append(fetched.wait(5))
+            return hash_mapped(*args)
+
+        tmpFile = NamedTemporaryFile()
+        tmpFile.write(data[:blocksize] + 'x' * blocksize + data[
+            2 * blocksize:4 * blocksize])
+        tmpFile.flush()
+        self.client.GET_BATCH_SIZE, self.client.HASH_WORKERS = 0, 2
+        with patch.object(hashing, '_hash_mapped', side_effect=slow_hash):
+            self.client.download_object(obj, tmpFile, resume=True)
+        #  The blocks past the local file are fetched while the rest are
+        #  hashed in parallel
+        self.assertEqual(waited, [True] * 4)
+        self.assertEqual(ranges, [
+            'bytes=4096-5119', 'bytes=5120-5129', 'bytes=1024-2047'])
+        self.assertEqual(self.client.resumed_bytes, 3 * blocksize)
+        tmpFile.seek(0)
+        self.assertEqual(tmpFile.read(), data)
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    @patch('%s.object_get' % pithos_pkg)
+    def test_download_to_string_batches(self, GET, GOH):
+        blocksize, ranges = 1024, []
+        data = urandom(5 * blocksize + 10)
+        GOH.return_value = dict(
+            block_hash='sha256', block_size=blocksize, bytes=len(data),
+            hashes=['h%s' % i for i in range(6)])
+        GET.side_effect = self._range_get(data, ranges)
+        self.client.GET_BATCH_SIZE = 4 * blocksize
+        self.assertEqual(self.client.download_to_string(obj), data)
+        self.assertEqual(ranges, [
+            'bytes=0-1023', 'bytes=1024-5119', 'bytes=5120-5129'])
+        #  Replies of many blocks are parsed while read
+        self.assertEqual(
+            [c[2]['stream'] for c in GET.mock_calls], [False, True, False])
+
+        #  After a reply of the whole object, a block per GET
+        GET.side_effect = self._whole_get(GET.side_effect, data, blocksize)
+        del ranges[:]
+        self.client.GET_BATCH_SIZE = 2 * blocksize
+        self.assertEqual(self.client.download_to_string(obj), data)
+        self.assertEqual(ranges, [
+            'bytes=0-1023', 'bytes=1024-3071', 'bytes=3072-4095',
+            'bytes=4096-5119', 'bytes=5120-5129'])
+
+    @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
+    @patch('%s.object_get' % pithos_pkg)
+    def test_download_object_ordered(self, GET, GOH):
+        from os import pipe, fdopen
+        from threading import Lock
+        from time import sleep
+        blocksize = object_hashmap['block_size']
+        num_of_blocks = len(object_hashmap['hashes'])
+        lock, started, ahead = Lock(), [0], []
+
+        class Pipe(object):
+            data = []
+
+            def write(self, data):
+                self.data.append(data)
+
+            def flush(self):
+                pass
+
+        class Response(object):
+
+            def __init__(self, content):
+                self.content = content
+
+        def object_get(obj, **kwargs):
+            start = int(kwargs['async_headers']['Range'][6:].split('-')[0])
+            with lock:
+                started[0] += 1
+                ahead.append(started[0] - len(Pipe.data))
+            #  Later blocks arrive first
+            sleep(0.01 * (num_of_blocks - start // blocksize))
+            return Response('block %s' % (start // blocksize))
+
+        GET.side_effect = object_get
+        self.client.MIN_THREADS = self.client.MAX_THREADS = num_of_blocks
+        self.client.STREAM_WINDOW = 3
+        self.client.download_object(obj, Pipe())
+        self.assertEqual(
+            Pipe.data, ['block %s' % i for i in range(num_of_blocks)])
+        self.assertTrue(max(ahead) <= 4)
+
+        r, w = pipe()
+        r, w = fdopen(r), fdopen(w, 'w')
+        self.assertFalse(self.client._seekable(w))
+        self.assertTrue(self.client._seekable(NamedTemporaryFile()))
+        self.assertFalse(self.client._seekable(Pipe()))
+        r.close()
+        w.close()
+
+    @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
+    @patch('%s.object_get' % pithos_pkg, return_value=FR())
+    def test_download_object_journal(self, GET, GOH):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from kamaki.clients.pithos.journal import TransferJournal
+        blocksize = object_hashmap['block_size']
+        num_of_blocks = len(object_hashmap['hashes'])
+        FR.content = 'x' * blocksize
+        tmpdir = mkdtemp()
+        try:
+            journal = self.client.journal = TransferJournal.open(
+                'job', tmpdir)
+            tmpFile = NamedTemporaryFile()
+            name = self.client._journal_name('download', obj)
+
+            #  An interrupted download records the blocks written
+            journal.begin(name, journal.key(tmpFile, identity=True))
+            journal.record(name, [(i * blocksize, h) for i, h in enumerate(
+                object_hashmap['hashes'][:3])])
+            tmpFile.truncate(3 * blocksize)
+            with patch.object(pithos.BlockHasher, 'iter_regions') as HFF:
+                self.client.download_object(obj, tmpFile, resume=True)
+                self.assertEqual(HFF.mock_calls, [])
+            self.assertEqual(len(GET.mock_calls), num_of_blocks - 3)
+            self.assertEqual(sorted([
+                int(c[2]['async_headers']['Range'][6:].split('-')[0])
+                for c in GET.mock_calls]), [
+                    i * blocksize for i in range(3, num_of_blocks)])
+            self.assertEqual(journal._execute('SELECT * FROM blocks'), [])
+
+            #  A completed download is skipped
+            self.client.download_object(obj, tmpFile, resume=True)
+            self.assertEqual(len(GET.mock_calls), num_of_blocks - 3)
+            self.assertEqual(journal.skipped, 1)
+
+            #  ...unless the local file or the remote object is modified
+            GOH.return_value = dict(object_hashmap, hashes=list(reversed(
+                object_hashmap['hashes'])))
+            self.client.download_object(obj, tmpFile, resume=True)
+            self.assertEqual(
+                len(GET.mock_calls), 2 * num_of_blocks - 3)
+
+            #  Blocks are recorded while downloading
+            self.client.JOURNAL_INTERVAL = 0
+            records = []
+            journal.record = lambda name, blocks: records.extend(blocks)
+            self.client.download_object(obj, NamedTemporaryFile())
+            self.assertEqual(
+                sorted(records),
+                [(i * blocksize, h) for i, h in enumerate(
+                    GOH.return_value['hashes'])])
+        finally:
+            rmtree(tmpdir)
 
     def test_get_object_hashmap(self):
         FR.json = object_hashmap
@@ -1831,8 +3101,20 @@ if __name__ == '__main__':
     if not argv[1:] or argv[1] == 'PithosRestClient':
         not_found = False
         runTestCase(PithosRestClient, 'PithosRest Client', argv[2:])
+    if not argv[1:] or argv[1] == 'HashIndex':
+        not_found = False
+        runTestCase(HashIndex, 'Hash Index', argv[2:])
+    if not argv[1:] or argv[1] == 'SharedBlocks':
+        not_found = False
+        runTestCase(SharedBlocks, 'Shared Blocks', argv[2:])
+    if not argv[1:] or argv[1] == 'TransferJournal':
+        not_found = False
+        runTestCase(TransferJournal, 'Transfer Journal', argv[2:])
+    if not argv[1:] or argv[1] == 'ByteRanges':
+        not_found = False
+        runTestCase(ByteRanges, 'Byte Ranges', argv[2:])
     if not argv[1:] or argv[1] == 'PithosMethods':
         not_found = False
-        runTestCase(PithosRestClient, 'Pithos Methods', argv[2:])
+        runTestCase(PithosMethods, 'Pithos Methods', argv[2:])
     if not_found:
         print('TestCase %s not found' % argv[1])
@@ -43,6 +43,11 @@ class StorageClient(Client):
         self.account = account
         self.container = container
 
+    def _accept_compression(self, method, headers, params):
+        """Only listings are compressed, object data are served as stored"""
+        return params.get('format') == 'json' and super(
+            StorageClient, self)._accept_compression(method, headers, params)
+
     def _assert_account(self):
         if not self.account:
             raise ClientError("No account provided")
@@ -175,6 +175,19 @@ class StorageClient(TestCase):
 
     #  Pithos+ methods that extend storage API
 
+    def test__accept_compression(self):
+        self.client.ACCEPT_COMPRESSION = True
+        for params, exp in (
+                (dict(format='json'), True), (dict(format='xml'), False),
+                (dict(), False)):
+            self.assertEqual(
+                self.client._accept_compression('GET', {}, params), exp)
+        self.assertFalse(self.client._accept_compression(
+            'GET', {'Range': 'bytes=0-1'}, dict(format='json')))
+        self.client.ACCEPT_COMPRESSION = False
+        self.assertFalse(self.client._accept_compression(
+            'GET', {}, dict(format='json')))
+
     @patch('%s.head' % client_pkg, return_value=FR())
     def test_get_account_info(self, head):
         FR.headers = account_info
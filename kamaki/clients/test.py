@@ -31,14 +31,15 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
-from mock import patch, call
+from mock import patch, call, MagicMock
 from unittest import makeSuite, TestSuite, TextTestRunner, TestCase
 from time import sleep
 from inspect import getmembers, isclass
 from itertools import product
-from random import randint
 
-from kamaki.clients.utils.test import Utils
+from kamaki.clients.utils.test import (
+    Utils, Future, WorkerPool, ConcurrencyController, Timing, SSLContext,
+    JSONParse, HTTPCache, EventLoop, BufferPool)
 from kamaki.clients.astakos.test import (
     AstakosClient, LoggedAstakosClient, CachedAstakosClient)
 from kamaki.clients.compute.test import ComputeClient, ComputeRestClient
@@ -49,7 +50,8 @@ from kamaki.clients.cyclades.test import (
 from kamaki.clients.image.test import ImageClient
 from kamaki.clients.storage.test import StorageClient
 from kamaki.clients.pithos.test import (
-    PithosClient, PithosRestClient, PithosMethods)
+    PithosClient, PithosRestClient, PithosMethods, HashIndex, SharedBlocks,
+    TransferJournal, ByteRanges)
 from kamaki.clients.blockstorage.test import (
     BlockStorageRestClient, BlockStorageClient)
 
@@ -146,12 +148,20 @@ class FakeResp(object):
     status = 42
     status_code = 200
 
-    def read(self):
-        return self.READ
+    def read(self, size=None):
+        if size is None:
+            return self.READ
+        offset = getattr(self, '_offset', 0)
+        self._offset = offset + size
+        return self.READ[offset:offset + size]
 
     def getheaders(self):
         return self.HEADERS.items()
 
+    def getheader(self, name, default=None):
+        return dict([(k.lower(), v) for k, v in self.getheaders()]).get(
+            name.lower(), default)
+
 
 class ResponseManager(TestCase):
 
@@ -204,6 +214,226 @@ class ResponseManager(TestCase):
         self.RM._request_performed = False
         self.assertEqual(self.RM.json, FakeResp.HEADERS)
         self.assertTrue(isinstance(perform.call_args[0][0], self.HTTPC))
+        with patch(
+                'kamaki.clients.utils.jsonparse.loads',
+                side_effect=AssertionError('decoded twice')):
+            self.assertTrue(self.RM.json is self.RM.json)
+
+    @patch('kamaki.clients.RequestManager.perform')
+    def test_iter_json(self, perform):
+        from json import dumps
+        items = [dict(name='o%s' % i, bytes=i) for i in range(100)]
+        for doc, key in ((items, None), (dict(servers=items), 'servers')):
+            FakeResp.READ = dumps(doc)
+            for stream in (False, True):
+                perform.return_value = FakeResp()
+                self.RM._request_performed, self.RM.stream = False, stream
+                self.assertEqual(
+                    list(self.RM.iter_json(key, chunk_size=10)), items)
+        from kamaki.clients import ClientError as CE
+        FakeResp.READ, perform.return_value = '[1, 2', FakeResp()
+        self.RM._request_performed = False
+        self.assertRaises(CE, list, self.RM.iter_json())
+
+    @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
+    def test_iter_content(self, perform):
+        self.assertEqual(
+            list(self.RM.iter_content(7)), ['somethi', 'ng to r', 'ead'])
+        self.RM._request_performed = False
+        self.RM.stream = True
+        self.assertEqual(
+            list(self.RM.iter_content(7)), ['somethi', 'ng to r', 'ead'])
+        self.assertEqual(self.RM._pooled, None)
+
+    @patch('kamaki.clients.RequestManager.perform')
+    def test_readinto(self, perform):
+        for stream in (False, True):
+            perform.return_value = FakeResp()
+            self.RM._request_performed = False
+            self.RM.stream = stream
+            buf, chunks = bytearray(7), []
+            size = self.RM.readinto(buf)
+            while size:
+                chunks.append(str(buf[:size]))
+                size = self.RM.readinto(buf)
+            self.assertEqual(''.join(chunks), FakeResp.READ)
+            self.assertEqual(self.RM._pooled, None)
+
+    def test__data_to_log(self):
+        self.RM._token, self.RM.LOG_DATA_LIMIT = 't0k3n', 10
+        self.assertEqual(self.RM._data_to_log('a\nt0k3n'), 'a\\n...')
+        self.assertEqual(
+            self.RM._data_to_log('t0k3n\t' + 'x' * 20),
+            '...\\txxxxxx... (14 more)')
+
+    @patch('kamaki.clients.RequestManager.perform')
+    def test_decompress(self, perform):
+        import zlib
+        plain = ''.join(['%s %s\n' % (i, 'x' * (i % 50)) for i in range(999)])
+        for encoding, wbits in (('gzip', 16 + zlib.MAX_WBITS), (
+                'deflate', zlib.MAX_WBITS), ('identity', None)):
+            if wbits:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+                FakeResp.READ = compressor.compress(plain) + (
+                    compressor.flush())
+            else:
+                FakeResp.READ = plain
+            FakeResp.HEADERS = {'Content-Encoding': encoding}
+            for decompress, stream in product((False, True), (False, True)):
+                perform.return_value = FakeResp()
+                self.RM._request_performed, self.RM.stream = False, stream
+                self.RM.decompress, self.RM._decompressor = decompress, None
+                exp = plain if (decompress or not wbits) else FakeResp.READ
+                if stream:
+                    chunks = list(self.RM.iter_content(100))
+                    self.assertTrue(all([len(c) <= 100 for c in chunks]))
+                    self.assertEqual(''.join(chunks), exp)
+                else:
+                    self.assertEqual(self.RM.content, exp)
+        FakeResp.HEADERS = dict(k='v', k1='v1', k2='v2')
+
+        FakeResp.HEADERS = {'Content-Encoding': 'gzip'}
+        FakeResp.READ, perform.return_value = 'not gzip', FakeResp()
+        self.RM._request_performed, self.RM.stream = False, False
+        self.RM.decompress = True
+        try:
+            from kamaki.clients import ClientError as CE
+            self.assertRaises(CE, self.RM._get_response)
+        finally:
+            FakeResp.HEADERS = dict(k='v', k1='v1', k2='v2')
+
+    @patch('kamaki.clients.RequestManager.perform')
+    def test_cache(self, perform):
+        cache = MagicMock()
+        self.RM.cache, self.RM.cache_key = cache, 'key'
+        FakeResp.HEADERS = dict(etag='e1')
+        try:
+            cache.get.return_value = None
+            perform.return_value = FakeResp()
+            self.assertEqual(self.RM.content, FakeResp.READ)
+            cache.set.assert_called_once_with(
+                'key', FakeResp.status, FakeResp.reason, FakeResp.HEADERS,
+                FakeResp.READ, 'e1', None)
+            self.assertFalse('If-None-Match' in self.RM.request.headers)
+
+            cache.get.return_value = dict(
+                status=200, reason='OK', headers=dict(etag='e1'),
+                body='cached', etag='e1', last_modified='yesterday')
+            perform.return_value, FakeResp.status = FakeResp(), 304
+            self.RM._request_performed = False
+            self.assertEqual(self.RM.content, 'cached')
+            self.assertEqual(
+                (self.RM.status_code, self.RM.headers), (200, dict(etag='e1')))
+            cache.hit.assert_called_once_with('key')
+            self.assertEqual(self.RM.request.headers['If-None-Match'], 'e1')
+            self.assertEqual(
+                self.RM.request.headers['If-Modified-Since'], 'yesterday')
+        finally:
+            FakeResp.HEADERS = dict(k='v', k1='v1', k2='v2')
+            FakeResp.status = 42
+
+    @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
+    def test_timing(self, perform):
+        from kamaki.clients.utils import timing
+        records = []
+        timing.add_hook(records.append)
+        try:
+            for stream in (False, True):
+                self.RM._request_performed, self.RM.stream = False, stream
+                self.assertEqual(self.RM.content, FakeResp.READ)
+        finally:
+            timing.remove_hook(records.append)
+        self.assertEqual(len(records), 2)
+        for record in records:
+            self.assertEqual(
+                (record.method, record.endpoint, record.path),
+                ('GET', 'ok', '/'))
+            self.assertEqual(record.status, FakeResp.status)
+            self.assertEqual(record.bytes_in, len(FakeResp.READ))
+            self.assertEqual((record.bytes_out, record.retries), (0, 0))
+            self.assertTrue(record.total >= record.pool_wait + record.ttfb)
+        self.assertEqual(self.RM.timing, records[-1])
+
+    @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
+    def test_stream(self, perform):
+        self.RM.stream = True
+        self.assertEqual(self.RM.status_code, FakeResp.status)
+        self.assertNotEqual(self.RM._pooled, None)
+        pooled = self.RM._pooled
+        with patch.object(pooled, 'release') as release:
+            self.assertEqual(self.RM.content, FakeResp.READ)
+            release.assert_called_once_with()
+        self.assertEqual(self.RM._pooled, None)
+        self.assertEqual(self.RM.content, FakeResp.READ)
+
+        #  Closing before the body is consumed must not reuse the connection
+        self.RM._request_performed = False
+        self.RM.stream = True
+        self.RM.status_code
+        pooled = self.RM._pooled
+        with patch.object(pooled, 'release') as release:
+            with patch.object(pooled.obj, 'close') as close:
+                self.RM.close()
+                close.assert_called_once_with()
+                release.assert_called_once_with()
+        self.assertEqual(self.RM._pooled, None)
+
+    @patch('kamaki.clients.RequestManager.perform')
+    def test_transport(self, perform):
+        from kamaki.clients.utils import eventloop, workers
+        from kamaki.clients import ClientError as CE, KamakiSSLError
+        from httplib import HTTPException
+        from ssl import SSLError
+        submitted = []
+
+        def submit(request):
+            submitted.append(request)
+            future = workers.Future(None)
+            response = eventloop.Response(
+                'HTTP/1.1', 201, 'Created', [('k', 'v')], 'body')
+            response.timing = dict(pool_wait=0.5, connect=0.1)
+            future._set_result(response)
+            return future
+
+        self.RM.transport = MagicMock(submit=submit)
+        pending = self.RM.start()
+        self.assertEqual(pending, self.RM.start())
+        self.assertEqual(len(submitted), 1)
+        self.assertEqual(
+            (self.RM.status_code, self.RM.headers, self.RM.content),
+            (201, dict(k='v'), 'body'))
+        self.assertEqual(len(submitted), 1)
+        self.assertFalse(perform.called)
+        self.assertEqual(
+            (self.RM.timing.pool_wait, self.RM.timing.connect), (0.5, 0.1))
+
+        for error, exp in (
+                (HTTPException('failed'), CE),
+                (SSLError(1, 'bad'), KamakiSSLError)):
+            failed = workers.Future(None)
+            failed._set_result(exception=error)
+            self.RM.transport = MagicMock(submit=lambda r: failed)
+            self.RM._request_performed, self.RM._pending = False, None
+            self.assertRaises(exp, getattr, self.RM, 'status_code')
+
+    @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
+    def test_budget(self, perform):
+        from kamaki.clients.utils import workers
+        self.RM.budget = MagicMock(spec=['acquire', 'release'])
+        self.assertEqual(self.RM.content, FakeResp.READ)
+        self.assertEqual(self.RM.budget.mock_calls, [
+            call.acquire(), call.release()])
+
+        #  On the transport, the slot is kept until the response arrives
+        self.RM.budget.reset_mock()
+        pending = workers.Future(None)
+        self.RM.transport = MagicMock(submit=lambda r: pending)
+        self.RM._request_performed, self.RM._pending = False, None
+        self.RM.start()
+        self.assertEqual(self.RM.budget.mock_calls, [call.acquire()])
+        pending._set_result(exception=IOError('failed'))
+        self.assertEqual(self.RM.budget.mock_calls, [
+            call.acquire(), call.release()])
 
     @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
     def test_all(self, perform):
@@ -309,49 +539,100 @@ class Client(TestCase):
         DATE_FORMATS = ['%a %b %d %H:%M:%S %Y']
         self.assertEqual(self.client.DATE_FORMATS, DATE_FORMATS)
 
-    def test__init_thread_limit(self):
-        exp = 'Nothing set here'
-        for faulty in (-1, 0.5, 'a string', {}):
-            self.assertRaises(
-                AssertionError,
-                self.client._init_thread_limit,
-                faulty)
-            self.assertEqual(exp, getattr(self.client, '_thread_limit', exp))
-            self.assertEqual(exp, getattr(self.client, '_elapsed_old', exp))
-            self.assertEqual(exp, getattr(self.client, '_elapsed_new', exp))
-        self.client._init_thread_limit(42)
-        self.assertEqual(42, self.client._thread_limit)
-        self.assertEqual(0.0, self.client._elapsed_old)
-        self.assertEqual(0.0, self.client._elapsed_new)
-
-    def test__watch_thread_limit(self):
-        waits = (
-            dict(args=((0.1, 1), (0.1, 2), (0.2, 1), (0.7, 1), (0.3, 2))),
-            dict(args=((1.0 - (i / 10.0), (i + 1)) for i in range(7))),
-            dict(max=1, args=tuple([(randint(1, 10) / 3.0, 1), ] * 10)),
-            dict(
-                limit=5,
-                args=tuple([
-                    (1.0 + (i / 10.0), (5 - i - 1)) for i in range(4)] + [
-                    (2.0, 1), (1.9, 2), (2.0, 1), (2.0, 2)])),
-            dict(args=tuple(
-                [(1.0 - (i / 10.0), (i + 1)) for i in range(7)] + [
-                (0.1, 7), (0.2, 6), (0.4, 5), (0.3, 6), (0.2, 7), (0.1, 7)])),)
-        for wait_dict in waits:
-            if 'max' in wait_dict:
-                self.client.MAX_THREADS = wait_dict['max']
-            else:
-                self.client.MAX_THREADS = 7
-            if 'limit' in wait_dict:
-                self.client._init_thread_limit(wait_dict['limit'])
+    def test__accept_compression(self):
+        for accept, headers, exp in (
+                (False, {}, False), (True, {}, True),
+                (True, {'Range': 'bytes=0-1'}, False),
+                (True, {'accept-encoding': 'identity'}, False)):
+            self.client.ACCEPT_COMPRESSION = accept
+            self.assertEqual(
+                bool(self.client._accept_compression('GET', headers, {})),
+                exp)
+
+    def test__cache_key(self):
+        self.assertEqual(
+            self.client._cache_key('GET', {}, 'http://a/b', False), None)
+        self.client.http_cache = MagicMock()
+        self.client.http_cache.key.return_value = 'key'
+        for method, headers, stream, exp in (
+                ('GET', {}, False, 'key'), ('head', {}, False, 'key'),
+                ('PUT', {}, False, None), ('GET', {}, True, None),
+                ('GET', {'Range': 'bytes=0-1'}, False, None),
+                ('GET', {'if-match': 'e1'}, False, None)):
+            self.assertEqual(self.client._cache_key(
+                method, headers, 'http://a/b', stream), exp)
+        self.client.http_cache.key.assert_called_with(
+            'head', 'http://a/b', None)
+
+    def test__concurrency(self):
+        self.client.MIN_THREADS, self.client.MAX_THREADS = 2, 7
+        controller = self.client._concurrency()
+        self.assertEqual((2, 7), (controller.floor, controller.ceiling))
+        self.assertTrue(2 <= controller.limit <= 7)
+        shared = controller.controller
+        self.assertEqual(shared, self.client._concurrency().controller)
+        self.client.MAX_THREADS = 1
+        self.assertEqual(2, self.client._concurrency().ceiling)
+
+        other = self.client.__class__(self.endpoint_url, self.token)
+        other.MIN_THREADS, other.MAX_THREADS = 1, 3
+        other_controller = other._concurrency()
+        self.assertEqual(shared, other_controller.controller)
+        self.assertEqual((1, 3), (
+            other_controller.floor, other_controller.ceiling))
+        self.assertTrue(shared.ceiling >= 7)
+        self.assertEqual((2, 7), (controller.floor, controller.ceiling))
+        shared._limit = 5
+        self.assertEqual((controller.limit, other_controller.limit), (5, 3))
+        shared._limit = 1
+        self.assertEqual((controller.limit, other_controller.limit), (2, 1))
+
+    def test__async_requests(self):
+        from kamaki.clients.utils import eventloop, workers
+        self.assertEqual(self.client._async_requests(
+            self.client.get, [{}]).__class__.__name__, 'generator')
+
+        def submit(request):
+            future = workers.Future(None)
+            status = int(request.path.split('/')[-1])
+            future._set_result(eventloop.Response(
+                'HTTP/1.1', status, 'Reason', [], request.path))
+            return future
+
+        self.client.transport = MagicMock(submit=submit)
+        self.client.MIN_THREADS = self.client.MAX_THREADS = 3
+        statuses = [200, 206, 404, 200, 206]
+        futures = list(self.client._async_requests(self.client.get, [dict(
+            path='/%s' % status, success=(200, 206))
+            for status in statuses]))
+        self.assertEqual(
+            sorted([f.index for f in futures]), range(len(statuses)))
+        for future in futures:
+            if statuses[future.index] == 404:
+                self.assertTrue(isinstance(future.exception(), self.CE))
+                self.assertEqual(future.exception().status, 404)
             else:
-                self.client._init_thread_limit()
-                self.client._watch_thread_limit(list())
-                self.assertEqual(1, self.client._thread_limit)
-            for wait, exp_limit in wait_dict['args']:
-                self.client._elapsed_new = wait
-                self.client._watch_thread_limit(list())
-                self.assertEqual(exp_limit, self.client._thread_limit)
+                self.assertEqual(
+                    future.result().content, '/%s' % statuses[future.index])
+
+    def test_async_run(self):
+        from time import sleep
+
+        def square(x):
+            sleep(0.01 * (5 - x))
+            return x * x
+
+        for max_threads in (1, 3, 7):
+            self.client.MAX_THREADS = max_threads
+            self.assertEqual(
+                self.client.async_run(square, [dict(x=i) for i in range(5)]),
+                [0, 1, 4, 9, 16])
+
+        def fail(x):
+            raise self.CE('Failed %s' % x, status=x)
+
+        self.assertRaises(
+            self.CE, self.client.async_run, fail, [dict(x=404)] * 3)
 
     @patch('kamaki.clients.Client.set_header')
     def test_set_header(self, SH):
@@ -382,7 +663,7 @@ class Client(TestCase):
                 ('/some/path', None, ['some', 'path']),
                 (dict(), dict(h1='v1'), dict(h1='v2', h2='v2')),
                 (dict(), dict(p1='v1'), dict(p1='v2', p2=None, p3='v3')),
-                (dict(), dict(data='some data'), dict(
+                (dict(), dict(data='some data'), dict(stream=True), dict(
                     success=400,
                     json=dict(k2='v2', k1='v1')))):
             method, path, kwargs = args[0], args[1], args[-1]
@@ -398,7 +679,10 @@ class Client(TestCase):
             self.client.request(method, path, **kwargs)
             self.assertEqual(
                 RespInit.mock_calls[-1],
-                call(FR, connection_retry_limit=0, poolsize=None))
+                call(
+                    FR,
+                    connection_retry_limit=0, poolsize=None,
+                    stream=kwargs.get('stream', False)))
 
     @patch('kamaki.clients.Client.request', return_value='lala')
     def _test_foo(self, foo, request):
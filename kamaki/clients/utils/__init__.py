@@ -31,6 +31,7 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
+import re
 import unicodedata
 
 
@@ -97,24 +98,68 @@ def path4url(*args):
 def readall(openfile, size, retries=7):
     """Read a file until size is reached"""
     remains = size if size > 0 else 0
-    buf = ''
+    chunks = []
     for i in range(retries):
         tmp_buf = openfile.read(remains)
         if tmp_buf:
-            buf += tmp_buf
+            chunks.append(tmp_buf)
             remains -= len(tmp_buf)
             if remains > 0:
                 continue
-        return buf
+        return ''.join(chunks)
     raise IOError('Failed to read %s bytes from file' % size)
 
 
+def _read_into(openfile, view):
+    """Read once into a memoryview, without an intermediate string if the
+    file supports readinto"""
+    if hasattr(openfile, 'readinto'):
+        return openfile.readinto(view) or 0
+    tmp_buf = openfile.read(len(view))
+    view[:len(tmp_buf)] = tmp_buf
+    return len(tmp_buf)
+
+
+def readinto(openfile, buf, size=None, retries=7):
+    """Read a file into a preallocated buffer until size is reached
+
+    :param buf: (bytearray) the buffer, filled from its start
+
+    :param size: (int) bytes to read, default is len(buf)
+
+    :returns: (int) the bytes read, less than size only at EOF
+    """
+    size = len(buf) if size is None else min(size, len(buf))
+    view, got = memoryview(buf), 0
+    for i in range(retries):
+        n = _read_into(openfile, view[got:size]) if got < size else 0
+        if n:
+            got += n
+            if got < size:
+                continue
+        return got
+    raise IOError('Failed to read %s bytes from file' % size)
+
+
+#  Runs of characters that may need escaping, i.e., not printable ascii
+_NON_PRINTABLE = re.compile(r'[^\x20-\x7e]+')
+
+
+def _escape_str_run(match):
+    return match.group().encode("string_escape")
+
+
+def _escape_unicode_run(match):
+    return "".join(ch.encode("unicode_escape") if (
+        unicodedata.category(ch)[0]) == "C" else ch for ch in match.group())
+
+
 def escape_ctrl_chars(s):
-    """Escape control characters from unicode and string objects."""
+    """Escape control characters from unicode and string objects.
+    Printable ascii runs are skipped by a regular expression, so that mostly
+    printable data are escaped in C and not one character at a time"""
     if isinstance(s, unicode):
-        return "".join(ch.encode("unicode_escape") if (
-            unicodedata.category(ch)[0]) == "C" else ch for ch in s)
+        return _NON_PRINTABLE.sub(_escape_unicode_run, s)
     if isinstance(s, basestring):
-        return "".join(
-            [c if 31 < ord(c) < 127 else c.encode("string_escape") for c in s])
+        return _NON_PRINTABLE.sub(_escape_str_run, s)
     return s
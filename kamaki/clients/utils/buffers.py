@@ -0,0 +1,91 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+from threading import Lock
+
+#  Idle buffers kept by a pool, in bytes
+MAX_IDLE = 64 * 1024 * 1024
+
+
+class BufferPool(object):
+    """Preallocated bytearray buffers of a fixed size, reused for block I/O
+    instead of allocating a new string for every block. A buffer is taken
+    with get and given back with put, when the request using it completes.
+    The pool does not block: if no buffer is idle, a new one is allocated,
+    so memory is bounded by the requests in flight.
+    """
+
+    def __init__(self, size, max_idle=MAX_IDLE):
+        """
+        :param size: (int) the size of each buffer
+
+        :param max_idle: (int) bytes of idle buffers to keep, the rest are
+            left to the garbage collector
+        """
+        self.size = size
+        self.max_free = max(1, max_idle // max(size, 1))
+        self._free, self._lock = [], Lock()
+
+    def get(self):
+        """:returns: (bytearray) a buffer of size bytes, with stale data"""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.size)
+
+    def put(self, buf):
+        """Give a buffer back to the pool. It must not be used afterwards"""
+        if len(buf) != self.size:
+            raise ValueError('Buffer of %s bytes, pool of %s' % (
+                len(buf), self.size))
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
+
+    def idle(self):
+        """:returns: (int) the number of idle buffers"""
+        return len(self._free)
+
+
+_pools, _pools_lock = dict(), Lock()
+
+
+def get_pool(size):
+    """:returns: (BufferPool) the pool of size-byte buffers shared by all
+    clients of a process"""
+    with _pools_lock:
+        pool = _pools.get(size)
+        if pool is None:
+            pool = _pools[size] = BufferPool(size)
+        return pool
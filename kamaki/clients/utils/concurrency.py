@@ -0,0 +1,214 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+from threading import Condition, Lock
+from time import time
+from logging import getLogger
+
+log = getLogger(__name__)
+
+
+class ConcurrencyController(object):
+    """Adjust the number of requests in flight to an endpoint host
+
+    The limit is adjusted after every round, i.e., after as many responses as
+    the current limit. In slow start, the limit doubles every round, as long
+    as the throughput (bytes/s or responses/s) improves. Then, it grows by one
+    when the throughput improves, drops by one when the throughput drops, and
+    is probed upwards after STALL_ROUNDS rounds without change. Server
+    backpressure (BACKPRESSURE statuses or failed connections) cuts the limit
+    by BACKOFF, at most once per round trip.
+
+    The limit is also a budget: requests which acquire a slot before they
+    are sent (see acquire) are kept within the limit, even if sent by many
+    parallel transfers.
+    """
+
+    BACKPRESSURE = (429, 502, 503)
+    BACKOFF = 0.5
+    #  Relative throughput changes smaller than that are considered noise
+    TOLERANCE = 0.05
+    STALL_ROUNDS = 3
+    #  If idle for longer, previous measurements are stale
+    IDLE_RESET = 10.0
+    #  Seconds between checks of the limit while waiting for a slot
+    SLOT_WAIT = 1.0
+
+    def __init__(self, floor=1, ceiling=1):
+        self._lock = Lock()
+        self._slots, self.flying = Condition(Lock()), 0
+        self.floor, self.ceiling = 1, 1
+        self.set_bounds(floor, ceiling)
+        self._limit = float(self.floor)
+        self.latency = None
+        self._slow_start, self._backoff_until = True, 0.0
+        self._last_throughput, self._stalled = None, 0
+        self._last_record = 0.0
+        self._new_round(time())
+
+    @property
+    def limit(self):
+        """:returns: (int) the number of requests allowed in flight"""
+        return max(self.floor, min(self.ceiling, int(self._limit)))
+
+    def set_bounds(self, floor, ceiling):
+        assert floor > 0, 'Concurrency floor must be a +int'
+        with self._lock:
+            self.floor, self.ceiling = floor, max(floor, ceiling)
+
+    def widen(self, ceiling):
+        """Let the limit grow up to ceiling, if higher. The bounds of a
+        shared controller are never narrowed by its users, which apply their
+        own bounds to the limit (see BoundedController)"""
+        with self._lock:
+            self.ceiling = max(self.ceiling, ceiling)
+
+    def acquire(self, limit=None):
+        """Wait for a slot, i.e., until less than limit requests which
+        acquired a slot are in flight. Each slot must be released
+
+        :param limit: (callable) returns the limit, default is self.limit
+        """
+        with self._slots:
+            while self.flying >= (limit() if limit else self.limit):
+                self._slots.wait(self.SLOT_WAIT)
+            self.flying += 1
+
+    def release(self):
+        with self._slots:
+            self.flying -= 1
+            self._slots.notify()
+
+    def _new_round(self, now):
+        self._round_start, self._round_bytes, self._round_count = now, 0, 0
+
+    def _adjust(self, now):
+        elapsed = max(now - self._round_start, 1e-6)
+        throughput = (self._round_bytes or self._round_count) / elapsed
+        last, self._last_throughput = self._last_throughput, throughput
+        if last is None or throughput > last * (1 + self.TOLERANCE):
+            self._stalled = 0
+            if self._slow_start:
+                self._limit *= 2
+            else:
+                self._limit += 1
+        elif throughput < last * (1 - self.TOLERANCE):
+            self._slow_start, self._stalled = False, 0
+            self._limit -= 1
+        else:
+            self._slow_start = False
+            self._stalled += 1
+            if self._stalled >= self.STALL_ROUNDS:
+                self._stalled = 0
+                self._limit += 1
+        self._limit = max(self.floor, min(self.ceiling, self._limit))
+
+    def record(self, latency, nbytes=0, status=200):
+        """Record the outcome of a request
+
+        :param latency: (float) seconds from sending the request to reading
+            the whole response
+
+        :param nbytes: (int) bytes sent and received
+
+        :param status: (int) response status, None for connection failures
+        """
+        now = time()
+        with self._lock:
+            if status is None or status in self.BACKPRESSURE:
+                if now >= self._backoff_until:
+                    self._limit = max(self.floor, self._limit * self.BACKOFF)
+                    self._slow_start, self._last_throughput = False, None
+                    self._backoff_until = now + (self.latency or latency)
+                    log.debug('Backpressure (%s), concurrency limit: %s' % (
+                        status, self.limit))
+                self._new_round(now)
+                return
+            if now - self._last_record > self.IDLE_RESET:
+                self._last_throughput = None
+                self._new_round(now - latency)
+            self._last_record = now
+            self.latency = latency if self.latency is None else (
+                0.8 * self.latency + 0.2 * latency)
+            self._round_bytes += nbytes
+            self._round_count += 1
+            if self._round_count >= self.limit:
+                self._adjust(now)
+                self._new_round(now)
+
+
+class BoundedController(object):
+    """The ConcurrencyController of an endpoint host, as seen by a client
+    with its own bounds (e.g., MIN_THREADS and MAX_THREADS). The limit is
+    the shared estimate within these bounds, so that clients with different
+    bounds do not change the bounds of the shared controller
+    """
+
+    def __init__(self, controller, floor=1, ceiling=1):
+        assert floor > 0, 'Concurrency floor must be a +int'
+        self.controller = controller
+        self.floor, self.ceiling = floor, max(floor, ceiling)
+        controller.widen(self.ceiling)
+
+    @property
+    def limit(self):
+        """:returns: (int) the number of requests allowed in flight"""
+        return min(self.ceiling, max(self.floor, self.controller.limit))
+
+    @property
+    def flying(self):
+        return self.controller.flying
+
+    def acquire(self):
+        self.controller.acquire(lambda: self.limit)
+
+    def release(self):
+        self.controller.release()
+
+    def record(self, latency, nbytes=0, status=200):
+        self.controller.record(latency, nbytes, status)
+
+
+_controllers, _controllers_lock = dict(), Lock()
+
+
+def get_controller(netloc):
+    """:returns: (ConcurrencyController) the controller of an endpoint host,
+    shared by all clients of the process"""
+    with _controllers_lock:
+        try:
+            return _controllers[netloc]
+        except KeyError:
+            _controllers[netloc] = ConcurrencyController()
+            return _controllers[netloc]
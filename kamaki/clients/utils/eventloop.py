@@ -0,0 +1,661 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+import atexit
+import errno
+import os
+import select
+import socket
+import ssl
+from collections import deque
+from cStringIO import StringIO
+from httplib import HTTPException
+from threading import Thread, Lock
+from time import time
+from urlparse import urlparse
+from logging import getLogger
+
+from kamaki.clients.utils import https
+from kamaki.clients.utils.workers import Future
+
+log = getLogger(__name__)
+
+TIMEOUT = 60.0   # seconds without progress, before a request fails
+MAX_CONNECTIONS = 256   # per scheme and host
+DNS_TTL = 60.0   # seconds to keep resolved addresses
+READ, WRITE, ERROR = 0x001, 0x004, 0x008 | 0x010
+_IO_SIZE = 256 * 1024
+_MAX_HEAD = 64 * 1024
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+_EXPECT_BODY = ('PATCH', 'POST', 'PUT')
+
+
+class TransportError(HTTPException):
+    """The connection failed, was closed or timed out"""
+
+
+class _Poller(object):
+    """Wait for socket events with epoll, poll or select, whichever the
+    platform supports"""
+
+    def __init__(self):
+        self._fds = dict()
+        if hasattr(select, 'epoll'):
+            self._impl, self._scale = select.epoll(), 1.0
+        elif hasattr(select, 'poll'):
+            self._impl, self._scale = select.poll(), 1000.0
+        else:
+            self._impl, self._scale = None, 1.0
+
+    def register(self, fd, events):
+        if self._impl is not None:
+            if fd in self._fds:
+                self._impl.modify(fd, events)
+            else:
+                self._impl.register(fd, events)
+        self._fds[fd] = events
+
+    def unregister(self, fd):
+        if self._fds.pop(fd, None) is not None and self._impl is not None:
+            self._impl.unregister(fd)
+
+    def poll(self, timeout):
+        """:returns: (list of (fd, events))"""
+        try:
+            if self._impl is not None:
+                return self._impl.poll(timeout * self._scale)
+            rlist, wlist, xlist = select.select(
+                [fd for fd, ev in self._fds.items() if ev & READ],
+                [fd for fd, ev in self._fds.items() if ev & WRITE],
+                [], timeout)
+        except (IOError, OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        events = dict.fromkeys(rlist, READ)
+        for fd in wlist:
+            events[fd] = events.get(fd, 0) | WRITE
+        return events.items()
+
+    def close(self):
+        if self._impl is not None and hasattr(self._impl, 'close'):
+            self._impl.close()
+
+
+class Response(object):
+    """A response received on the event loop, with the body in memory. It is
+    read like an httplib.HTTPResponse"""
+
+    def __init__(self, version, status, reason, headers, body=''):
+        self.version, self.status, self.reason = version, status, reason
+        self._headers, self._body = headers, StringIO(body)
+        self.timing = dict()
+
+    def getheaders(self):
+        """:returns: (list of (key, value)) with lower case keys"""
+        return list(self._headers)
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for key, value in self._headers:
+            if key == name:
+                return value
+        return default
+
+    def read(self, amt=None):
+        return self._body.read() if amt is None else self._body.read(amt)
+
+
+class _Exchange(object):
+    """A request to send and the future of its response"""
+
+    def __init__(self, request, future):
+        self.request, self.future = request, future
+        self.key = (request.scheme, request.netloc)
+        self.submitted, self.timing = time(), dict()
+        self.retried = False
+        data = request.data
+        if hasattr(data, 'read'):
+            data = data.read()
+        elif isinstance(data, unicode):
+            data = data.encode('utf-8')
+        names = [k.lower() for k in request.headers]
+        path = request.path
+        lines = ['%s %s HTTP/1.1' % (
+            request.method,
+            path.encode('utf-8') if isinstance(path, unicode) else path)]
+        if 'host' not in names:
+            lines.append('Host: %s' % request.netloc)
+        if 'accept-encoding' not in names:
+            lines.append('Accept-Encoding: identity')
+        if 'content-length' not in names and (
+                data or request.method in _EXPECT_BODY):
+            lines.append('Content-Length: %s' % len(data or ''))
+        lines += ['%s: %s' % item for item in request.headers.items()]
+        head = '%s\r\n\r\n' % '\r\n'.join(lines)
+        self.out = [memoryview(head)] + ([memoryview(data)] if data else [])
+
+
+class _Connection(object):
+    """A non-blocking HTTP/1.1 connection, driven by the EventLoop. It
+    carries one exchange at a time and is kept alive between them"""
+
+    def __init__(self, loop, key):
+        self.loop, self.key = loop, key
+        scheme, netloc = key
+        parsed = urlparse('//%s' % netloc)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if scheme == 'https' else 80)
+        self.sock, self.fd, self.state, self.exchange = None, None, None, None
+        self.reused, self.received, self.closed = False, False, False
+        self.last_active = time()
+        self._reset()
+
+    def _reset(self):
+        self._out, self._buf, self._body = [], '', []
+        self._phase, self._remaining, self._trailer = 'head', 0, False
+        self._response, self._keep_alive = None, False
+
+    def start(self, exchange):
+        """Send the request of exchange, connect first if needed"""
+        self.exchange, self.received = exchange, False
+        self.last_active = time()
+        self._reset()
+        self._out = list(exchange.out)
+        if self.sock:
+            self.reused, self.state = True, 'sending'
+            self.loop._watch(self, WRITE)
+        else:
+            self._connect()
+
+    def _connect(self):
+        timing = self.exchange.timing
+        (family, socktype, proto, canonname, address), timing['dns'] = (
+            self.loop._resolve(self.host, self.port))
+        self.sock = socket.socket(family, socktype, proto)
+        self.sock.setblocking(0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.fd = self.sock.fileno()
+        self._connect_started = time()
+        err = self.sock.connect_ex(address)
+        if err not in (0, errno.EINPROGRESS) + _WOULD_BLOCK:
+            raise socket.error(err, os.strerror(err))
+        self.state = 'connecting'
+        self.loop._watch(self, WRITE)
+
+    def handle(self, events):
+        """Make progress on socket events"""
+        self.last_active = time()
+        if self.state == 'connecting':
+            self._connected()
+        elif self.state == 'handshake':
+            self._handshake()
+        elif self.state == 'sending':
+            self._send()
+        elif self.state == 'receiving':
+            self._recv()
+        elif self.state == 'idle':
+            #  Closed by the server, or unexpected data
+            self.loop._close(self)
+
+    def _connected(self):
+        err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise socket.error(err, os.strerror(err))
+        now = time()
+        self.exchange.timing['connect'] = now - self._connect_started
+        if self.key[0] == 'https':
+            context = https.get_context(
+                str(https.HTTPSClientAuthConnection.ca_file),
+                https.HTTPSClientAuthConnection.ignore_ssl)
+            kwargs = dict(server_hostname=self.host) if ssl.HAS_SNI else {}
+            self.sock = context.wrap_socket(
+                self.sock, do_handshake_on_connect=False, **kwargs)
+            self.state, self._handshake_started = 'handshake', now
+            self._handshake()
+        else:
+            self.state = 'sending'
+            self._send()
+
+    def _want(self, err):
+        """Wait for the event an SSL operation needs
+
+        :returns: (bool) True if the operation must be retried later
+        """
+        if isinstance(err, ssl.SSLError):
+            if err.args[0] == ssl.SSL_ERROR_WANT_READ:
+                self.loop._watch(self, READ)
+                return True
+            if err.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                self.loop._watch(self, WRITE)
+                return True
+            return False
+        return err.args[0] in _WOULD_BLOCK
+
+    def _handshake(self):
+        try:
+            self.sock.do_handshake()
+        except socket.error as err:
+            if self._want(err):
+                return
+            raise
+        self.exchange.timing['tls'] = time() - self._handshake_started
+        self.state = 'sending'
+        self._send()
+
+    def _send(self):
+        while self._out:
+            view = self._out[0]
+            try:
+                sent = self.sock.send(view[:_IO_SIZE])
+            except socket.error as err:
+                if self._want(err):
+                    return
+                raise
+            if sent < len(view):
+                self._out[0] = view[sent:]
+            else:
+                self._out.pop(0)
+        self.exchange.request.sent_at = time()
+        self.state = 'receiving'
+        self.loop._watch(self, READ)
+
+    def _recv(self):
+        while self.exchange:
+            try:
+                data = self.sock.recv(_IO_SIZE)
+            except socket.error as err:
+                if self._want(err):
+                    return
+                raise
+            if not data:
+                if self._phase != 'close':
+                    raise TransportError('Connection closed by server')
+                self._finish()
+                return
+            self.received = True
+            self._feed(data)
+
+    def _feed(self, data):
+        if self._phase == 'head':
+            self._buf += data
+            end = self._buf.find('\r\n\r\n')
+            if end < 0:
+                if len(self._buf) > _MAX_HEAD:
+                    raise TransportError('Response headers too long')
+                return
+            head, data, self._buf = self._buf[:end], self._buf[end + 4:], ''
+            self._parse_head(head)
+            if self._phase == 'head':
+                #  An informational (1xx) response, the real one follows
+                if data:
+                    self._feed(data)
+                return
+        if self._phase == 'length':
+            data = data[:self._remaining]
+            self._body.append(data)
+            self._remaining -= len(data)
+            if not self._remaining:
+                self._finish()
+        elif self._phase == 'chunked':
+            self._buf += data
+            self._read_chunks()
+        elif self._phase == 'close':
+            self._body.append(data)
+
+    def _parse_head(self, head):
+        lines = head.split('\r\n')
+        status_line = (lines[0].split(None, 2) + [''])[:3]
+        try:
+            version, status, reason = status_line
+            assert version.startswith('HTTP/')
+            status = int(status)
+        except (AssertionError, ValueError):
+            raise TransportError('Bad status line %r' % lines[0])
+        if 100 <= status < 200:
+            return
+        headers, values = [], dict()
+        for line in lines[1:]:
+            if line[:1] in (' ', '\t') and headers:
+                key = headers[-1]
+                values[key] = '%s %s' % (values[key], line.strip())
+                continue
+            key, sep, value = line.partition(':')
+            key, value = key.strip().lower(), value.strip()
+            if key in values:
+                values[key] = '%s, %s' % (values[key], value)
+            else:
+                headers.append(key)
+                values[key] = value
+        self._response = (
+            version, status, reason, [(k, values[k]) for k in headers])
+        self.exchange.timing['headers_at'] = time()
+        self._keep_alive = version == 'HTTP/1.1' and (
+            'close' not in values.get('connection', '').lower())
+        if self.exchange.request.method == 'HEAD' or status in (204, 304):
+            self._finish()
+        elif 'chunked' in values.get('transfer-encoding', '').lower():
+            self._phase = 'chunked'
+        elif values.get('content-length'):
+            try:
+                self._remaining = int(values['content-length'])
+            except ValueError:
+                raise TransportError(
+                    'Bad Content-Length %r' % values['content-length'])
+            self._phase = 'length'
+            if not self._remaining:
+                self._finish()
+        else:
+            self._phase, self._keep_alive = 'close', False
+
+    def _read_chunks(self):
+        buf = self._buf
+        while self.exchange:
+            if self._remaining > 0:
+                data = buf[:self._remaining]
+                self._body.append(data)
+                self._remaining -= len(data)
+                buf = buf[len(data):]
+                if self._remaining:
+                    break
+                self._remaining = -1
+            if self._remaining < 0:
+                #  The CRLF after the chunk data
+                if len(buf) < 2:
+                    break
+                buf, self._remaining = buf[2:], 0
+            end = buf.find('\r\n')
+            if end < 0:
+                if len(buf) > _MAX_HEAD:
+                    raise TransportError('Bad chunk size line')
+                break
+            line, buf = buf[:end], buf[end + 2:]
+            if self._trailer:
+                if not line:
+                    self._finish()
+                continue
+            try:
+                size = int(line.split(';')[0].strip(), 16)
+            except ValueError:
+                raise TransportError('Bad chunk size line %r' % line)
+            if size:
+                self._remaining = size
+            else:
+                self._trailer = True
+        self._buf = buf
+
+    def _finish(self):
+        exchange, self.exchange = self.exchange, None
+        version, status, reason, headers = self._response
+        response = Response(
+            version, status, reason, headers, ''.join(self._body))
+        response.timing = exchange.timing
+        keep_alive = self._keep_alive
+        self._reset()
+        self.loop._done(self, exchange, response, keep_alive)
+
+
+class EventLoop(object):
+    """Perform HTTP requests on non-blocking connections, multiplexed on a
+    single thread, so that hundreds of requests can be in flight without a
+    thread for each. Connections are kept alive and reused, up to
+    max_connections per host. Response bodies are read in memory.
+    Host names are resolved on the loop thread.
+
+    :param max_connections: (int) max connections per scheme and host, more
+        requests wait in queue
+
+    :param timeout: (float) seconds without progress before a request fails
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, timeout=TIMEOUT):
+        self.max_connections, self.timeout = max_connections, timeout
+        self._poller = _Poller()
+        self._submitted, self._lock = deque(), Lock()
+        self._conns = dict()
+        self._idle, self._waiting, self._count = dict(), dict(), dict()
+        self._addresses = dict()
+        self._wake_r, self._wake_w = os.pipe()
+        for fd in (self._wake_r, self._wake_w):
+            _set_nonblocking(fd)
+        self._poller.register(self._wake_r, READ)
+        self._thread, self._closed = None, False
+
+    def submit(self, request):
+        """Send a request from the loop thread, without waiting
+
+        :param request: (RequestManager) with encoded headers
+
+        :returns: (Future) of the Response, raises TransportError if the
+            connection fails, or ssl.SSLError
+        """
+        future = Future(self.submit, request)
+        exchange = _Exchange(request, future)
+        with self._lock:
+            assert not self._closed, 'Event loop %s is closed' % self
+            self._submitted.append(exchange)
+            if not self._thread:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wake()
+        return future
+
+    def close(self, timeout=1.0):
+        """Stop the loop thread, fail the requests in flight"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed, thread = True, self._thread
+        if thread:
+            self._wake()
+            thread.join(timeout)
+        else:
+            self._shutdown()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, 'x')
+        except OSError as e:
+            if e.errno not in _WOULD_BLOCK:
+                raise
+
+    def _run(self):
+        while not self._closed:
+            for fd, events in self._poller.poll(min(1.0, self.timeout)):
+                if fd == self._wake_r:
+                    self._drain_wake()
+                    continue
+                conn = self._conns.get(fd)
+                if conn:
+                    try:
+                        conn.handle(events)
+                    except Exception as e:
+                        self._fail(conn, e)
+            with self._lock:
+                submitted, self._submitted = self._submitted, deque()
+            for exchange in submitted:
+                self._dispatch(exchange)
+            self._expire()
+        self._shutdown()
+
+    def _drain_wake(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except OSError as e:
+            if e.errno not in _WOULD_BLOCK:
+                raise
+
+    def _resolve(self, host, port):
+        """:returns: (address info, seconds spent on resolving)"""
+        cached = self._addresses.get((host, port))
+        if cached and cached[1] > time():
+            return cached[0], 0.0
+        started = time()
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        if not addresses:
+            raise socket.error('getaddrinfo returns an empty list')
+        self._addresses[(host, port)] = (addresses[0], time() + DNS_TTL)
+        return addresses[0], time() - started
+
+    def _watch(self, conn, events):
+        self._conns[conn.fd] = conn
+        self._poller.register(conn.fd, events)
+
+    def _dispatch(self, exchange):
+        """Start an exchange on an idle or a new connection, or queue it"""
+        key = exchange.key
+        idle, count = self._idle.get(key), self._count.get(key, 0)
+        if not (idle or count < self.max_connections):
+            self._waiting.setdefault(key, deque()).append(exchange)
+            return
+        if not exchange.future._set_running():
+            return
+        if idle:
+            conn = idle.pop()
+        else:
+            conn, self._count[key] = _Connection(self, key), count + 1
+        exchange.timing['pool_wait'] = time() - exchange.submitted
+        try:
+            conn.start(exchange)
+        except Exception as e:
+            self._fail(conn, e)
+
+    def _next(self, key):
+        """Dispatch queued exchanges, while there are free connections"""
+        waiting = self._waiting.get(key)
+        while waiting and (
+                self._idle.get(key) or
+                self._count.get(key, 0) < self.max_connections):
+            self._dispatch(waiting.popleft())
+
+    def _done(self, conn, exchange, response, keep_alive):
+        exchange.future._set_result(response)
+        if keep_alive and not self._closed:
+            conn.state = 'idle'
+            self._watch(conn, READ)
+            self._idle.setdefault(conn.key, []).append(conn)
+            self._next(conn.key)
+        else:
+            self._close(conn)
+
+    def _fail(self, conn, error):
+        exchange = conn.exchange
+        conn.exchange = None
+        self._close(conn)
+        if not exchange:
+            return
+        if conn.reused and not (conn.received or exchange.retried):
+            #  The server may close an idle connection at any time
+            log.debug('Retry on a new connection after %s' % error)
+            exchange.retried = True
+            self._dispatch(exchange)
+            return
+        if not isinstance(error, (HTTPException, ssl.SSLError)):
+            log.debug('%s %s failed: %s: %s' % (
+                exchange.request.method, exchange.request.path,
+                type(error).__name__, error))
+            error = TransportError('%s: %s' % (type(error).__name__, error))
+        exchange.future._set_result(exception=error)
+
+    def _close(self, conn):
+        if conn.closed:
+            return
+        conn.closed, conn.state = True, 'closed'
+        if conn.sock:
+            self._poller.unregister(conn.fd)
+            self._conns.pop(conn.fd, None)
+            try:
+                conn.sock.close()
+            except Exception as e:
+                log.debug('Failed to close %s: %s' % (conn.key, e))
+            conn.sock = None
+        idle = self._idle.get(conn.key, [])
+        if conn in idle:
+            idle.remove(conn)
+        self._count[conn.key] -= 1
+        if not self._closed:
+            self._next(conn.key)
+
+    def _expire(self):
+        now = time()
+        for conn in self._conns.values():
+            if conn.exchange and now - conn.last_active > self.timeout:
+                self._fail(conn, TransportError(
+                    'No response after %s seconds' % self.timeout))
+
+    def _shutdown(self):
+        """Close all connections, fail the requests not finished yet"""
+        error = TransportError('Event loop closed')
+        with self._lock:
+            submitted, self._submitted = self._submitted, deque()
+        exchanges = list(submitted)
+        for waiting in self._waiting.values():
+            exchanges += waiting
+        self._waiting.clear()
+        for conn in self._conns.values():
+            if conn.exchange:
+                exchanges.append(conn.exchange)
+                conn.exchange = None
+            self._close(conn)
+        for exchange in exchanges:
+            exchange.future._set_result(exception=error)
+        self._poller.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+
+def _set_nonblocking(fd):
+    import fcntl
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | (
+        os.O_NONBLOCK))
+
+
+_loop, _loop_lock = None, Lock()
+
+
+def get_loop():
+    """:returns: (EventLoop) the loop shared by all clients of a process"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = EventLoop()
+        return _loop
+
+
+@atexit.register
+def _shutdown():
+    if _loop is not None:
+        _loop.close()
@@ -0,0 +1,177 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+import sqlite3
+from hashlib import sha256
+from json import dumps, loads
+from os import makedirs, path
+from threading import local, Lock
+from time import time
+from logging import getLogger
+
+log = getLogger(__name__)
+
+DEFAULT_PATH = path.expanduser(path.join('~', '.kamaki', 'http_cache.db'))
+#  Response statuses that are stored
+CACHEABLE = (200, 203, 204)
+
+
+class HTTPCache(object):
+    """An on-disk store of GET and HEAD responses, used for conditional
+    requests. Stored responses are never served without revalidation: a 304
+    (Not Modified) response is a hit.
+
+    Database errors are logged and treated as misses.
+    """
+
+    def __init__(
+            self, filename=DEFAULT_PATH,
+            max_size=64 * 1024 * 1024, max_age=7 * 24 * 3600):
+        """
+        :param filename: (str) the database file, the directory is created if
+            missing
+
+        :param max_size: (int) the maximum total size of stored bodies, least
+            recently used responses are evicted first
+
+        :param max_age: (int) seconds to keep a response after storing it
+        """
+        self.filename, self.max_size, self.max_age = (
+            filename, max_size, max_age)
+        self.hits, self.misses = 0, 0
+        self._local, self._lock = local(), Lock()
+        dirname = path.dirname(filename)
+        if dirname and not path.isdir(dirname):
+            makedirs(dirname, 0700)
+        self._execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, status INTEGER, reason TEXT, '
+            'headers TEXT, body BLOB, etag TEXT, last_modified TEXT, '
+            'stored REAL, accessed REAL, size INTEGER)')
+
+    def _execute(self, query, *args):
+        """:returns: (list) the result rows, None on database errors"""
+        db = getattr(self._local, 'db', None)
+        try:
+            if db is None:
+                db = sqlite3.connect(self.filename, timeout=10)
+                db.text_factory = str
+                self._local.db = db
+            with db:
+                return db.execute(query, args).fetchall()
+        except sqlite3.Error as e:
+            log.debug('HTTP cache %s: %s' % (self.filename, e))
+
+    @staticmethod
+    def key(method, url, token=None):
+        """:returns: (str) the key of a request, unique per token, without
+        revealing the token"""
+        token = sha256('%s' % token).hexdigest() if token else ''
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return sha256('%s %s %s' % (method.upper(), url, token)).hexdigest()
+
+    def get(self, key):
+        """:returns: (dict) status, reason, headers, body, etag and
+        last_modified of a stored response, or None"""
+        rows = self._execute(
+            'SELECT status, reason, headers, body, etag, last_modified '
+            'FROM responses WHERE key = ? AND stored > ?',
+            key, time() - self.max_age)
+        if not rows:
+            return None
+        status, reason, headers, body, etag, last_modified = rows[0]
+        headers = dict([(str(k), v if decoded else v.encode('utf-8')) for (
+            k, v, decoded) in loads(headers)])
+        return dict(
+            status=status, reason=reason, headers=headers,
+            body=str(body), etag=etag, last_modified=last_modified)
+
+    def hit(self, key):
+        """Mark a stored response as revalidated"""
+        with self._lock:
+            self.hits += 1
+        self._execute(
+            'UPDATE responses SET accessed = ? WHERE key = ?', time(), key)
+
+    def set(self, key, status, reason, headers, body, etag, last_modified):
+        """Store a response, if cacheable and not larger than 1/8 of
+        max_size"""
+        with self._lock:
+            self.misses += 1
+        body = body or ''
+        if status not in CACHEABLE or not (etag or last_modified) or (
+                len(body) > self.max_size / 8):
+            return
+        now = time()
+        self._execute(
+            'INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?,?,?,?)',
+            key, status, reason, dumps([(k, v, isinstance(v, unicode)) for (
+                k, v) in headers.items()]), sqlite3.Binary(body), etag,
+            last_modified, now, now, len(body))
+        self.evict()
+
+    def evict(self):
+        """Drop expired responses, then the least recently used ones while
+        the total size exceeds max_size"""
+        self._execute(
+            'DELETE FROM responses WHERE stored <= ?', time() - self.max_age)
+        rows = self._execute('SELECT SUM(size) FROM responses')
+        excess = ((rows and rows[0][0]) or 0) - self.max_size
+        if excess <= 0:
+            return
+        dropped = []
+        for key, size in self._execute(
+                'SELECT key, size FROM responses ORDER BY accessed') or []:
+            if excess <= 0:
+                break
+            dropped.append(key)
+            excess -= size
+        for key in dropped:
+            self._execute('DELETE FROM responses WHERE key = ?', key)
+
+    def clear(self):
+        self._execute('DELETE FROM responses')
+
+
+_caches, _caches_lock = dict(), Lock()
+
+
+def get_cache(filename=DEFAULT_PATH, **kwargs):
+    """:returns: (HTTPCache) shared by all clients of the process, per file
+    """
+    with _caches_lock:
+        if filename not in _caches:
+            _caches[filename] = HTTPCache(filename, **kwargs)
+        return _caches[filename]
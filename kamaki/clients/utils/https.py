@@ -35,6 +35,8 @@ import logging
 import httplib
 import socket
 import ssl
+from threading import Lock
+from time import time
 from objpool import http
 
 log = logging.getLogger(__name__)
@@ -44,6 +46,81 @@ class SSLUnicodeError(ssl.SSLError):
     """SSL module cannot handle unicode file names"""
 
 
+#  SSL contexts appeared in Python 2.7.9, TLS sessions in Python 3.6
+HAS_CONTEXT = hasattr(ssl, 'SSLContext')
+HAS_SESSION = hasattr(ssl, 'SSLSession')
+_contexts, _sessions, _ssl_lock = dict(), dict(), Lock()
+
+
+def get_context(ca_file, ignore_ssl=False, key_file=None, cert_file=None):
+    """Get a process-wide SSL context, so that the CA bundle and the client
+    certificate are loaded once and not on each connection
+
+    :returns: (ssl.SSLContext) None if not supported by the ssl module
+    """
+    if not HAS_CONTEXT:
+        return None
+    key = (ca_file, bool(ignore_ssl), key_file, cert_file)
+    with _ssl_lock:
+        if key not in _contexts:
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            if ignore_ssl:
+                context.verify_mode = ssl.CERT_NONE
+            else:
+                context.verify_mode = ssl.CERT_REQUIRED
+                context.load_verify_locations(ca_file)
+            if key_file or cert_file:
+                context.load_cert_chain(cert_file, key_file)
+            _contexts[key] = context
+        return _contexts[key]
+
+
+def clear_ssl_cache():
+    """Drop cached SSL contexts and sessions, e.g., if a CA bundle file is
+    modified"""
+    with _ssl_lock:
+        _contexts.clear()
+        _sessions.clear()
+
+
+def _timed_connect(conn):
+    """Open a socket for an httplib connection, like socket.create_connection
+    Keep the dns resolution and connect time in conn.timing
+
+    :returns: (socket)
+    """
+    started = time()
+    addresses = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+    resolved = time()
+    source_address = getattr(conn, 'source_address', None)
+    error = socket.error('getaddrinfo returns an empty list')
+    for family, socktype, proto, canonname, address in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if conn.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(conn.timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(address)
+            conn.timing = dict(
+                dns=resolved - started, connect=time() - resolved)
+            return sock
+        except socket.error as error:
+            if sock is not None:
+                sock.close()
+    raise error
+
+
+class TimedHTTPConnection(httplib.HTTPConnection):
+    """HTTP connection that keeps the time spent on connecting"""
+
+    def connect(self):
+        self.sock = _timed_connect(self)
+        if self._tunnel_host:
+            self._tunnel()
+
+
 class HTTPSClientAuthConnection(httplib.HTTPSConnection):
     """HTTPS connection, with full client-based SSL Authentication support"""
 
@@ -61,8 +138,33 @@ class HTTPSClientAuthConnection(httplib.HTTPSConnection):
 
         self.ignore_ssl = kwargs.pop('ignore_ssl', self.ignore_ssl)
 
+        #  httplib would create (and load certificates into) a new default
+        #  context for each connection, which is not used in connect anyway
+        client_cert = args[2:4] + (
+            kwargs.get('key_file'), kwargs.get('cert_file'))
+        if HAS_CONTEXT and not any(client_cert):
+            try:
+                kwargs.setdefault(
+                    'context', get_context(self.ca_file, self.ignore_ssl))
+            except IOError as ioe:
+                #  ssl.SSLError is an IOError, let connect raise it
+                log.debug('Failed to load CA certificates: %s' % ioe)
+
         httplib.HTTPSConnection.__init__(self, *args, **kwargs)
 
+    def _wrap_socket(self, sock, context):
+        """Wrap with a cached context and resume the last TLS session with
+        the same host, if the ssl module supports it"""
+        host = self._tunnel_host or self.host
+        kwargs = dict(server_hostname=host) if ssl.HAS_SNI else dict()
+        session_key = (id(context), host, self.port)
+        if HAS_SESSION:
+            kwargs['session'] = _sessions.get(session_key)
+        ssl_sock = context.wrap_socket(sock, **kwargs)
+        if HAS_SESSION:
+            _sessions[session_key] = ssl_sock.session
+        return ssl_sock
+
     def connect(self):
         """Connect to a host on a given (SSL) port.
         Use ca_file to check Server Certificate.
@@ -71,17 +173,21 @@ class HTTPSClientAuthConnection(httplib.HTTPSConnection):
         This is needed to pass cert_reqs=ssl.CERT_REQUIRED as parameter to
         ssl.wrap_socket(), which forces SSL to check server certificate against
         our client certificate.
+
+        If supported, a cached SSL context (see get_context) is used instead.
         """
-        source_address = getattr(self, 'source_address', None)
-        socket_args = [(self.host, self.port), self.timeout] + (
-            [source_address, ] if source_address else [])
-        sock = socket.create_connection(*socket_args)
+        sock = _timed_connect(self)
         if self._tunnel_host:
             self.sock = sock
             self._tunnel()
 
+        handshake_started = time()
         try:
-            if self.ignore_ssl:
+            context = get_context(
+                self.ca_file, self.ignore_ssl, self.key_file, self.cert_file)
+            if context:
+                self.sock = self._wrap_socket(sock, context)
+            elif self.ignore_ssl:
                 self.sock = ssl.wrap_socket(
                     sock, self.key_file, self.cert_file,
                     cert_reqs=ssl.CERT_NONE)
@@ -91,8 +197,10 @@ class HTTPSClientAuthConnection(httplib.HTTPSConnection):
                     ca_certs=self.ca_file, cert_reqs=ssl.CERT_REQUIRED)
         except UnicodeError as ue:
             raise SSLUnicodeError(0, SSLUnicodeError.__doc__, ue)
+        self.timing['tls'] = time() - handshake_started
 
 
+http.HTTPConnectionPool._scheme_to_class['http'] = TimedHTTPConnection
 http.HTTPConnectionPool._scheme_to_class['https'] = HTTPSClientAuthConnection
 PooledHTTPConnection = http.PooledHTTPConnection
 
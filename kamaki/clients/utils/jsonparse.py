@@ -0,0 +1,140 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+"""JSON decoding, with the fastest available backend and an incremental
+decoder for large arrays"""
+
+import re
+from json import JSONDecoder
+
+try:
+    from ujson import loads
+    BACKEND = 'ujson'
+except ImportError:
+    from json import loads
+    BACKEND = 'json'
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER = '+-.0123456789eE'
+_decoder = JSONDecoder()
+
+
+class _Reader(object):
+    """Read JSON values from a sequence of string chunks"""
+
+    def __init__(self, chunks):
+        self.chunks, self.buf, self.pos = iter(chunks), '', 0
+
+    def _more(self):
+        """Drop the consumed data, append the next chunk
+
+        :returns: (bool) False if there are no more chunks
+        """
+        for chunk in self.chunks:
+            if chunk:
+                self.buf, self.pos = self.buf[self.pos:] + chunk, 0
+                return True
+        return False
+
+    def peek(self):
+        """:returns: (str) the next non-whitespace character, '' at the end
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next non-whitespace character, which must be in chars
+
+        :returns: (str) the consumed character
+        """
+        c = self.peek()
+        if not (c and c in chars):
+            raise ValueError('Expecting one of "%s", found "%s"' % (chars, c))
+        self.pos += 1
+        return c
+
+    def decode(self):
+        """:returns: the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._more():
+                    continue
+                raise
+            #  A number may go on in the next chunk
+            if not (end == len(self.buf) or self.buf[end] in _NUMBER) or (
+                    not self._more()):
+                self.pos = end
+                return value
+
+
+def iter_array(chunks, key=None):
+    """Decode the elements of a JSON array one by one, so that the whole
+    array is never kept in memory
+
+    :param chunks: (iterable of str) the JSON document, in pieces
+
+    :param key: (str) if set, the document is an object and the array is the
+        value of this key (e.g., "servers")
+
+    :returns: (generator) the decoded array elements
+
+    :raises ValueError: if the document is not a valid JSON array or object
+    """
+    reader = _Reader(chunks)
+    if key is not None:
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            name = reader.decode()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.decode()
+            if reader.expect(',}') == '}':
+                return
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.decode()
+        if reader.expect(',]') == ']':
+            return
@@ -34,8 +34,16 @@
 from unittest import TestCase
 from tempfile import TemporaryFile
 from itertools import product
+from json import dumps, loads
+from threading import Event
+import socket
+
+from mock import patch
 
 from kamaki.clients import utils
+from kamaki.clients.utils import (
+    workers, concurrency, timing, https, jsonparse, httpcache, eventloop,
+    buffers)
 
 
 def _try(assertfoo, foo, *args):
@@ -139,6 +147,37 @@ class Utils(TestCase):
             self.assertEqual(utils.readall(f, 1), '')
             self.assertRaises(IOError, utils.readall, f, 1, 0)
 
+    def test_readinto(self):
+        from StringIO import StringIO
+        tstr = '1234567890'
+        with TemporaryFile() as f:
+            f.write(tstr)
+            f.flush()
+            for src in (f, StringIO(tstr)):
+                src.seek(0)
+                buf = bytearray('x' * 8)
+                self.assertEqual(utils.readinto(src, buf, 5), 5)
+                self.assertEqual(buf, '12345xxx')
+                self.assertEqual(utils.readinto(src, buf), 5)
+                self.assertEqual(buf, '67890xxx')
+                self.assertEqual(utils.readinto(src, buf), 0)
+                self.assertRaises(IOError, utils.readinto, src, buf, 1, 0)
+
+        class Trickle(object):
+            """Return one byte per read"""
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size):
+                r, self.data = self.data[:1], self.data[1:]
+                return r
+
+        buf = bytearray(4)
+        self.assertEqual(utils.readinto(Trickle(tstr), buf, retries=4), 4)
+        self.assertEqual(buf, '1234')
+        self.assertRaises(
+            IOError, utils.readinto, Trickle(tstr), buf, retries=3)
+
     def test_escape_ctrl_chars(self):
         gr_synnefo = u'\u03c3\u03cd\u03bd\u03bd\u03b5\u03c6\u03bf'
         gr_kamaki = u'\u03ba\u03b1\u03bc\u03ac\u03ba\u03b9'
@@ -157,7 +196,708 @@ class Utils(TestCase):
                 esc_str = word1 + esc_char + word2
                 self.assertEqual(utils.escape_ctrl_chars(orig_str), esc_str)
 
+        binary = ''.join([chr(i) for i in range(256)]) * 2
+        self.assertEqual(utils.escape_ctrl_chars(binary), ''.join([
+            c if 31 < ord(c) < 127 else c.encode('string_escape') for c in (
+                binary)]))
+        self.assertEqual(utils.escape_ctrl_chars(42), 42)
+
+
+class Future(TestCase):
+
+    def test_result(self):
+        f = workers.Future(lambda x, y=0: x + y, 40, y=2)
+        self.assertFalse(f.done())
+        self.assertRaises(RuntimeError, f.result, 0.01)
+        f._run()
+        self.assertTrue(f.done())
+        self.assertEqual(f.result(), 42)
+        self.assertEqual(f.exception(), None)
+
+        f = workers.Future(lambda: 1 / 0)
+        f._run()
+        self.assertRaises(ZeroDivisionError, f.result)
+        self.assertTrue(isinstance(f.exception(), ZeroDivisionError))
+
+    def test_cancel(self):
+        calls = []
+        f = workers.Future(calls.append, 1)
+        f.add_done_callback(calls.append)
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        self.assertEqual(calls, [f])
+        f._run()
+        self.assertEqual(calls, [f])
+        self.assertRaises(workers.CancelledError, f.result)
+
+        calls = []
+        f = workers.Future(calls.append, 2)
+        f._run()
+        self.assertFalse(f.cancel())
+        f.add_done_callback(calls.append)
+        self.assertEqual(calls, [2, f])
+
+    def test_set_result(self):
+        f = workers.Future(None)
+        self.assertTrue(f._set_running())
+        self.assertFalse(f.cancel())
+        f._set_result(42)
+        f._set_result(0, ZeroDivisionError())
+        self.assertEqual(f.result(), 42)
+
+        f = workers.Future(None)
+        f.cancel()
+        self.assertFalse(f._set_running())
+        f._set_result(42)
+        self.assertRaises(workers.CancelledError, f.result)
+
+
+class WorkerPool(TestCase):
+
+    def setUp(self):
+        self.pool = workers.WorkerPool()
+
+    def tearDown(self):
+        self.pool.shutdown(wait=True)
+
+    def test_submit(self):
+        futures = [self.pool.submit(pow, i, 2) for i in range(10)]
+        self.assertEqual([f.result() for f in futures], [
+            i * i for i in range(10)])
+        self.assertTrue(self.pool.join())
+        self.assertEqual(self.pool.busy, 0)
+        self.assertTrue(self.pool.workers <= 10)
+
+        pool = workers.WorkerPool(size=2)
+        futures = [pool.submit(pow, i, 2) for i in range(10)]
+        self.assertEqual(sum(f.result() for f in futures), 285)
+        self.assertEqual(pool.workers, 2)
+        pool.shutdown(wait=True)
+
+    def test_run(self):
+        gates = [Event() for i in range(6)]
+        in_flight = []
+
+        def task(i):
+            in_flight.append(i)
+            gates[i].wait(5)
+            return i
+
+        consumed = []
+
+        def kwargs():
+            for i in range(6):
+                consumed.append(i)
+                yield dict(i=i)
+
+        run = self.pool.run(task, kwargs(), limit=3)
+        for i in (2, 1, 0, 5, 4, 3):
+            gates[i].set()
+        results = []
+        for future in run:
+            self.assertEqual(future.index, future.result())
+            self.assertTrue(len(consumed) - len(results) <= 3)
+            results.append(future.result())
+        self.assertEqual(sorted(results), range(6))
+
+        #  An interrupted run cancels the calls that have not started
+        gates = [Event() for i in range(6)]
+        run = self.pool.run(task, kwargs(), limit=2)
+        gates[0].set()
+        self.assertEqual(run.next().result(), 0)
+        run.close()
+        for gate in gates:
+            gate.set()
+        self.assertTrue(self.pool.join(5))
+        self.assertTrue(6 + 1 <= len(in_flight) <= 6 + 2)
+
+    def test_nested_run(self):
+        def outer(i):
+            return sum(f.result() for f in self.pool.run(
+                lambda x: x * x, [dict(x=i)] * 3, limit=3))
+
+        results = [f.result() for f in self.pool.run(
+            outer, [dict(i=i) for i in range(4)], limit=4)]
+        self.assertEqual(sorted(results), [0, 3, 12, 27])
+
+    def test_as_completed(self):
+        gate = Event()
+        futures = [
+            self.pool.submit(gate.wait, 5), self.pool.submit(pow, 2, 2)]
+        completed = workers.as_completed(futures)
+        self.assertEqual(completed.next(), futures[1])
+        gate.set()
+        self.assertEqual(completed.next(), futures[0])
+
+    def test_serial_queue(self):
+        gate, calls = Event(), []
+
+        def call(i):
+            gate.wait(5)
+            calls.append(i)
+
+        queue = workers.SerialQueue(2, self.pool)
+        queue.put(call, 0)
+        queue.put(call, 1)
+        self.assertEqual(queue.pending, 2)
+
+        #  put waits while size calls are pending
+        put = self.pool.submit(queue.put, call, 2)
+        self.assertRaises(RuntimeError, put.result, 0.1)
+        gate.set()
+        put.result(5)
+        queue.close()
+        self.assertEqual(calls, range(3))
+        self.assertEqual((queue.pending, queue.error), (0, None))
+
+        #  After a failure, calls are dropped and put raises
+        queue = workers.SerialQueue(2, self.pool)
+        queue.put(calls.remove, 'missing')
+        queue.put(calls.append, 'dropped')
+        queue.close()
+        self.assertTrue(isinstance(queue.error, ValueError))
+        self.assertRaises(ValueError, queue.put, calls.append, 'dropped')
+        self.assertEqual(calls, range(3))
+
+    def test_prefetcher(self):
+        gate, produced = Event(), []
+
+        def items():
+            for i in range(4):
+                produced.append(i)
+                yield i
+            gate.wait(5)
+            raise ValueError('failed')
+
+        #  Items are consumed ahead of the caller, errors raised after them
+        prefetcher = workers.Prefetcher(items(), self.pool)
+        iterated = iter(prefetcher)
+        self.assertEqual([iterated.next() for i in range(4)], range(4))
+        self.assertEqual(produced, range(4))
+        gate.set()
+        self.assertRaises(ValueError, iterated.next)
+        prefetcher.close()
+
+        #  close stops consuming an endless iterable
+        def endless():
+            while True:
+                produced.append(len(produced))
+                yield produced[-1]
+
+        del produced[:]
+        prefetcher = workers.Prefetcher(endless(), self.pool)
+        prefetcher.close()
+        self.assertEqual(list(prefetcher), produced)
+
+
+class ConcurrencyController(TestCase):
+
+    def setUp(self):
+        self.clock = [100.0]
+        self.patcher = patch(
+            'kamaki.clients.utils.concurrency.time',
+            side_effect=lambda: self.clock[0])
+        self.patcher.start()
+        self.c = concurrency.ConcurrencyController(1, 16)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def _round(self, seconds, nbytes=1000):
+        """Complete a round of requests that lasts for seconds"""
+        limit = self.c.limit
+        for i in range(limit):
+            self.clock[0] += seconds / limit
+            self.c.record(seconds / limit, nbytes)
+        return self.c.limit
+
+    def test_record(self):
+        self.assertEqual(self.c.limit, 1)
+        #  Slow start: double while throughput improves
+        self.assertEqual(
+            [self._round(1.0), self._round(1.0), self._round(1.0)], [2, 4, 8])
+        #  Throughput stalls: hold, then probe
+        self.assertEqual(
+            [self._round(2.0), self._round(2.0), self._round(2.0)], [8, 8, 9])
+        self.assertEqual(self._round(1.0), 10)
+        self.assertEqual(self._round(10.0), 9)
+
+        #  Backpressure: back off, once per round trip
+        self.c.record(0.1, status=503)
+        self.assertEqual(self.c.limit, 4)
+        self.c.record(0.1, status=429)
+        self.assertEqual(self.c.limit, 4)
+        self.clock[0] += 10
+        self.c.record(0.1, status=502)
+        self.assertEqual(self.c.limit, 2)
+
+    def test_acquire(self):
+        from threading import Thread
+        self.c.SLOT_WAIT = 0.01
+        self.c.acquire()
+        self.assertEqual(self.c.flying, 1)
+        acquired = Event()
+
+        def acquire():
+            self.c.acquire()
+            acquired.set()
+
+        t = Thread(target=acquire)
+        t.start()
+        self.assertFalse(acquired.wait(0.1))
+        self.c.release()
+        self.assertTrue(acquired.wait(5))
+        t.join()
+        self.assertEqual(self.c.flying, 1)
+        #  Slots follow the limit
+        self._round(1.0)
+        self.assertEqual(self.c.limit, 2)
+        self.c.acquire()
+        self.assertEqual(self.c.flying, 2)
+        self.clock[0] += 10
+        self.c.record(0.1, status=None)
+        self.c.record(0.1, status=None)
+        self.assertEqual(self.c.limit, 1)
+        self.clock[0] += 10
+        self.c.record(0.1, status=None)
+        self.assertEqual(self.c.limit, 1)
+
+    def test_set_bounds(self):
+        for i in range(4):
+            self._round(1.0 / (i + 1))
+        self.assertEqual(self.c.limit, 16)
+        self.c.set_bounds(2, 3)
+        self.assertEqual(self.c.limit, 3)
+        self.c.set_bounds(5, 3)
+        self.assertEqual((self.c.floor, self.c.ceiling, self.c.limit), (
+            5, 5, 5))
+        self.assertRaises(AssertionError, self.c.set_bounds, 0, 3)
+
+    def test_BoundedController(self):
+        self.c.set_bounds(1, 4)
+        for i in range(4):
+            self._round(1.0 / (i + 1))
+        narrow = concurrency.BoundedController(self.c, 2, 3)
+        wide = concurrency.BoundedController(self.c, 1, 16)
+        self.assertEqual((1, 16), (self.c.floor, self.c.ceiling))
+        self.assertEqual((self.c.limit, narrow.limit, wide.limit), (4, 3, 4))
+        concurrency.BoundedController(self.c, 1, 2)
+        self.assertEqual(self.c.ceiling, 16)
+        self.assertEqual((narrow.limit, wide.limit), (3, 4))
+        self.clock[0] += 10
+        self.c.record(0.1, status=503)
+        self.assertEqual((self.c.limit, narrow.limit, wide.limit), (2, 2, 2))
+        self.clock[0] += 10
+        self.c.record(0.1, status=503)
+        self.assertEqual((self.c.limit, narrow.limit, wide.limit), (1, 2, 1))
+        narrow.acquire()
+        narrow.acquire()
+        self.assertEqual((self.c.flying, narrow.flying), (2, 2))
+        narrow.release()
+        narrow.record(0.1)
+        self.assertEqual(self.c.flying, 1)
+        self.assertRaises(
+            AssertionError, concurrency.BoundedController, self.c, 0, 3)
+
+    def test_get_controller(self):
+        c = concurrency.get_controller('example.com:8443')
+        self.assertTrue(isinstance(c, concurrency.ConcurrencyController))
+        self.assertEqual(c, concurrency.get_controller('example.com:8443'))
+        self.assertNotEqual(c, concurrency.get_controller('example.com'))
+
+
+class Timing(TestCase):
+
+    def _record(self, total, method='GET', endpoint='example.com'):
+        return timing.RequestTiming(
+            method, endpoint, '/path', status=200, bytes_in=10, total=total)
+
+    def test_RequestTiming(self):
+        record = self._record(0.5)
+        d = record.as_dict()
+        self.assertEqual((d['method'], d['total'], d['ttfb']), (
+            'GET', 0.5, 0.0))
+        self.assertEqual(
+            set(d), set(timing.RequestTiming.FIELDS).union([
+                'method', 'endpoint', 'path', 'status', 'bytes_out',
+                'bytes_in', 'retries']))
+        self.assertTrue(('%s' % record).startswith(
+            'GET example.com/path 200 out=0 in=10 retries=0'))
+        self.assertRaises(
+            AssertionError, timing.RequestTiming, 'GET', 'e', '/', wrong=1)
+
+    def test_hooks(self):
+        records = []
+
+        def failing_hook(record):
+            raise Exception('Hook failure')
+
+        for hook in (failing_hook, records.append, records.append):
+            timing.add_hook(hook)
+        try:
+            record = self._record(0.1)
+            timing.emit(record)
+            self.assertEqual(records, [record])
+        finally:
+            timing.remove_hook(failing_hook)
+            timing.remove_hook(records.append)
+        timing.emit(record)
+        self.assertEqual(records, [record])
+
+    def test_TimingAggregator(self):
+        aggregator = timing.TimingAggregator(max_samples=100)
+        for i in range(1, 201):
+            aggregator(self._record(i / 100.0))
+        aggregator(self._record(3.0, method='PUT'))
+        self.assertEqual(
+            aggregator.percentiles('example.com', 'GET'),
+            {50: 1.5, 90: 1.9, 99: 1.99})
+        self.assertEqual(
+            aggregator.percentiles('example.com', 'DELETE'),
+            {50: None, 90: None, 99: None})
+        report = aggregator.report(points=(50, ))
+        self.assertEqual(report[('example.com', 'PUT')]['total'], {50: 3.0})
+        self.assertEqual(report[('example.com', 'GET')]['count'], 100)
+        self.assertEqual(report[('example.com', 'GET')]['bytes_in'], 1000)
+        summary = aggregator.summary()
+        self.assertEqual(
+            len(summary), 2 * (1 + len(timing.RequestTiming.FIELDS)))
+        self.assertEqual(
+            summary[0], 'GET example.com: 100 requests, out=0 in=1000')
+
+
+class SSLContext(TestCase):
+
+    def setUp(self):
+        if not https.HAS_CONTEXT:
+            self.skipTest('No SSL contexts in this python version')
+
+    def tearDown(self):
+        https.clear_ssl_cache()
+
+    def test_get_context(self):
+        context = https.get_context('no file', ignore_ssl=True)
+        self.assertEqual(context.verify_mode, https.ssl.CERT_NONE)
+        self.assertEqual(context, https.get_context('no file', True))
+        self.assertNotEqual(context, https.get_context('other file', True))
+        self.assertRaises(IOError, https.get_context, '/no/such/file')
+        https.clear_ssl_cache()
+        self.assertNotEqual(context, https.get_context('no file', True))
+
+    def test_connection(self):
+        conn = https.HTTPSClientAuthConnection(
+            'example.com', ca_file='no file', ignore_ssl=True)
+        self.assertEqual(conn._context, https.get_context('no file', True))
+        conn = https.HTTPSClientAuthConnection(
+            'example.com', ca_file='/no/such/file')
+        self.assertEqual(conn.ca_file, '/no/such/file')
+
+
+class JSONParse(TestCase):
+
+    doc = dumps([
+        1, -2.5e3, 'a "string"', u'\u03ba\u03b1\u03bc\u03ac\u03ba\u03b9',
+        None, True, [], {}, dict(name='obj', bytes=1024, list=[1, [2]])])
+
+    def test_loads(self):
+        self.assertTrue(jsonparse.BACKEND in ('json', 'ujson'))
+        self.assertEqual(jsonparse.loads(self.doc), loads(self.doc))
+
+    def test_iter_array(self):
+        expected = loads(self.doc)
+        for size in (1, 2, 3, 7, len(self.doc)):
+            chunks = [self.doc[i:i + size] for i in range(
+                0, len(self.doc), size)]
+            self.assertEqual(list(jsonparse.iter_array(chunks)), expected)
+            wrapped = '{"a": [1, 2], "servers" : %s, "z": 1}' % self.doc
+            chunks = [wrapped[i:i + size] for i in range(
+                0, len(wrapped), size)]
+            self.assertEqual(
+                list(jsonparse.iter_array(chunks, 'servers')), expected)
+        for doc, key in (('[]', None), (' [ ] ', None), ('{}', 'k'), (
+                '{"a": 1}', 'k'), ('{"k": []}', 'k')):
+            self.assertEqual(list(jsonparse.iter_array([doc], key)), [])
+        for doc, key in (
+                ('', None), ('{}', None), ('[1, 2', None), ('[1 2]', None),
+                ('[1,]', None), ('[]', 'k'), ('{"k": 1}', 'k')):
+            self.assertRaises(
+                ValueError, list, jsonparse.iter_array([doc], key))
+
+
+class HTTPCache(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.tmpdir = mkdtemp()
+        self.cache = httpcache.HTTPCache(
+            '%s/sub/cache.db' % self.tmpdir, max_size=800, max_age=100)
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.tmpdir)
+
+    def test_key(self):
+        key = self.cache.key('get', u'http://example.com/\u03ba', 't0k3n')
+        self.assertEqual(
+            key, self.cache.key('GET', u'http://example.com/\u03ba', 't0k3n'))
+        for args in (
+                ('HEAD', u'http://example.com/\u03ba', 't0k3n'),
+                ('GET', 'http://example.com/', 't0k3n'),
+                ('GET', u'http://example.com/\u03ba', 'other')):
+            self.assertNotEqual(key, self.cache.key(*args))
+        self.assertFalse('t0k3n' in key)
+
+    def test_set_get(self):
+        headers = {'etag': 'e1', 'x-decoded': u'\u03ba'}
+        self.cache.set('k1', 200, 'OK', headers, 'body', 'e1', None)
+        entry = self.cache.get('k1')
+        self.assertEqual(entry, dict(
+            status=200, reason='OK', headers=headers, body='body',
+            etag='e1', last_modified=None))
+        self.assertTrue(isinstance(entry['headers']['etag'], str))
+        self.assertEqual(self.cache.get('k2'), None)
+        self.cache.hit('k1')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        #  Not cacheable: no validators, bad status, too large
+        for args in (
+                (200, 'OK', {}, 'body', None, None),
+                (404, 'Not Found', {}, 'body', 'e2', None),
+                (200, 'OK', {}, 'x' * 101, 'e2', None)):
+            self.cache.set('k2', *args)
+            self.assertEqual(self.cache.get('k2'), None)
+
+    def test_evict(self):
+        from time import time
+        now = [time()]
+        with patch('kamaki.clients.utils.httpcache.time', lambda: now[0]):
+            for i in range(8):
+                now[0] += 1
+                self.cache.set('k%s' % i, 200, 'OK', {}, 'x' * 100, 'e', None)
+            self.cache.hit('k0')
+            now[0] += 1
+            self.cache.set('k8', 200, 'OK', {}, 'x' * 100, 'e', None)
+            self.assertNotEqual(self.cache.get('k0'), None)
+            self.assertEqual(self.cache.get('k1'), None)
+            self.assertNotEqual(self.cache.get('k2'), None)
+
+            now[0] += 95
+            self.assertEqual(self.cache.get('k2'), None)
+            self.assertNotEqual(self.cache.get('k8'), None)
+            self.cache.evict()
+            self.assertEqual(sorted(self.cache._execute(
+                'SELECT key FROM responses')), [
+                    ('k%s' % i, ) for i in range(4, 9)])
+        self.cache.clear()
+        self.assertEqual(self.cache.get('k8'), None)
+
+    def test_errors(self):
+        self.cache._execute('DROP TABLE responses')
+        self.assertEqual(self.cache.get('k1'), None)
+        self.cache.set('k1', 200, 'OK', {}, 'body', 'e1', None)
+
+
+class FakeRequest(object):
+    scheme, netloc, path = 'http', '127.0.0.1:8080', '/a/c?format=json'
+
+    def __init__(self, method='GET', data=None, headers={}):
+        self.method, self.data, self.headers = method, data, dict(headers)
+
+
+class EventLoop(TestCase):
+
+    def _connection(self, method='GET'):
+        done = []
+        loop = type('FakeLoop', (), dict(_done=lambda self, *args: (
+            done.append(args[2:]))))()
+        conn = eventloop._Connection(loop, ('http', '127.0.0.1:8080'))
+        conn.exchange = eventloop._Exchange(FakeRequest(method), None)
+        return conn, done
+
+    def test_exchange(self):
+        request = FakeRequest('PUT', 'data', {'X-Auth-Token': 't0k3n'})
+        head, body = eventloop._Exchange(request, None).out
+        self.assertEqual(head.tobytes(), '\r\n'.join([
+            'PUT /a/c?format=json HTTP/1.1', 'Host: 127.0.0.1:8080',
+            'Accept-Encoding: identity', 'Content-Length: 4',
+            'X-Auth-Token: t0k3n', '', '']))
+        self.assertEqual(body.tobytes(), 'data')
+        request = FakeRequest('POST', headers={'Accept-Encoding': 'gzip'})
+        out = eventloop._Exchange(request, None).out
+        self.assertEqual(len(out), 1)
+        self.assertTrue('Content-Length: 0' in out[0].tobytes())
+        self.assertFalse('identity' in out[0].tobytes())
+
+    def test_content_length(self):
+        conn, done = self._connection()
+        response = (
+            'HTTP/1.1 100 Continue\r\n\r\n'
+            'HTTP/1.1 200 OK\r\nContent-Length: 10\r\nX-A: 1\r\n'
+            'x-a: 2\r\nX-B: long\r\n  value\r\n\r\n0123456789')
+        for i in range(0, len(response), 7):
+            conn._feed(response[i:i + 7])
+        [(r, keep_alive)] = done
+        self.assertTrue(keep_alive)
+        self.assertEqual(
+            (r.status, r.reason, r.version), (200, 'OK', 'HTTP/1.1'))
+        self.assertEqual(r.getheaders(), [
+            ('content-length', '10'), ('x-a', '1, 2'),
+            ('x-b', 'long value')])
+        self.assertEqual(r.getheader('X-A'), '1, 2')
+        self.assertEqual(r.getheader('X-C', 'none'), 'none')
+        self.assertEqual((r.read(4), r.read()), ('0123', '456789'))
+        self.assertEqual(conn.exchange, None)
+
+    def test_chunked(self):
+        conn, done = self._connection()
+        response = (
+            'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+            '4\r\n0123\r\na; ext=1\r\n456789abcd\r\n0\r\nX-T: 1\r\n\r\n')
+        for c in response:
+            conn._feed(c)
+        [(r, keep_alive)] = done
+        self.assertEqual(r.read(), '0123456789abcd')
+
+        conn, done = self._connection()
+        self.assertRaises(
+            eventloop.TransportError, conn._feed,
+            'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nx\r\n')
+
+    def test_no_body(self):
+        for method, status in (('HEAD', 200), ('GET', 204), ('GET', 304)):
+            conn, done = self._connection(method)
+            conn._feed(
+                'HTTP/1.1 %s X\r\nContent-Length: 10\r\n\r\n' % status)
+            [(r, keep_alive)] = done
+            self.assertEqual((r.status, r.read()), (status, ''))
+
+    def test_close_delimited(self):
+        conn, done = self._connection()
+        conn._feed('HTTP/1.0 200 OK\r\nX-A: 1\r\n\r\n0123')
+        conn._feed('4567')
+        self.assertEqual(done, [])
+        conn.sock = type('EOF', (), dict(recv=lambda self, size: ''))()
+        conn._recv()
+        [(r, keep_alive)] = done
+        self.assertFalse(keep_alive)
+        self.assertEqual(r.read(), '01234567')
+
+        conn, done = self._connection()
+        conn._feed('HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n0123')
+        conn.sock = type('EOF', (), dict(recv=lambda self, size: ''))()
+        self.assertRaises(eventloop.TransportError, conn._recv)
+
+    def test_bad_response(self):
+        for response in (
+                'HTTP/1.1 OK\r\n\r\n', 'SSH-2.0\r\n\r\n',
+                'HTTP/1.1 200 OK\r\nContent-Length: ten\r\n\r\n'):
+            conn, done = self._connection()
+            self.assertRaises(eventloop.TransportError, conn._feed, response)
+
+    def test_loop(self):
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from SocketServer import ThreadingMixIn
+        from threading import Thread
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                self.send_response(201)
+                self.send_header('Content-Length', '%s' % len(body))
+                self.end_headers()
+                self.wfile.write(body)
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = Server(('127.0.0.1', 0), Handler)
+        refused = socket.socket()
+        refused.bind(('127.0.0.1', 0))
+        Thread(target=server.serve_forever).start()
+        loop = eventloop.EventLoop(max_connections=4)
+        try:
+            FakeRequest.netloc = '127.0.0.1:%s' % server.server_port
+            futures = [loop.submit(FakeRequest('POST', 'data%s' % i * 1000))
+                       for i in range(20)]
+            for i, future in enumerate(futures):
+                r = future.result(10)
+                self.assertEqual(r.status, 201)
+                self.assertEqual(r.read(), 'data%s' % i * 1000)
+            self.assertEqual(len(loop._idle[('http', FakeRequest.netloc)]), 4)
+
+            FakeRequest.netloc = '127.0.0.1:%s' % refused.getsockname()[1]
+            refused.close()
+            future = loop.submit(FakeRequest('POST', 'data'))
+            self.assertRaises(eventloop.TransportError, future.result, 10)
+        finally:
+            FakeRequest.netloc = '127.0.0.1:8080'
+            server.shutdown()
+            server.server_close()
+            loop.close()
+        self.assertRaises(AssertionError, loop.submit, FakeRequest())
+
+
+class BufferPool(TestCase):
+
+    def test_get_put(self):
+        pool = buffers.BufferPool(4, max_idle=8)
+        self.assertEqual(pool.max_free, 2)
+        bufs = [pool.get() for i in range(3)]
+        self.assertEqual([len(b) for b in bufs], [4, 4, 4])
+        self.assertEqual(len(set([id(b) for b in bufs])), 3)
+        for b in bufs:
+            pool.put(b)
+        self.assertEqual(pool.idle(), 2)
+        self.assertTrue(pool.get() is bufs[1])
+        self.assertTrue(pool.get() is bufs[0])
+        self.assertEqual(pool.idle(), 0)
+        self.assertRaises(ValueError, pool.put, bytearray(5))
+
+    def test_get_pool(self):
+        pool = buffers.get_pool(16)
+        self.assertEqual(pool.size, 16)
+        self.assertTrue(buffers.get_pool(16) is pool)
+        self.assertFalse(buffers.get_pool(32) is pool)
+
+
 if __name__ == '__main__':
     from sys import argv
     from kamaki.clients.test import runTestCase
-    runTestCase(Utils, 'clients.utils methods', argv[1:])
+    not_found = True
+    if not argv[1:] or argv[1] == 'Utils':
+        not_found = False
+        runTestCase(Utils, 'clients.utils methods', argv[2:])
+    if not argv[1:] or argv[1] == 'Future':
+        not_found = False
+        runTestCase(Future, 'Future', argv[2:])
+    if not argv[1:] or argv[1] == 'WorkerPool':
+        not_found = False
+        runTestCase(WorkerPool, 'WorkerPool', argv[2:])
+    if not argv[1:] or argv[1] == 'ConcurrencyController':
+        not_found = False
+        runTestCase(ConcurrencyController, 'ConcurrencyController', argv[2:])
+    if not argv[1:] or argv[1] == 'Timing':
+        not_found = False
+        runTestCase(Timing, 'Timing', argv[2:])
+    if not argv[1:] or argv[1] == 'SSLContext':
+        not_found = False
+        runTestCase(SSLContext, 'SSLContext', argv[2:])
+    if not argv[1:] or argv[1] == 'JSONParse':
+        not_found = False
+        runTestCase(JSONParse, 'JSONParse', argv[2:])
+    if not argv[1:] or argv[1] == 'HTTPCache':
+        not_found = False
+        runTestCase(HTTPCache, 'HTTPCache', argv[2:])
+    if not argv[1:] or argv[1] == 'EventLoop':
+        not_found = False
+        runTestCase(EventLoop, 'EventLoop', argv[2:])
+    if not argv[1:] or argv[1] == 'BufferPool':
+        not_found = False
+        runTestCase(BufferPool, 'BufferPool', argv[2:])
+    if not_found:
+        print('TestCase %s not found' % argv[1])
@@ -0,0 +1,177 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+from collections import deque
+from math import ceil
+from threading import Lock
+from logging import getLogger
+
+log = getLogger(__name__)
+
+
+class RequestTiming(object):
+    """The timing breakdown of an HTTP request, in seconds
+
+    pool_wait: waiting for a pooled connection
+    dns, connect, tls: opening a new connection, 0.0 for reused connections
+    send: sending the request headers and body
+    ttfb: from the end of the request to the response headers
+    transfer: reading the response body
+    total: from the first attempt to the end of the response body
+    """
+
+    FIELDS = (
+        'pool_wait', 'dns', 'connect', 'tls', 'send', 'ttfb', 'transfer',
+        'total')
+
+    def __init__(self, method, endpoint, path, **kwargs):
+        self.method, self.endpoint, self.path = method, endpoint, path
+        self.status = kwargs.pop('status', None)
+        self.bytes_out = kwargs.pop('bytes_out', 0)
+        self.bytes_in = kwargs.pop('bytes_in', 0)
+        self.retries = kwargs.pop('retries', 0)
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.pop(field, 0.0))
+        assert not kwargs, 'Unknown timing fields %s' % kwargs.keys()
+
+    def as_dict(self):
+        d = dict(
+            method=self.method, endpoint=self.endpoint, path=self.path,
+            status=self.status, bytes_out=self.bytes_out,
+            bytes_in=self.bytes_in, retries=self.retries)
+        for field in self.FIELDS:
+            d[field] = getattr(self, field)
+        return d
+
+    def __str__(self):
+        return '%s %s%s %s out=%s in=%s retries=%s %s' % (
+            self.method, self.endpoint, self.path, self.status,
+            self.bytes_out, self.bytes_in, self.retries, ' '.join([
+                '%s=%.4f' % (f, getattr(self, f)) for f in self.FIELDS]))
+
+
+_hooks, _hooks_lock = [], Lock()
+
+
+def add_hook(hook):
+    """Call hook(RequestTiming) after each HTTP request of the process"""
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks.append(hook)
+
+
+def remove_hook(hook):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def emit(record):
+    """Pass a RequestTiming record to the hooks. Hook errors are logged"""
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            log.debug('Timing hook %s failed: %s' % (hook, e))
+
+
+def log_hook(record):
+    """A hook that logs each record"""
+    log.debug('%s' % record)
+
+
+def percentile(values, point):
+    """:returns: the nearest-rank percentile of a sorted list of values"""
+    if not values:
+        return None
+    return values[max(0, int(ceil(point * len(values) / 100.0)) - 1)]
+
+
+class TimingAggregator(object):
+    """A hook that keeps the latest timing records per endpoint and method
+    and reports percentiles"""
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.samples, self._lock = dict(), Lock()
+
+    def __call__(self, record):
+        key = (record.endpoint, record.method)
+        with self._lock:
+            try:
+                self.samples[key].append(record)
+            except KeyError:
+                self.samples[key] = deque([record], self.max_samples)
+
+    def percentiles(
+            self, endpoint, method, field='total', points=(50, 90, 99)):
+        """:returns: (dict) {point: value of field} for a method on endpoint
+        """
+        with self._lock:
+            records = list(self.samples.get((endpoint, method), []))
+        values = sorted([getattr(r, field) for r in records])
+        return dict([(p, percentile(values, p)) for p in points])
+
+    def report(self, fields=RequestTiming.FIELDS, points=(50, 90, 99)):
+        """:returns: (dict) {(endpoint, method): dict(
+            count=N, <field>=percentiles, bytes_out=B, bytes_in=B)}
+        """
+        with self._lock:
+            keys = self.samples.keys()
+        report = dict()
+        for endpoint, method in keys:
+            records = list(self.samples[(endpoint, method)])
+            entry = dict(
+                count=len(records),
+                bytes_out=sum([r.bytes_out for r in records]),
+                bytes_in=sum([r.bytes_in for r in records]))
+            for field in fields:
+                values = sorted([getattr(r, field) for r in records])
+                entry[field] = dict([
+                    (p, percentile(values, p)) for p in points])
+            report[(endpoint, method)] = entry
+        return report
+
+    def summary(self, points=(50, 90, 99)):
+        """:returns: (list of str) a line per endpoint, method and field"""
+        lines = []
+        for (endpoint, method), entry in sorted(self.report(
+                points=points).items()):
+            lines.append('%s %s: %s requests, out=%s in=%s' % (
+                method, endpoint, entry['count'],
+                entry['bytes_out'], entry['bytes_in']))
+            for field in RequestTiming.FIELDS:
+                lines.append('  %s %s' % (field, ' '.join([
+                    'p%s=%.4f' % (p, entry[field][p]) for p in points])))
+        return lines
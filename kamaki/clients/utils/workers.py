@@ -0,0 +1,409 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+from threading import Thread, Lock, Condition, Event
+from Queue import Queue
+from time import time
+from logging import getLogger
+import atexit
+
+log = getLogger(__name__)
+
+#  Waiting without a timeout cannot be interrupted (e.g., by Ctrl-C)
+_FOREVER = 365 * 24 * 3600.0
+
+
+class CancelledError(Exception):
+    """The task was cancelled before it started"""
+
+
+class Future(object):
+    """The result of a method call, scheduled to run on a WorkerPool"""
+
+    def __init__(self, method, *args, **kwargs):
+        self.method, self.args, self.kwargs = method, args, kwargs
+        self.index = None
+        self._value, self._exception = None, None
+        self._running, self._cancelled = False, False
+        self._callbacks = []
+        self._lock = Lock()
+        self._done = Event()
+
+    def cancel(self):
+        """Cancel the call, if it has not started yet
+
+        :returns: (bool) True if cancelled
+        """
+        with self._lock:
+            if self._running or self._done.is_set():
+                return self._cancelled
+            self._cancelled = True
+        self._finish()
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def running(self):
+        return self._running and not self._done.is_set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the call to finish
+
+        :returns: the returned value of the call
+
+        :raises: the exception raised by the call, CancelledError if the call
+            was cancelled
+        """
+        self._wait(timeout)
+        if self._cancelled:
+            raise CancelledError('Task %s was cancelled' % self)
+        if self._exception:
+            raise self._exception
+        return self._value
+
+    def exception(self, timeout=None):
+        """Wait for the call to finish
+
+        :returns: (Exception) raised by the call, or None
+        """
+        self._wait(timeout)
+        if self._cancelled:
+            raise CancelledError('Task %s was cancelled' % self)
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """callback(future) is called when the future is done or cancelled"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _wait(self, timeout=None):
+        if not self._done.wait(_FOREVER if timeout is None else timeout):
+            raise RuntimeError('Task %s timed out' % self)
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                log.debug('Callback %s of %s failed: %s' % (callback, self, e))
+
+    def _set_running(self):
+        """Mark the call as started elsewhere, e.g., on an event loop
+
+        :returns: (bool) False if the call is cancelled
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._running = True
+            return True
+
+    def _set_result(self, value=None, exception=None):
+        """Finish with a result computed elsewhere, e.g., on an event loop"""
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._value, self._exception = value, exception
+        self._finish()
+
+    def _run(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._running = True
+        try:
+            self._value = self.method(*self.args, **self.kwargs)
+        except Exception as e:
+            log.debug('Task %s got exception %s\n<%s %s' % (
+                self, type(e), getattr(e, 'status', ''), e))
+            self._exception = e
+        finally:
+            self._finish()
+
+
+class WorkerPool(object):
+    """A pool of long-lived worker threads, running tasks in FIFO order
+
+    Workers are started on demand, when a task is submitted and all workers
+    are busy. If size is set, no more than size workers are started and the
+    tasks wait in queue. Otherwise, the number of workers is bounded by the
+    number of tasks submitted in parallel (see run)
+    """
+
+    def __init__(self, size=None):
+        assert size is None or size > 0, 'Pool size must be None or +int'
+        self.size = size
+        self._tasks = Queue()
+        self._workers = []
+        self._busy = 0
+        self._lock = Condition(Lock())
+        self._closed = False
+
+    @property
+    def busy(self):
+        """:returns: (int) number of tasks submitted and not finished yet"""
+        return self._busy
+
+    @property
+    def workers(self):
+        """:returns: (int) number of worker threads"""
+        return len(self._workers)
+
+    def _work(self):
+        while True:
+            future = self._tasks.get()
+            if future is None:
+                break
+            try:
+                future._run()
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._lock.notify_all()
+
+    def submit(self, method, *args, **kwargs):
+        """Schedule method(*args, **kwargs) to run on a worker
+
+        :returns: (Future)
+        """
+        future = Future(method, *args, **kwargs)
+        with self._lock:
+            assert not self._closed, 'Pool %s is shut down' % self
+            self._busy += 1
+            if self._busy > len(self._workers) and (
+                    self.size is None or len(self._workers) < self.size):
+                worker = Thread(target=self._work)
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+        self._tasks.put(future)
+        return future
+
+    def run(self, method, kwarg_iter, limit=1):
+        """Run method(**kwargs) for each kwargs in kwarg_iter, while at most
+        limit calls are in flight. kwarg_iter is consumed lazily, so that
+        each argument set is produced only when there is room for it.
+        If the iteration is interrupted (e.g., by an exception or Ctrl-C),
+        the calls that have not started yet are cancelled.
+
+        :param method: the method to call
+
+        :param kwarg_iter: (iterable of dicts) keyword arguments for each call
+
+        :param limit: (int or callable) max number of calls in flight, if
+            callable, it is called before each submission
+
+        :returns: (generator of Future) futures in completion order, where
+            future.index is the position of its kwargs in kwarg_iter
+        """
+        completed, flying = Queue(), set()
+        kwarg_iter, index = iter(kwarg_iter), 0
+        try:
+            while True:
+                while kwarg_iter and len(flying) < max(1, int(
+                        limit() if callable(limit) else limit)):
+                    try:
+                        kwargs = next(kwarg_iter)
+                    except StopIteration:
+                        kwarg_iter = None
+                        break
+                    future = self.submit(method, **kwargs)
+                    future.index, index = index, index + 1
+                    flying.add(future)
+                    future.add_done_callback(completed.put)
+                if not flying:
+                    break
+                future = completed.get(True, _FOREVER)
+                flying.discard(future)
+                yield future
+        finally:
+            for future in flying:
+                future.cancel()
+
+    def join(self, timeout=None):
+        """Wait for all submitted tasks to finish
+
+        :returns: (bool) True if there are no unfinished tasks
+        """
+        end = time() + (_FOREVER if timeout is None else timeout)
+        with self._lock:
+            while self._busy and time() < end:
+                self._lock.wait(end - time())
+            return not self._busy
+
+    def shutdown(self, wait=False, timeout=None):
+        """Stop the workers when they are done with the queued tasks
+
+        :param wait: (bool) wait for the workers to stop
+
+        :param timeout: (float) max seconds to wait for each worker
+        """
+        with self._lock:
+            self._closed, workers = True, list(self._workers)
+        for worker in workers:
+            self._tasks.put(None)
+        if wait:
+            for worker in workers:
+                worker.join(_FOREVER if timeout is None else timeout)
+
+
+class SerialQueue(object):
+    """Run calls one at a time and in order, on a worker of the shared pool,
+    e.g., the writes of downloaded blocks to a file. At most size calls are
+    pending (queued or running), so that put waits while the calls fall
+    behind, pausing the producer (backpressure). If a call fails, the next
+    ones are dropped and the error is raised by put
+    """
+
+    def __init__(self, size, pool=None):
+        """
+        :param size: (int) max calls pending
+
+        :param pool: (WorkerPool) default is the shared pool
+        """
+        assert size > 0, 'Queue size must be a +int'
+        self.size, self.pending, self.error = size, 0, None
+        self._calls, self._room = Queue(), Condition(Lock())
+        self._future = (pool or get_pool()).submit(self._work)
+
+    def _work(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                break
+            method, args, kwargs = call
+            try:
+                if self.error is None:
+                    method(*args, **kwargs)
+            except Exception as e:
+                log.debug('Serial call %s failed: %s' % (method, e))
+                self.error = e
+            finally:
+                with self._room:
+                    self.pending -= 1
+                    self._room.notify()
+
+    def put(self, method, *args, **kwargs):
+        """Queue method(*args, **kwargs), wait while size calls are pending
+
+        :raises: the error of a failed call, if any
+        """
+        if self.error:
+            raise self.error
+        with self._room:
+            while self.pending >= self.size:
+                self._room.wait(_FOREVER)
+            self.pending += 1
+        self._calls.put((method, args, kwargs))
+
+    def close(self):
+        """Wait for the pending calls to finish. Check self.error after"""
+        self._calls.put(None)
+        self._future.result()
+
+
+class Prefetcher(object):
+    """Consume an iterable on a worker of the shared pool, ahead of the
+    caller, e.g., to hash local blocks while other work goes on. Items wait
+    in memory until iterated. An error of the iterable is raised by the
+    iteration of the prefetcher, after the items before it
+    """
+
+    def __init__(self, iterable, pool=None):
+        """
+        :param iterable: consumed on a worker, starting now
+
+        :param pool: (WorkerPool) default is the shared pool
+        """
+        self._items, self._stop = Queue(), Event()
+        self._future = (pool or get_pool()).submit(self._work, iter(iterable))
+
+    def _work(self, iterator):
+        try:
+            for item in iterator:
+                self._items.put((item, ))
+                if self._stop.is_set():
+                    break
+        finally:
+            getattr(iterator, 'close', lambda: None)()
+            self._items.put(None)
+
+    def __iter__(self):
+        item = self._items.get(True, _FOREVER)
+        while item is not None:
+            yield item[0]
+            item = self._items.get(True, _FOREVER)
+        self._future.result()
+
+    def close(self):
+        """Stop consuming the iterable and wait for the worker"""
+        self._stop.set()
+        self._future.exception()
+
+
+def as_completed(futures):
+    """:returns: (generator of Future) futures in completion order"""
+    completed, futures = Queue(), set(futures)
+    for future in futures:
+        future.add_done_callback(completed.put)
+    for i in range(len(futures)):
+        yield completed.get(True, _FOREVER)
+
+
+_pool, _pool_lock = None, Lock()
+
+
+def get_pool():
+    """:returns: (WorkerPool) the pool shared by all clients of a process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+@atexit.register
+def _shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=True, timeout=1.0)